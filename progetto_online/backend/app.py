@@ -1,157 +1,287 @@
 # app.py
 import os
-from datetime import datetime
+import hmac
+import mimetypes
+import zipfile
+import unicodedata
+from datetime import datetime, date, MINYEAR, MAXYEAR
+from decimal import Decimal
+from urllib.parse import quote
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, session, g, send_from_directory, send_file
+from flask import Flask, request, jsonify, session, g, send_from_directory, send_file, stream_with_context
 from flask import current_app
 from flask_cors import CORS
-import bcrypt
 from werkzeug.utils import secure_filename
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from werkzeug.exceptions import RequestEntityTooLarge
+import click
 from flask_mail import Mail, Message
 import psycopg2
 import psycopg2.extras
+from assets import build_assets, AssetManifest, BUILD_STATIC_DIR, BUILD_TEMPLATES_DIR
+from db_pool import get_pool, set_connection_factory, PoolTimeout
+from hashing import get_hasher, HashingBusy, UNUSABLE_PASSWORD, usable_hash
+from migrations import migrate, explain_check
+from rate_limit import rate_limiter_from_env
+from storage import store_upload, spool_upload, release_if_unreferenced, collect_garbage, UploadTooLarge
+from response_cache import ResponseCache
+from mailer import MailWorker, enqueue, queue_status
+from bulk_upload import BulkUploader, ZipTooLarge, parse_manifest, job_status
+from row_index import allocate_row_indexes, allocate_row_index_blocks, lock_row_counters, reset_row_counter
+from partitions import ensure_partitions, list_partitions, detach_before, add_months
+from metrics import metrics_from_env
+from course_months import materialized_months, mark_materialized, materialize_months, enroll, PENDING_ROWS_SQL
+from export import csv_chunks, xlsx_chunks, EXPORT_CHUNK_ROWS
+from member_import import import_members, ImportFormatError
 
 # --- Config base ---
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 FRONTEND_DIR = os.path.join(BASE_DIR, "..", "frontend", "templates")
-UPLOAD_FOLDER = os.path.join(BASE_DIR, "..", "db", "schede")
+UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER") or os.path.join(BASE_DIR, "..", "db", "schede")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 load_dotenv(os.path.join(BASE_DIR, "key.env"))
 
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 20 * 1024 * 1024))
+UPLOAD_ZIP_MAX_BYTES = int(os.environ.get("UPLOAD_ZIP_MAX_BYTES", 500 * 1024 * 1024))
+
 app = Flask(__name__, static_folder=None)
 app.secret_key = os.environ.get("SECRET_KEY") or "dev-secret"
 CORS(app, supports_credentials=True)
+# limite sull'intera richiesta (multipart compreso), controllato prima di leggere il corpo
+app.config['MAX_CONTENT_LENGTH'] = max(UPLOAD_MAX_BYTES, UPLOAD_ZIP_MAX_BYTES) + 1024 * 1024
 
 # Mail config
 app.config['MAIL_SERVER'] = os.environ.get("MAIL_SERVER", "smtp.gmail.com")
 app.config['MAIL_PORT'] = int(os.environ.get("MAIL_PORT", 587))
-app.config['MAIL_USE_TLS'] = True
+app.config['MAIL_USE_TLS'] = os.environ.get("MAIL_USE_TLS", "1") != "0"
 app.config['MAIL_USERNAME'] = os.environ.get("MAIL_USERNAME")
 app.config['MAIL_PASSWORD'] = os.environ.get("MAIL_PASSWORD")
 app.config['MAIL_DEFAULT_SENDER'] = (os.environ.get("MAIL_FROM_NAME", "Gym"), app.config['MAIL_USERNAME'])
 mail = Mail(app)
 
+# Coda mail: MAIL_WORKER=thread avvia un worker in ogni processo dell'app (invia
+# uno alla volta, sotto advisory lock: vedi mailer.py),
+# MAIL_WORKER=off lascia l'invio al comando separato `flask mail-worker`
+MAIL_WORKER = os.environ.get("MAIL_WORKER", "thread")
+
+# Mesi dei corsi: COURSE_MONTHS=lazy (default) crea le righe di un mese alla
+# prima lettura/scrittura, COURSE_MONTHS=eager le crea subito per tutto
+# l'intervallo all'iscrizione (vedi course_months.py)
+LAZY_MONTHS = os.environ.get("COURSE_MONTHS", "lazy") != "eager"
+
 # Admin credentials
 ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "adminpass")
 
+# --- metriche ---
+# METRICS=0 disattiva la strumentazione; /metrics accetta la sessione admin
+# oppure "Authorization: Bearer $METRICS_TOKEN" (per lo scraper Prometheus)
+METRICS_ENABLED = os.environ.get("METRICS", "1") != "0"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+metrics = metrics_from_env()
+if METRICS_ENABLED:
+    metrics.init_app(app)
+    set_connection_factory(metrics.connection_factory())
+
 # --- DB helpers ---
 def get_db():
     if 'db' not in g:
-        g.db = psycopg2.connect(
-            host=os.environ.get("DB_HOST"),
-            user=os.environ.get("DB_USER"),
-            password=os.environ.get("DB_PASSWORD"),
-            dbname=os.environ.get("DB_NAME"),
-            port=os.environ.get("DB_PORT"),
-        )
+        g.db = get_pool().getconn()
     return g.db
 
 @app.teardown_appcontext
 def close_db(exc):
     db = g.pop('db', None)
     if db:
-        db.close()
+        # restituisce la connessione al pool (rollback se la transazione è rimasta aperta)
+        get_pool().putconn(db)
+
+@app.errorhandler(HashingBusy)
+def hashing_busy(e):
+    resp = jsonify({"status":"error","message":"Server occupato, riprova tra poco"})
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({"status":"error","message":"File troppo grande"}), 413
+
+@app.errorhandler(PoolTimeout)
+def pool_timeout(e):
+    return jsonify({"status":"error","message":"Server occupato, riprova tra poco"}), 503
+
+# cache delle letture per (corso, mese), invalidata dalle rotte di scrittura
+response_cache = ResponseCache(max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", 512)),
+                               generation_dir=os.environ.get("RESPONSE_CACHE_DIR"))
+
+mail_worker = MailWorker(
+    app, mail, get_pool,
+    batch_size=int(os.environ.get("MAIL_BATCH_SIZE", 50)),
+    rate_per_minute=int(os.environ.get("MAIL_RATE_PER_MINUTE", 60)),
+    max_attempts=int(os.environ.get("MAIL_MAX_ATTEMPTS", 5)),
+    backoff_seconds=int(os.environ.get("MAIL_BACKOFF_SECONDS", 30)),
+)
+
+@app.before_request
+def start_mail_worker():
+    if MAIL_WORKER == "thread":
+        mail_worker.start()
+
+@app.cli.command("mail-worker")
+def mail_worker_command():
+    """Invia le mail in coda (processo dedicato, da usare con MAIL_WORKER=off)."""
+    mail_worker.run_forever()
 
 def init_db():
+    # crea / aggiorna lo schema applicando le migrazioni mancanti (vedi migrations.py)
+    applied = migrate(get_db())
+    print(f"init_db: schema aggiornato ({len(applied)} migrazioni applicate)")
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Applica le migrazioni di schema mancanti."""
+    init_db()
+
+@app.cli.command("check-indexes")
+def check_indexes_command():
+    """Verifica con EXPLAIN che le query principali usino un indice."""
+    failed = 0
+    for desc, ok, nodes in explain_check(get_db()):
+        print(f"{'OK  ' if ok else 'NO  '} {desc}: " + ", ".join(f"{t} {r}" for t, r in nodes))
+        failed += not ok
+    if failed:
+        raise SystemExit(1)
+
+@app.cli.command("partitions")
+@click.option("--ahead", default=12, help="Mesi futuri per cui creare le partizioni di corsi_data")
+@click.option("--detach-before", "detach_before_mese", default=None, help="Stacca le partizioni precedenti a questo mese (es. Settembre-2025)")
+def partitions_command(ahead, detach_before_mese):
+    """Crea le partizioni mensili di corsi_data e stacca quelle delle stagioni archiviate."""
     conn = get_db()
     cur = conn.cursor()
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS utenti (
-        id SERIAL PRIMARY KEY,
-        nome_cognome VARCHAR(255),
-        username VARCHAR(255),
-        email VARCHAR(255) UNIQUE NOT NULL,
-        password_hash VARCHAR(255) NOT NULL,
-        phone VARCHAR(50),
-        pdf_path TEXT,
-        data_creazione TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS login_attempts (
-        id SERIAL PRIMARY KEY,
-        ip VARCHAR(50) NOT NULL,
-        tentativi_falliti INT DEFAULT 0,
-        last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS admin_attempts (
-        id SERIAL PRIMARY KEY,
-        ip VARCHAR(50) NOT NULL,
-        tentativi_falliti INT DEFAULT 0,
-        last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS corsi_data (
-        id SERIAL PRIMARY KEY,
-        corso VARCHAR(100) NOT NULL,
-        row_index INT NOT NULL,
-        mese VARCHAR(20) NOT NULL DEFAULT 'Gennaio-2025',
-        nome VARCHAR(100),
-        cognome VARCHAR(100),
-        email VARCHAR(255),
-        cell VARCHAR(50),
-        tessera VARCHAR(50),
-        datacert VARCHAR(50),
-        pagato SMALLINT DEFAULT 0,
-        importo VARCHAR(50),
-        UNIQUE (corso, row_index, mese)
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS course_totals (
-        corso VARCHAR(100) NOT NULL,
-        mese VARCHAR(20) NOT NULL,
-        total_cassa DOUBLE PRECISION DEFAULT 0,
-        total_istruttore DOUBLE PRECISION DEFAULT 0,
-        PRIMARY KEY (corso, mese)
-    );
-    """)
-
+    oggi = date.today().replace(day=1)
+    created = ensure_partitions(cur, oggi, add_months(oggi, ahead))
+    detached = detach_before(cur, mese_date(detach_before_mese)) if detach_before_mese else []
     conn.commit()
-    print("init_db: tutte le tabelle create / verificate")
-
-# --- utility email ---
-#def send_email_async(to, subject, body):
-#    """Invia un'email in modo asincrono mantenendo il contesto Flask corretto."""
-#    app = current_app._get_current_object()
-#    def send():
-#        with app.app_context():
-#            try:
-#                msg = Message(subject, recipients=[to], body=body)
-#                mail.send(msg)
-#                print(f"✅ Email inviata a {to}")
-#            except Exception as e:
-#                print(f"❌ Errore invio email asincrona: {e}")
-#    thread = threading.Thread(target=send)
-#    thread.start()
+    for name, bound, rows in list_partitions(cur):
+        print(f"{name}: {bound} (~{rows} righe)")
+    print(f"partitions: {len(created)} create, {len(detached)} staccate {' '.join(detached)}")
+
+@app.cli.command("import-members")
+@click.argument("corso")
+@click.argument("mese")
+@click.argument("csv_file", type=click.File("rb"))
+@click.option("--dry-run", is_flag=True, help="Valida il file senza importare")
+def import_members_command(corso, mese, csv_file, dry_run):
+    """Importa gli iscritti di un corso e di un mese da un CSV (nome, cognome, email, cell, ...)."""
+    if not valid_mese(mese):
+        raise click.BadParameter("Mese non valido", param_hint="MESE")
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        summary = import_members(cur, corso, mese, mese_date(mese), csv_file, dry_run)
+    except ImportFormatError as e:
+        raise click.ClickException(str(e))
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+        response_cache.invalidate()
+    for err in summary["errors"]:
+        print(f"riga {err['line']} ({err['email']}): {err['message']}")
+    print(f"import-members: {summary['rows']} righe, {summary['imported']} importate, "
+          f"{summary['users_created']} utenti creati, {len(summary['errors'])} errori")
+
+# --- asset statici ---
+# Se esiste frontend/build (python assets.py / flask build-assets) si servono
+# gli html riscritti e i file con hash, in cache per un anno; altrimenti i
+# file originali con revalidazione via ETag. Il manifest è riletto quando
+# cambia, quindi un nuovo build non richiede il riavvio.
+STATIC_DIR = os.path.join(BASE_DIR, "..", "frontend", "static")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+asset_manifest = AssetManifest()
+
+def send_precompressed(directory, filename, cache_control):
+    # usa la variante .br/.gz generata in build se il client la accetta
+    for encoding, ext in (("br", ".br"), ("gzip", ".gz")):
+        if encoding in request.accept_encodings and os.path.isfile(os.path.join(directory, filename + ext)):
+            resp = send_from_directory(directory, filename + ext,
+                                       mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+            resp.headers["Content-Encoding"] = encoding
+            break
+    else:
+        resp = send_from_directory(directory, filename)
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = cache_control
+    return resp
+
+def send_page(name):
+    directory = BUILD_TEMPLATES_DIR if asset_manifest.manifest else FRONTEND_DIR
+    # no-cache: il browser rivalida sempre, ETag/If-None-Match -> 304
+    return send_precompressed(directory, name, "no-cache")
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Genera gli asset con hash e le varianti compresse in frontend/build."""
+    # i worker in esecuzione vedono il nuovo manifest.json alla prossima richiesta
+    print(f"build-assets: {len(build_assets())} file")
 
 # Per HTML
 @app.route("/")
 def index():
-    return send_from_directory(FRONTEND_DIR, "index.html")
+    return send_page("index.html")
 
 @app.route("/admin")
 def admin():
-    return send_from_directory(FRONTEND_DIR, "admin.html")
+    return send_page("admin.html")
 
 # Per JS/CSS/IMG
 @app.route("/static/<path:filename>")
 def static_files(filename):
-    return send_from_directory(os.path.join(BASE_DIR, "..", "frontend", "static"), filename)
+    if asset_manifest.is_hashed(filename):
+        return send_precompressed(BUILD_STATIC_DIR, filename, IMMUTABLE_CACHE)
+    return send_precompressed(STATIC_DIR, filename, "no-cache")
 
 # ------------------------
 # --- ROTTE UTENTE ---
 # ------------------------
+def insert_bodybuilding_months(cur, nome, cognome, email, phone, mesi=None):
+    # Iscrive la persona per l'intervallo di mesi; le righe vengono scritte
+    # subito solo nei mesi già materializzati in cui non è presente:
+    # un SELECT per i mesi mancanti, un blocco di row_index per mese, un INSERT
+    if mesi is None:
+        mesi = generate_months(years_ahead=4)
+    date_mesi = [mese_date(m) for m in mesi]
+    enroll(cur, "BodyBuilding", [(nome, cognome, email, phone, "", "")], date_mesi[0], date_mesi[-1])
+    if not LAZY_MONTHS:
+        materialize_months(cur, "BodyBuilding", date_mesi)
+    attivi = materialized_months(cur, "BodyBuilding", date_mesi)
+    mesi = [m for m, d in zip(mesi, date_mesi) if d in attivi]
+    if not mesi:
+        return 0
+    cur.execute("""
+        SELECT m.mese
+        FROM unnest(%(mesi)s::varchar[]) AS m(mese)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM corsi_data cd
+            WHERE cd.corso = %(corso)s AND cd.nome = %(nome)s AND cd.cognome = %(cognome)s
+              AND cd.cell = %(cell)s AND cd.mese_data = mese_to_date(m.mese)
+        )
+    """, {"corso": "BodyBuilding", "nome": nome, "cognome": cognome, "cell": phone, "mesi": list(mesi)})
+    mancanti = [r["mese"] for r in cur.fetchall()]
+    if not mancanti:
+        return 0
+
+    indici = allocate_row_index_blocks(cur, "BodyBuilding", {m: 1 for m in mancanti})
+    cur.execute("""
+        INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+        SELECT %(corso)s, m.idx, mese_to_date(m.mese), %(nome)s, %(cognome)s, %(email)s, %(cell)s, '', '', 0, ''
+        FROM unnest(%(mesi)s::varchar[], %(idx)s::int[]) AS m(mese, idx)
+    """, {"corso": "BodyBuilding", "nome": nome, "cognome": cognome, "email": email, "cell": phone,
+          "mesi": mancanti, "idx": [indici[m] for m in mancanti]})
+    return cur.rowcount
+
 @app.route("/register", methods=["POST"])
 def register():
     data = request.get_json() or {}
@@ -166,13 +296,14 @@ def register():
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-    # Controlla se l'email esiste già
+    # Controlla se l'email esiste già (anche gli utenti creati dall'admin senza
+    # password: per loro si passa da un invito, vedi /admin/users/<id>/invite)
     cur.execute("SELECT id FROM utenti WHERE email=%s", (email,))
     if cur.fetchone():
         return jsonify({"status":"error","message":"Email già esistente"}), 400
 
     # Hash della password
-    pw_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    pw_hash = get_hasher().hash(password)
     username = nome_cognome
     cur.execute(
         "INSERT INTO utenti (nome_cognome, username, email, password_hash, phone) VALUES (%s, %s, %s, %s, %s)",
@@ -185,79 +316,91 @@ def register():
     nome = parts[0]
     cognome = " ".join(parts[1:]) if len(parts) > 1 else ""
 
-    # Inserimento corsi_data mesi futuri (BodyBuilding)
-    month_names = ["Gennaio","Febbraio","Marzo","Aprile","Maggio","Giugno",
-                   "Luglio","Agosto","Settembre","Ottobre","Novembre","Dicembre"]
-    for year in range(2025, 2030):
-        for m_idx in range(12):
-            if year == 2025 and m_idx+1 < 10:  # inizia da Ottobre 2025
-                continue
-            mese = f"{month_names[m_idx]}-{year}"
-            
-            # Calcola il prossimo row_index disponibile
-            cur.execute("SELECT COALESCE(MAX(row_index), -1)+1 AS idx FROM corsi_data WHERE corso=%s AND mese=%s", 
-                        ("BodyBuilding", mese))
-            row_index = cur.fetchone()["idx"]
-            
-            # Inserisce solo se non esiste già
-            cur.execute("SELECT 1 FROM corsi_data WHERE corso=%s AND nome=%s AND cognome=%s AND cell=%s AND mese=%s",
-                        ("BodyBuilding", nome, cognome, phone, mese))
-            if not cur.fetchone():
-                cur.execute(
-                    "INSERT INTO corsi_data (corso,row_index,mese,nome,cognome,email,cell,tessera,datacert,pagato,importo) "
-                    "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,0,'')",
-                    ("BodyBuilding", row_index, mese, nome, cognome, email, phone, "", "")
-                )
+    # Iscrizione BodyBuilding da Ottobre-2025 a Dicembre-2029 (righe create mese per mese, vedi course_months.py)
+    insert_bodybuilding_months(cur, nome, cognome, email, phone)
     conn.commit()
+    # nuovo utente: cambia l'id associato per email in tutti i corsi
+    response_cache.invalidate()
     return jsonify({"status":"ok","message":"Registrazione completata"}), 201
 
-# ------------------------
-# --- LOGIN / LOGOUT ---
-# ------------------------
-MAX_ATTEMPTS = 3
-BLOCK_TIME_SECONDS = 60  # 1 minuto
+# --- INVITI PER GLI UTENTI CREATI DALL'ADMIN ---
+# Gli utenti creati dall'import o dall'admin hanno password_hash inutilizzabile.
+# L'admin manda un invito all'email dell'utente (coda mail); il link contiene
+# un token firmato con l'id e l'hash attuale, quindi vale una volta sola e
+# scade dopo CLAIM_TOKEN_MAX_AGE secondi.
+CLAIM_TOKEN_MAX_AGE = int(os.environ.get("CLAIM_TOKEN_MAX_AGE", 7 * 24 * 3600))
+claim_tokens = URLSafeTimedSerializer(app.secret_key, salt="claim-account")
+
+@app.route("/admin/users/<int:user_id>/invite", methods=["POST"])
+def admin_invite_user(user_id):
+    if not session.get("admin_logged_in"):
+        return jsonify({"status":"error","message":"Non autorizzato"}), 401
 
-def check_ip_block(table_name, ip):
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.execute("SELECT id, email, password_hash FROM utenti WHERE id=%s", (user_id,))
+    user = cur.fetchone()
+    if not user:
+        return jsonify({"status":"error","message":"Utente non trovato"}), 404
+    if usable_hash(user["password_hash"]) or not user["email"]:
+        return jsonify({"status":"error","message":"Account già attivo"}), 400
 
-    cur.execute(f"SELECT tentativi_falliti, last_attempt FROM {table_name} WHERE ip=%s", (ip,))
-    row = cur.fetchone()
+    token = claim_tokens.dumps({"id": user["id"], "hash": user["password_hash"]})
+    base_url = os.environ.get("PUBLIC_URL") or request.host_url.rstrip("/")
+    body = (
+        "Ciao,\n\n"
+        "per accedere all'area riservata di Gymnica Fitness Club imposta la tua password da questo link:\n"
+        f"{base_url}/?claim={token}\n\n"
+        f"Il link scade tra {CLAIM_TOKEN_MAX_AGE // 86400} giorni.\n\n"
+        "Saluti,\nGymnica Fitness Club"
+    )
+    enqueue(cur, [(user["email"], "Attiva il tuo account", body)])
+    conn.commit()
+    mail_worker.wake()
+    return jsonify({"status":"ok","message":"Invito messo in coda di invio."})
 
-    if row:
-        tentativi = row["tentativi_falliti"]
-        last = row["last_attempt"]
-
-        if tentativi >= MAX_ATTEMPTS and last:
-            cur.execute("SELECT EXTRACT(EPOCH FROM (NOW() - %s::timestamp)) AS elapsed", (last,))
-            elapsed = cur.fetchone()["elapsed"]
-            remaining = max(0, BLOCK_TIME_SECONDS - int(elapsed))
-            if remaining > 0:
-                return True, remaining
-            else:
-                cur.execute(f"UPDATE {table_name} SET tentativi_falliti=0, last_attempt=NULL WHERE ip=%s", (ip,))
-                conn.commit()
+@app.route("/claim-account", methods=["POST"])
+def claim_account():
+    data = request.get_json() or {}
+    token = data.get("token") or ""
+    password = (data.get("password") or "").strip()
+    if not token or not password:
+        return jsonify({"status":"error","message":"Compila tutti i campi"}), 400
 
-    return False, 0
+    try:
+        claim = claim_tokens.loads(token, max_age=CLAIM_TOKEN_MAX_AGE)
+    except BadSignature:
+        return jsonify({"status":"error","message":"Invito non valido o scaduto"}), 400
 
-def record_failed_attempt(table_name, ip):
+    pw_hash = get_hasher().hash(password)
     conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur = conn.cursor()
+    # l'hash nel token deve essere ancora quello attuale: un invito già usato non vale più
+    cur.execute("UPDATE utenti SET password_hash=%s WHERE id=%s AND password_hash=%s",
+                (pw_hash, claim["id"], claim["hash"]))
+    if cur.rowcount == 0:
+        conn.rollback()
+        return jsonify({"status":"error","message":"Invito non valido o scaduto"}), 400
+    conn.commit()
+    return jsonify({"status":"ok","message":"Password impostata, ora puoi accedere"})
 
-    cur.execute(f"SELECT tentativi_falliti FROM {table_name} WHERE ip=%s", (ip,))
-    row = cur.fetchone()
+# ------------------------
+# --- LOGIN / LOGOUT ---
+# ------------------------
+MAX_ATTEMPTS = 3
+BLOCK_TIME_SECONDS = 60  # 1 minuto
 
-    if row:
-        cur.execute(f"UPDATE {table_name} SET tentativi_falliti=tentativi_falliti+1, last_attempt=NOW() WHERE ip=%s", (ip,))
-    else:
-        cur.execute(f"INSERT INTO {table_name} (ip, tentativi_falliti, last_attempt) VALUES (%s, 1, NOW())", (ip,))
-    conn.commit()
+# backend scelto con RATE_LIMIT_BACKEND: "postgres" (default, condiviso tra i worker) o "memory"
+rate_limiter = rate_limiter_from_env(MAX_ATTEMPTS, BLOCK_TIME_SECONDS, get_db)
+
+def check_ip_block(table_name, ip):
+    return rate_limiter.check(table_name, ip)
+
+def record_failed_attempt(table_name, ip):
+    rate_limiter.record_failure(table_name, ip)
 
 def reset_attempts(table_name, ip):
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(f"UPDATE {table_name} SET tentativi_falliti=0, last_attempt=NULL WHERE ip=%s", (ip,))
-    conn.commit()
+    rate_limiter.reset(table_name, ip)
 
 @app.route("/login", methods=["POST"])
 def login():
@@ -277,8 +420,16 @@ def login():
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cur.execute("SELECT id, password_hash, nome_cognome FROM utenti WHERE email=%s", (email,))
     row = cur.fetchone()
-    if row and bcrypt.checkpw(password.encode('utf-8'), row["password_hash"].encode('utf-8')):
+    hasher = get_hasher()
+    if row and hasher.verify(password, row["password_hash"]):
         session['user_id'] = row["id"]
+        # hash con costo diverso da BCRYPT_ROUNDS: lo rigenera ora che abbiamo la password
+        if hasher.needs_rehash(row["password_hash"]):
+            try:
+                cur.execute("UPDATE utenti SET password_hash=%s WHERE id=%s", (hasher.hash(password), row["id"]))
+                conn.commit()
+            except HashingBusy:
+                pass
         reset_attempts("login_attempts", ip)
         return jsonify({"status":"ok","message":"Login riuscito","nome_cognome": row["nome_cognome"]})
     else:
@@ -334,15 +485,66 @@ def admin_logout():
     return jsonify({"status":"ok","message":"Logout admin effettuato"})
 
 # --- LISTA UTENTI ---
+# Paginazione per id (keyset): ?limit=100&after=<next_cursor>; ricerca ?q= su
+# nome, email e telefono (indici trigram); ?format=stream per l'export completo
+# in JSON a flusso da un cursore lato server.
+USERS_PAGE_SIZE = 100
+USERS_MAX_PAGE_SIZE = 1000
+USERS_STREAM_CHUNK = 500
+
+def users_filter(q):
+    if not q:
+        return "", []
+    pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    return (" AND (COALESCE(username,nome_cognome) ILIKE %s OR email ILIKE %s OR phone ILIKE %s)",
+            [pattern, pattern, pattern])
+
 @app.route("/admin/users", methods=["GET"])
 def admin_users():
     if not session.get("admin_logged_in"):
         return jsonify({"status":"error","message":"Non autorizzato"}), 401
+
+    where, params = users_filter((request.args.get("q") or "").strip())
+    select = "SELECT id, COALESCE(username,nome_cognome) AS username,email,phone,data_creazione FROM utenti WHERE TRUE"
+
+    if request.args.get("format") == "stream":
+        return stream_users(select + where + " ORDER BY id", params)
+
+    try:
+        limit = min(max(int(request.args.get("limit", USERS_PAGE_SIZE)), 1), USERS_MAX_PAGE_SIZE)
+        after = int(request.args.get("after", 0))
+    except ValueError:
+        return jsonify({"status":"error","message":"Parametri non validi"}), 400
+
     conn=get_db()
     cur=conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT id, COALESCE(username,nome_cognome) AS username,email,phone,data_creazione FROM utenti")
-    users=[row for row in cur.fetchall()]
-    return jsonify({"status":"ok","users":users})
+    cur.execute(select + where + " AND id > %s ORDER BY id LIMIT %s", params + [after, limit + 1])
+    users = cur.fetchall()
+    has_more = len(users) > limit
+    users = users[:limit]
+    next_cursor = users[-1]["id"] if has_more else None
+    return jsonify({"status":"ok","users":users,"next_cursor":next_cursor})
+
+def stream_users(sql, params):
+    conn = get_db()
+    # cursore con nome: le righe arrivano dal server a blocchi, memoria costante
+    cur = conn.cursor(name="admin_users_export", cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.itersize = USERS_STREAM_CHUNK
+    cur.execute(sql, params)
+
+    def generate():
+        try:
+            yield '{"status":"ok","users":['
+            first = True
+            for row in cur:
+                yield ("" if first else ",") + app.json.dumps(row)
+                first = False
+            yield "]}"
+        finally:
+            cur.close()
+            conn.rollback()
+
+    return app.response_class(stream_with_context(generate()), mimetype="application/json")
 
 # --- UPLOAD PDF ---
 @app.route("/admin/upload/<int:user_id>", methods=["POST"])
@@ -358,22 +560,37 @@ def admin_upload(user_id):
         return jsonify({"status":"error","message":"File senza nome"}), 400
 
     filename = secure_filename(file.filename)
-    safe_name = f"{user_id}_{filename}"
-    path = os.path.join(UPLOAD_FOLDER, safe_name)
+    ext = os.path.splitext(filename)[1].lower()
+
+    # prima l'utente (bloccato fino al commit): per un id inesistente non si salva nulla
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.execute("SELECT pdf_path, email, COALESCE(username,nome_cognome) AS username FROM utenti WHERE id=%s FOR UPDATE", (user_id,))
+    row = cur.fetchone()
+    if not row:
+        conn.rollback()
+        return jsonify({"status":"error","message":"Utente non trovato"}), 404
+
     try:
-        file.save(path)
+        stored_name, _size = store_upload(file.stream, UPLOAD_FOLDER, UPLOAD_MAX_BYTES, ext)
+    except UploadTooLarge:
+        conn.rollback()
+        return jsonify({"status":"error","message":"File troppo grande"}), 413
     except Exception as e:
+        conn.rollback()
         return jsonify({"status":"error","message":"Errore salvataggio file"}), 500
 
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("UPDATE utenti SET pdf_path=%s WHERE id=%s", (safe_name, user_id))
+    cur.execute("UPDATE utenti SET pdf_path=%s, pdf_name=%s WHERE id=%s", (stored_name, filename, user_id))
     conn.commit()
 
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT email, COALESCE(username,nome_cognome) AS username FROM utenti WHERE id=%s", (user_id,))
-    row = cur.fetchone()
-    if row and row["email"]:
+    # il file precedente si elimina se nessun altro utente lo usa (il resto lo fa gc-schede)
+    if row["pdf_path"] and row["pdf_path"] != stored_name:
+        try:
+            release_if_unreferenced(cur, UPLOAD_FOLDER, row["pdf_path"])
+        except OSError:
+            pass
+
+    if row["email"]:
         return jsonify({
             "status": "ok",
             "message": "PDF caricato correttamente",
@@ -382,8 +599,94 @@ def admin_upload(user_id):
             "subject": "Hai ricevuto un file dalla Gymnica Fitness Club",
             "body": f"Ciao {row['username']},\n\nHai ricevuto un file dalla Gymnica Fitness Club. Puoi scaricarlo dal tuo profilo."
         })
+    return jsonify({"status": "ok", "message": "PDF caricato correttamente"})
+
+# --- UPLOAD ZIP DI SCHEDE ---
+bulk_uploader = BulkUploader(get_pool, UPLOAD_FOLDER, UPLOAD_MAX_BYTES,
+                             job_workers=int(os.environ.get("UPLOAD_JOB_WORKERS", 1)),
+                             entry_workers=int(os.environ.get("UPLOAD_ENTRY_WORKERS", 4)),
+                             max_entries=int(os.environ.get("UPLOAD_ZIP_MAX_ENTRIES", 2000)),
+                             max_uncompressed_bytes=int(os.environ.get("UPLOAD_ZIP_MAX_UNCOMPRESSED_BYTES",
+                                                                       2 * 1024 ** 3)),
+                             stale_seconds=int(os.environ.get("UPLOAD_JOB_STALE_SECONDS", 900)))
+
+@app.route("/admin/upload-zip", methods=["POST"])
+def admin_upload_zip():
+    if not session.get("admin_logged_in"):
+        return jsonify({"status":"error","message":"Non autorizzato"}), 401
+
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({"status":"error","message":"Nessun file inviato"}), 400
+
+    # manifest opzionale: campo di testo o file (JSON o CSV); altrimenti vale il nome dei file
+    manifest_text = request.form.get("manifest", "")
+    if not manifest_text and 'manifest' in request.files:
+        manifest_text = request.files['manifest'].read().decode('utf-8-sig')
+    try:
+        manifest = parse_manifest(manifest_text)
+    except ValueError:
+        return jsonify({"status":"error","message":"Manifest non valido"}), 400
+
+    try:
+        zip_path = spool_upload(request.files['file'].stream, UPLOAD_FOLDER, UPLOAD_ZIP_MAX_BYTES)
+    except UploadTooLarge:
+        return jsonify({"status":"error","message":"File troppo grande"}), 413
+    except Exception as e:
+        return jsonify({"status":"error","message":"Errore salvataggio file"}), 500
+
+    # numero di voci e dimensione decompressa si controllano subito, dalla directory centrale
+    try:
+        with zipfile.ZipFile(zip_path) as zf:
+            bulk_uploader.check_zip(zf)
+    except zipfile.BadZipFile:
+        os.unlink(zip_path)
+        return jsonify({"status":"error","message":"Il file non è uno ZIP valido"}), 400
+    except ZipTooLarge as e:
+        os.unlink(zip_path)
+        return jsonify({"status":"error","message":str(e)}), 413
+
+    job_id = bulk_uploader.submit(zip_path, manifest)
+    return jsonify({"status":"ok","message":"Caricamento avviato","job_id":job_id}), 202
+
+@app.route("/admin/upload-jobs/<job_id>", methods=["GET"])
+def admin_upload_job(job_id):
+    if not session.get("admin_logged_in"):
+        return jsonify({"status":"error","message":"Non autorizzato"}), 401
+    bulk_uploader.fail_stale()
+    cur = get_db().cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    job = job_status(cur, job_id)
+    if not job:
+        return jsonify({"status":"error","message":"Job non trovato"}), 404
+    return jsonify({"status":"ok","job":job})
+
+@app.cli.command("gc-schede")
+@click.option("--min-age", default=3600, help="Età minima in secondi dei file da rimuovere")
+@click.option("--dry-run", is_flag=True, help="Mostra i file senza eliminarli")
+def gc_schede_command(min_age, dry_run):
+    """Elimina da db/schede i file non più referenziati da utenti.pdf_path."""
+    # gli ZIP dei job dati per persi non sono più protetti
+    bulk_uploader.fail_stale()
+    removed = collect_garbage(get_db().cursor(), UPLOAD_FOLDER, min_age=min_age, dry_run=dry_run)
+    for name in removed:
+        print(name)
+    print(f"gc-schede: {len(removed)} file {'da eliminare' if dry_run else 'eliminati'}")
 
 # --- SCARICA PDF ---
+# SCHEDA_OFFLOAD: "" (Flask invia il file), "x-accel" (nginx) o "x-sendfile" (apache/lighttpd).
+# Con nginx serve una location interna che punta a db/schede, es.:
+#   location /protected-schede/ { internal; alias /percorso/progetto_online/db/schede/; }
+SCHEDA_OFFLOAD = os.environ.get("SCHEDA_OFFLOAD", "").lower()
+SCHEDA_ACCEL_PREFIX = os.environ.get("SCHEDA_ACCEL_PREFIX", "/protected-schede").rstrip("/")
+
+def attachment_disposition(download_name):
+    # come send_file di Flask: nomi non ASCII anche in filename* (RFC 5987)
+    try:
+        download_name.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", download_name).encode("ascii", "ignore").decode("ascii")
+        return {"filename": simple, "filename*": f"UTF-8''{quote(download_name, safe='!#$&+^`|~')}"}
+    return {"filename": download_name}
+
 @app.route("/scheda", methods=["GET"])
 def get_scheda():
     user_id = session.get("user_id")
@@ -392,65 +695,280 @@ def get_scheda():
 
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT pdf_path FROM utenti WHERE id=%s", (user_id,))
+    cur.execute("SELECT pdf_path, pdf_name FROM utenti WHERE id=%s", (user_id,))
     row = cur.fetchone()
     if not row or not row["pdf_path"]:
         return jsonify({"status":"error","message":"Nessun file disponibile"}), 200
 
     pdf_filename = row["pdf_path"]
     pdf_path = os.path.join(UPLOAD_FOLDER, pdf_filename)
+    # nome mostrato all'utente: quello originale (i file sono salvati per hash)
+    download_name = row["pdf_name"] or pdf_filename
 
     if not os.path.isfile(pdf_path):
         return jsonify({"status":"error","message":"File non trovato sul server"}), 200
 
-    return send_file(pdf_path, as_attachment=True)
+    # dopo il controllo di autenticazione il file può essere consegnato dal proxy
+    if SCHEDA_OFFLOAD == "x-accel":
+        resp = app.response_class(mimetype=mimetypes.guess_type(pdf_filename)[0] or "application/octet-stream")
+        resp.headers["X-Accel-Redirect"] = f"{SCHEDA_ACCEL_PREFIX}/{quote(pdf_filename)}"
+        resp.headers.set("Content-Disposition", "attachment", **attachment_disposition(download_name))
+    elif SCHEDA_OFFLOAD == "x-sendfile":
+        resp = app.response_class(mimetype=mimetypes.guess_type(pdf_filename)[0] or "application/octet-stream")
+        resp.headers["X-Sendfile"] = os.path.abspath(pdf_path)
+        resp.headers.set("Content-Disposition", "attachment", **attachment_disposition(download_name))
+    else:
+        # ETag/Last-Modified, If-None-Match/If-Modified-Since -> 304 e Range -> 206
+        resp = send_file(pdf_path, as_attachment=True, download_name=download_name, conditional=True, etag=True)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
 
 # ------------------------
 # --- ROTTE ADMIN CORSI ---
 # ------------------------
+MESI = ["Gennaio","Febbraio","Marzo","Aprile","Maggio","Giugno",
+        "Luglio","Agosto","Settembre","Ottobre","Novembre","Dicembre"]
+
 def generate_months(start_month=10, start_year=2025, years_ahead=5):
-    months_names = ["Gennaio","Febbraio","Marzo","Aprile","Maggio","Giugno",
-                    "Luglio","Agosto","Settembre","Ottobre","Novembre","Dicembre"]
+    return months_between(f"{MESI[start_month-1]}-{start_year}", f"Dicembre-{start_year + years_ahead}")
+
+def parse_mese(mese):
+    # "Ottobre-2025" -> (2025, 10); ValueError se il formato non è valido
+    nome, _, anno = (mese or "").partition("-")
+    # anche l'anno deve stare nell'intervallo di date (mese_date)
+    if nome not in MESI or not anno.isdigit() or not MINYEAR <= int(anno) <= MAXYEAR:
+        raise ValueError(f"Mese non valido: {mese}")
+    return int(anno), MESI.index(nome) + 1
+
+def mese_date(mese):
+    # chiave di partizione di corsi_data: primo giorno del mese
+    anno, mese_num = parse_mese(mese)
+    return date(anno, mese_num, 1)
+
+def valid_mese(mese):
+    try:
+        parse_mese(mese)
+        return True
+    except ValueError:
+        return False
+
+def months_between(da, a):
+    (y1, m1), (y2, m2) = parse_mese(da), parse_mese(a)
     months = []
-    for y in range(start_year, start_year + years_ahead + 1):
-        for m in range(1, 13):
-            if y == start_year and m < start_month:
-                continue
-            months.append(f"{months_names[m-1]}-{y}")
+    y, m = y1, m1
+    while (y, m) <= (y2, m2):
+        months.append(f"{MESI[m-1]}-{y}")
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
     return months
 
+def months_from_args(args):
+    # ?mesi=Ottobre-2025,Novembre-2025 | ?anno=2026 | ?da=Ottobre-2025&a=Settembre-2026
+    if args.get("mesi"):
+        mesi = [m for m in args["mesi"].split(",") if m]
+        for m in mesi:
+            parse_mese(m)
+        return mesi
+    if args.get("anno"):
+        anno = int(args["anno"])
+        return months_between(f"Gennaio-{anno}", f"Dicembre-{anno}")
+    return months_between(args.get("da", "Ottobre-2025"), args.get("a", "Settembre-2026"))
+
+def course_row_json(r):
+    return {
+        "row_index": r["row_index"],
+        "id": r["user_id"] or "",
+        "nome": r["nome"] or "",
+        "cognome": r["cognome"] or "",
+        "email": r["email"] or "",
+        "cell": r["cell"] or "",
+        "tessera": r["tessera"] or "",
+        "dataCert": r["datacert"] or "",
+        "pagato": bool(r["pagato"]),
+        "importo": r["importo"] or "",
+        # id stabile della riga e versione per PATCH /admin/course-data/<corso>
+        "row_id": r.get("row_id"),
+        "version": r.get("version")
+    }
+
+def load_course_rows(corso, mese):
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    # primo accesso al mese: crea le righe dalle iscrizioni
+    if materialize_months(cur, corso, [mese_date(mese)]):
+        conn.commit()
+    cur.execute("""
+        SELECT cd.id AS row_id, cd.version, cd.row_index, u.id AS user_id,
+               cd.nome, cd.cognome, cd.email, cd.cell, cd.tessera, cd.datacert, cd.pagato, cd.importo
+        FROM corsi_data cd
+        LEFT JOIN utenti u ON cd.email = u.email
+        WHERE cd.corso = %s AND cd.mese_data = %s
+        ORDER BY cd.row_index
+    """, (corso, mese_date(mese)))
+    return [course_row_json(r) for r in cur.fetchall()]
+
+def cached_json(key, compute):
+    # risposta dalla cache se ancora valida; If-None-Match uguale -> 304 senza toccare il DB
+    cached = response_cache.get(key)
+    if cached is None:
+        generations = response_cache.generations(key)
+        payload = app.json.dumps(compute()).encode("utf-8")
+        etag = response_cache.put(key, payload, generations)
+    else:
+        etag, payload = cached
+    resp = app.response_class(payload, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp.make_conditional(request)
+
 @app.route("/admin/course-data/<corso>", methods=["GET"])
 def get_course_data_route(corso):
     if not session.get("admin_logged_in"):
         return jsonify({"status":"error","message":"Non autorizzato"}), 401
 
     mese = request.args.get("mese", "Ottobre-2025")
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    if not valid_mese(mese):
+        return jsonify({"status":"error","message":"Mese non valido"}), 400
+    return cached_json(("course-data", corso, mese),
+                       lambda: {"status":"ok","rows": load_course_rows(corso, mese)})
+
+def course_row_values(r):
+    return (
+        r.get("nome", ""),
+        r.get("cognome", ""),
+        r.get("email", ""),
+        r.get("cell", "") or r.get("cellulare", ""),
+        r.get("tessera", "") or r.get("numero_tessera", ""),
+        r.get("dataCert", "") or r.get("data_certificato", ""),
+        1 if r.get("pagato") else 0,
+        str(r.get("importo", "")),
+    )
+
+def save_course_month(cur, corso, mese, rows):
+    # Sostituisce le righe del mese con un unico INSERT batch; se il mese è
+    # Ottobre-2025 propaga anagrafica e certificato ai mesi successivi
+    # partendo da una tabella di staging, con un UPDATE e un INSERT set-based.
+    values = [(i,) + course_row_values(r) for i, r in enumerate(rows)]
 
     cur.execute("""
-        SELECT cd.row_index, u.id AS user_id, cd.nome, cd.cognome, cd.email, cd.cell, cd.tessera, cd.datacert, cd.pagato, cd.importo
-        FROM corsi_data cd
-        LEFT JOIN utenti u ON cd.email = u.email
-        WHERE cd.corso = %s AND cd.mese = %s
-        ORDER BY cd.row_index
-    """, (corso, mese))
+        CREATE TEMP TABLE IF NOT EXISTS staging_course_rows (
+            ord INT, nome VARCHAR(100), cognome VARCHAR(100), email VARCHAR(255), cell VARCHAR(50),
+            tessera VARCHAR(50), datacert VARCHAR(50), pagato SMALLINT, importo VARCHAR(50)
+        ) ON COMMIT DELETE ROWS
+    """)
+    cur.execute("TRUNCATE staging_course_rows")
+    if values:
+        psycopg2.extras.execute_values(
+            cur,
+            "INSERT INTO staging_course_rows (ord,nome,cognome,email,cell,tessera,datacert,pagato,importo) VALUES %s",
+            values, page_size=1000
+        )
 
-    rows = []
-    for r in cur.fetchall():
-        rows.append({
-            "row_index": r["row_index"],
-            "id": r["user_id"] or "",
-            "nome": r["nome"] or "",
-            "cognome": r["cognome"] or "",
-            "email": r["email"] or "",
-            "cell": r["cell"] or "",
-            "tessera": r["tessera"] or "",
-            "dataCert": r["datacert"] or "",
-            "pagato": bool(r["pagato"]),
-            "importo": r["importo"] or ""
-        })
-    return jsonify({"status":"ok","rows": rows})
+    propaga = mese == "Ottobre-2025" and bool(values)
+    # il mese viene riscritto per intero: basta segnarlo come materializzato
+    mark_materialized(cur, corso, [mese_date(mese)])
+    if propaga:
+        tutti_i_mesi = generate_months()
+        # la propagazione scrive solo nei mesi materializzati, gli altri leggeranno le iscrizioni
+        attivi = materialized_months(cur, corso, [mese_date(m) for m in tutti_i_mesi])
+        mesi_successivi = [m for m in tutti_i_mesi if mese_date(m) in attivi]
+        lock_row_counters(cur, corso, mesi_successivi)
+
+    # il contatore del mese riparte da len(rows) e resta bloccato fino al commit,
+    # così due salvataggi concorrenti dello stesso mese non si sovrappongono
+    reset_row_counter(cur, corso, mese, len(values))
+
+    # riscrittura completa: i client sincronizzati con PATCH ricaricano il mese
+    cur.execute("UPDATE course_months SET reset_seq = nextval('corsi_data_change_seq') WHERE corso=%s AND mese_data=%s",
+                (corso, mese_date(mese)))
+    cur.execute("DELETE FROM corsi_data_tombstones WHERE corso=%s AND mese_data=%s", (corso, mese_date(mese)))
+
+    # elimina dati esistenti solo per il mese specifico
+    cur.execute("DELETE FROM corsi_data WHERE corso=%s AND mese_data=%s", (corso, mese_date(mese)))
+    cur.execute("""
+        INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+        SELECT %s, ord, %s, nome, cognome, email, cell, tessera, datacert, pagato, importo
+        FROM staging_course_rows
+        ORDER BY ord
+    """, (corso, mese_date(mese)))
+
+    if propaga:
+        # una riga per (email, cell): vince l'ultima inviata, l'ordine è quello della prima
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS staging_course_members (
+                first_ord INT, nome VARCHAR(100), cognome VARCHAR(100), email VARCHAR(255), cell VARCHAR(50),
+                tessera VARCHAR(50), datacert VARCHAR(50)
+            ) ON COMMIT DELETE ROWS
+        """)
+        cur.execute("TRUNCATE staging_course_members")
+        cur.execute("""
+            INSERT INTO staging_course_members (first_ord,nome,cognome,email,cell,tessera,datacert)
+            SELECT f.first_ord, l.nome, l.cognome, l.email, l.cell, l.tessera, l.datacert
+            FROM (
+                SELECT DISTINCT ON (email, cell) email, cell, nome, cognome, tessera, datacert
+                FROM staging_course_rows
+                ORDER BY email, cell, ord DESC
+            ) l
+            JOIN (
+                SELECT email, cell, MIN(ord) AS first_ord
+                FROM staging_course_rows
+                GROUP BY email, cell
+            ) f ON f.email IS NOT DISTINCT FROM l.email AND f.cell IS NOT DISTINCT FROM l.cell
+        """)
+        cur.execute("""
+            UPDATE corsi_data cd
+            SET nome = s.nome, cognome = s.cognome, tessera = s.tessera, datacert = s.datacert
+            FROM staging_course_members s
+            WHERE cd.corso = %s AND cd.email = s.email AND cd.cell = s.cell
+              AND cd.mese_data = ANY(%s::date[])
+        """, (corso, [mese_date(m) for m in mesi_successivi]))
+        # coppie (mese, membro) mancanti, poi un blocco di row_index per mese
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS staging_course_missing (
+                mese VARCHAR(20), first_ord INT, pos INT
+            ) ON COMMIT DELETE ROWS
+        """)
+        cur.execute("TRUNCATE staging_course_missing")
+        cur.execute("""
+            INSERT INTO staging_course_missing (mese, first_ord, pos)
+            SELECT m.mese, s.first_ord,
+                   ROW_NUMBER() OVER (PARTITION BY m.mese ORDER BY s.first_ord) - 1
+            FROM unnest(%(mesi)s::varchar[]) AS m(mese)
+            CROSS JOIN staging_course_members s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM corsi_data cd
+                WHERE cd.corso = %(corso)s AND cd.email = s.email AND cd.cell = s.cell
+                  AND cd.mese_data = mese_to_date(m.mese)
+            )
+        """, {"corso": corso, "mesi": mesi_successivi})
+        cur.execute("SELECT mese, COUNT(*) AS n FROM staging_course_missing GROUP BY mese")
+        blocchi = allocate_row_index_blocks(cur, corso, {r["mese"]: r["n"] for r in cur.fetchall()})
+        if blocchi:
+            cur.execute("""
+                INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+                SELECT %s, b.first_index + x.pos, mese_to_date(x.mese), s.nome, s.cognome, s.email, s.cell, s.tessera, s.datacert, 0, ''
+                FROM staging_course_missing x
+                JOIN staging_course_members s ON s.first_ord = x.first_ord
+                JOIN unnest(%s::varchar[], %s::int[]) AS b(mese, first_index) ON b.mese = x.mese
+            """, (corso, list(blocchi), list(blocchi.values())))
+
+        # iscrizioni: anagrafica aggiornata e nuovi membri per i mesi non ancora materializzati
+        cur.execute("""
+            UPDATE course_enrollments e
+            SET nome = s.nome, cognome = s.cognome, tessera = s.tessera, datacert = s.datacert
+            FROM staging_course_members s
+            WHERE e.corso = %s AND e.email = s.email AND e.cell = s.cell
+        """, (corso,))
+        cur.execute("""
+            SELECT nome, cognome, email, cell, tessera, datacert
+            FROM staging_course_members ORDER BY first_ord
+        """)
+        members = [(r["nome"], r["cognome"], r["email"], r["cell"], r["tessera"], r["datacert"])
+                   for r in cur.fetchall()]
+        enroll(cur, corso, members, mese_date(tutti_i_mesi[0]), mese_date(tutti_i_mesi[-1]))
+        if not LAZY_MONTHS:
+            materialize_months(cur, corso, [mese_date(m) for m in tutti_i_mesi])
+
+    return [{"index": v[0], "email": v[3]} for v in values]
 
 @app.route("/admin/course-data/<corso>", methods=["POST"])
 def save_course_data_route(corso):
@@ -462,56 +980,190 @@ def save_course_data_route(corso):
     mese = data.get("mese", "Ottobre-2025")
     if not isinstance(rows, list):
         return jsonify({"status": "error", "message": "Formato dati non valido"}), 400
+    if not valid_mese(mese):
+        return jsonify({"status": "error", "message": "Mese non valido"}), 400
 
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    saved_rows = save_course_month(cur, corso, mese, rows)
+    conn.commit()
+    # con la propagazione da Ottobre-2025 cambiano tutti i mesi del corso
+    response_cache.invalidate(corso, None if mese == "Ottobre-2025" else mese)
+    return jsonify({"status": "ok", "message": "Dati salvati correttamente", "rows": saved_rows})
 
-    # elimina dati esistenti solo per il mese specifico
-    cur.execute("DELETE FROM corsi_data WHERE corso=%s AND mese=%s", (corso, mese))
-
-    saved_rows = []
+# --- SINCRONIZZAZIONE INCREMENTALE ---
+# Ogni scrittura su corsi_data avanza change_seq (e version negli UPDATE) via
+# trigger. Tutte le scritture di un mese avvengono dopo il lock del suo
+# contatore in corsi_row_counters, quindi i change_seq di un mese diventano
+# visibili in ordine e "cursor" (il più alto visto) non salta modifiche.
+# La PATCH non propaga l'anagrafica di Ottobre-2025: resta compito del salvataggio completo.
+PATCH_FIELDS = (("nome", "nome"), ("cognome", "cognome"), ("email", "email"), ("cell", "cell"),
+                ("tessera", "tessera"), ("dataCert", "datacert"), ("pagato", "pagato"), ("importo", "importo"))
+
+def course_changes(cur, corso, mese, since=0, ids=None):
+    """Righe modificate e id eliminati dopo since; reset=True se il mese è stato riscritto per intero.
+
+    Con ids solo quelle righe, reset=False e cursor=None (non vale come punto di ripresa).
+    """
+    d = mese_date(mese)
+    cur.execute("SELECT reset_seq FROM course_months WHERE corso=%s AND mese_data=%s", (corso, d))
+    row = cur.fetchone()
+    reset_seq = row["reset_seq"] if row else 0
+    cur.execute("""
+        SELECT cd.id AS row_id, cd.version, cd.change_seq, cd.row_index, u.id AS user_id,
+               cd.nome, cd.cognome, cd.email, cd.cell, cd.tessera, cd.datacert, cd.pagato, cd.importo
+        FROM corsi_data cd
+        LEFT JOIN utenti u ON cd.email = u.email
+        WHERE cd.corso = %s AND cd.mese_data = %s AND cd.change_seq > %s
+          AND (%s::int[] IS NULL OR cd.id = ANY(%s::int[]))
+        ORDER BY cd.row_index
+    """, (corso, d, since, ids, ids))
+    rows = cur.fetchall()
+    cur.execute("""
+        SELECT id, change_seq FROM corsi_data_tombstones
+        WHERE corso = %s AND mese_data = %s AND change_seq > %s
+          AND (%s::int[] IS NULL OR id = ANY(%s::int[]))
+    """, (corso, d, since, ids, ids))
+    deleted = cur.fetchall()
+    cursor = max([since, reset_seq] + [r["change_seq"] for r in rows] + [t["change_seq"] for t in deleted])
+    if ids is not None:
+        cursor = None
+    return {"reset": ids is None and since < reset_seq, "cursor": cursor,
+            "rows": [course_row_json(r) for r in rows], "deleted": [t["id"] for t in deleted]}
+
+def apply_course_patch(cur, corso, mese, updates, inserts, deletes):
+    """Applica la PATCH; restituisce ({client_id: row_id} inseriti, id in conflitto di versione)."""
+    d = mese_date(mese)
+    conflicts = []
+
+    if updates:
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS staging_course_patch (
+                row_id INT, version INT,
+                set_nome BOOLEAN, nome VARCHAR(100), set_cognome BOOLEAN, cognome VARCHAR(100),
+                set_email BOOLEAN, email VARCHAR(255), set_cell BOOLEAN, cell VARCHAR(50),
+                set_tessera BOOLEAN, tessera VARCHAR(50), set_datacert BOOLEAN, datacert VARCHAR(50),
+                set_pagato BOOLEAN, pagato SMALLINT, set_importo BOOLEAN, importo VARCHAR(50)
+            ) ON COMMIT DELETE ROWS
+        """)
+        cur.execute("TRUNCATE staging_course_patch")
+        values = []
+        for u in updates:
+            row = [int(u["row_id"]), int(u["version"])]
+            for key, col in PATCH_FIELDS:
+                present = key in u or col in u
+                value = u.get(key, u.get(col))
+                if col == "pagato":
+                    value = 1 if value else 0
+                else:
+                    value = "" if value is None else str(value)
+                row += [present, value if present else None]
+            values.append(tuple(row))
+        psycopg2.extras.execute_values(cur, "INSERT INTO staging_course_patch VALUES %s", values)
+        sets = ", ".join(f"{col} = CASE WHEN p.set_{col} THEN p.{col} ELSE cd.{col} END" for _, col in PATCH_FIELDS)
+        cur.execute(f"""
+            UPDATE corsi_data cd SET {sets}
+            FROM staging_course_patch p
+            WHERE cd.corso = %s AND cd.mese_data = %s AND cd.id = p.row_id AND cd.version = p.version
+            RETURNING cd.id
+        """, (corso, d))
+        done = {r["id"] for r in cur.fetchall()}
+        conflicts += [v[0] for v in values if v[0] not in done]
+
+    if deletes:
+        ids = [int(x["row_id"]) for x in deletes]
+        cur.execute("""
+            DELETE FROM corsi_data cd
+            USING unnest(%s::int[], %s::int[]) AS x(id, version)
+            WHERE cd.corso = %s AND cd.mese_data = %s AND cd.id = x.id AND cd.version = x.version
+            RETURNING cd.id
+        """, (ids, [int(x["version"]) for x in deletes], corso, d))
+        gone = [r["id"] for r in cur.fetchall()]
+        conflicts += [i for i in ids if i not in set(gone)]
+        cur.execute("""
+            INSERT INTO corsi_data_tombstones (id, corso, mese_data)
+            SELECT x, %s, %s FROM unnest(%s::int[]) AS x
+        """, (corso, d, gone))
+
+    inserted = {}
+    if inserts and not conflicts:
+        first = allocate_row_indexes(cur, corso, mese, len(inserts))
+        values = [(corso, first + i, d) + course_row_values(r) for i, r in enumerate(inserts)]
+        rows = psycopg2.extras.execute_values(cur, """
+            INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+            VALUES %s RETURNING id, row_index
+        """, values, fetch=True)
+        by_index = {r["row_index"]: r["id"] for r in rows}
+        for i, r in enumerate(inserts):
+            inserted[str(r.get("client_id", i))] = by_index[first + i]
+    return inserted, conflicts
+
+@app.route("/admin/course-data/<corso>", methods=["PATCH"])
+def patch_course_data(corso):
+    if not session.get("admin_logged_in"):
+        return jsonify({"status": "error", "message": "Non autorizzato"}), 401
 
-    for r in rows:
-        nome = r.get("nome", "")
-        cognome = r.get("cognome", "")
-        email = r.get("email", "")
-        cell = r.get("cell", "") or r.get("cellulare", "")
-        tessera = r.get("tessera", "") or r.get("numero_tessera", "")
-        dataCert = r.get("dataCert", "") or r.get("data_certificato", "")
-        pagato = 1 if r.get("pagato") else 0
-        importo = str(r.get("importo", ""))
+    data = request.get_json() or {}
+    mese = data.get("mese", "Ottobre-2025")
+    updates, inserts, deletes = data.get("update") or [], data.get("insert") or [], data.get("delete") or []
+    if not valid_mese(mese):
+        return jsonify({"status": "error", "message": "Mese non valido"}), 400
+    try:
+        since = data.get("since")
+        since = int(since) if since is not None else None
+        if not all(isinstance(x, list) for x in (updates, inserts, deletes)):
+            raise ValueError
+        for x in updates + deletes:
+            int(x["row_id"]), int(x["version"])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"status": "error", "message": "Formato dati non valido"}), 400
 
-        # calcolo row_index
-        cur.execute("SELECT COALESCE(MAX(row_index), -1) + 1 AS idx FROM corsi_data WHERE corso=%s AND mese=%s", (corso, mese))
-        idx = cur.fetchone()["idx"]
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    materialize_months(cur, corso, [mese_date(mese)])
+    lock_row_counters(cur, corso, [mese])
+    inserted, conflicts = apply_course_patch(cur, corso, mese, updates, inserts, deletes)
+    if conflicts:
+        # tutto o niente: si restituisce lo stato attuale delle righe in conflitto
+        conn.rollback()
+        cur.execute("""
+            SELECT cd.id AS row_id, cd.version, cd.row_index, u.id AS user_id,
+                   cd.nome, cd.cognome, cd.email, cd.cell, cd.tessera, cd.datacert, cd.pagato, cd.importo
+            FROM corsi_data cd
+            LEFT JOIN utenti u ON cd.email = u.email
+            WHERE cd.corso = %s AND cd.mese_data = %s AND cd.id = ANY(%s::int[])
+        """, (corso, mese_date(mese), conflicts))
+        current = [course_row_json(r) for r in cur.fetchall()]
+        found = {r["row_id"] for r in current}
+        return jsonify({"status": "error", "message": "Righe modificate da un altro utente, ricarica i dati",
+                        "conflicts": current, "deleted": [i for i in conflicts if i not in found]}), 409
+    conn.commit()
+    response_cache.invalidate(corso, mese)
+    if since is None:
+        # senza cursore si restituiscono solo le righe toccate
+        touched = [int(u["row_id"]) for u in updates + deletes] + list(inserted.values())
+        changes = course_changes(cur, corso, mese, 0, touched)
+    else:
+        changes = course_changes(cur, corso, mese, since)
+    return jsonify(dict(changes, status="ok", inserted=inserted))
 
-        cur.execute(
-            "INSERT INTO corsi_data (corso,row_index,mese,nome,cognome,email,cell,tessera,datacert,pagato,importo) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)",
-            (corso, idx, mese, nome, cognome, email, cell, tessera, dataCert, pagato, importo)
-        )
-        saved_rows.append({"index": idx, "email": email})
-
-        # Propaga ai mesi successivi se siamo a Ottobre-2025
-        if mese == "Ottobre-2025":
-            mesi_successivi = generate_months()
-            for m in mesi_successivi:
-                cur.execute("SELECT row_index FROM corsi_data WHERE corso=%s AND email=%s AND cell=%s AND mese=%s", (corso, email, cell, m))
-                existing = cur.fetchone()
-                if existing:
-                    cur.execute(
-                        "UPDATE corsi_data SET nome=%s, cognome=%s, tessera=%s, datacert=%s WHERE corso=%s AND email=%s AND cell=%s AND mese=%s",
-                        (nome, cognome, tessera, dataCert, corso, email, cell, m)
-                    )
-                else:
-                    cur.execute("SELECT COALESCE(MAX(row_index),-1)+1 AS idx FROM corsi_data WHERE corso=%s AND mese=%s", (corso, m))
-                    new_idx = cur.fetchone()["idx"]
-                    cur.execute(
-                        "INSERT INTO corsi_data (corso,row_index,mese,nome,cognome,email,cell,tessera,dataCert,pagato,importo) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,0,'')",
-                        (corso, new_idx, m, nome, cognome, email, cell, tessera, dataCert)
-                    )
+@app.route("/admin/course-data/<corso>/changes", methods=["GET"])
+def get_course_changes(corso):
+    if not session.get("admin_logged_in"):
+        return jsonify({"status": "error", "message": "Non autorizzato"}), 401
 
-    conn.commit()
-    return jsonify({"status": "ok", "message": "Dati salvati correttamente", "rows": saved_rows})
+    mese = request.args.get("mese", "Ottobre-2025")
+    if not valid_mese(mese):
+        return jsonify({"status": "error", "message": "Mese non valido"}), 400
+    try:
+        since = int(request.args.get("since") or 0)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Cursore non valido"}), 400
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    if materialize_months(cur, corso, [mese_date(mese)]):
+        conn.commit()
+    return jsonify(dict(course_changes(cur, corso, mese, since), status="ok"))
 
 @app.route("/admin/course-data-single/<corso>", methods=["POST"])
 def save_single_course_row(corso):
@@ -523,15 +1175,10 @@ def save_single_course_row(corso):
     row = data.get("row")
     if not row:
         return jsonify({"status": "error", "message": "Nessuna riga inviata"}), 400
+    if not valid_mese(mese):
+        return jsonify({"status": "error", "message": "Mese non valido"}), 400
 
-    nome = row.get("nome", "")
-    cognome = row.get("cognome", "")
-    email = row.get("email", "")
-    cell = row.get("cell", "") or row.get("cellulare", "")
-    tessera = row.get("tessera", "") or row.get("numero_tessera", "")
-    dataCert = row.get("dataCert", "") or row.get("data_certificato", "")
-    pagato = 1 if row.get("pagato") else 0
-    importo = str(row.get("importo", ""))
+    nome, cognome, email, cell, tessera, dataCert, pagato, importo = course_row_values(row)
 
     if not email:
         return jsonify({"status": "error", "message": "Email mancante"}), 400
@@ -542,27 +1189,62 @@ def save_single_course_row(corso):
     # verifica se utente esiste
     cur.execute("SELECT id FROM utenti WHERE email=%s", (email,))
     user = cur.fetchone()
+    created = not user
     if user:
         user_id = user["id"]
     else:
         cur.execute(
-            "INSERT INTO utenti (nome_cognome, email, phone) VALUES (%s, %s, %s) RETURNING id",
-            (f"{nome} {cognome}".strip(), email, cell)
+            "INSERT INTO utenti (nome_cognome, email, password_hash, phone) VALUES (%s, %s, %s, %s) RETURNING id",
+            (f"{nome} {cognome}".strip(), email, UNUSABLE_PASSWORD, cell)
         )
         user_id = cur.fetchone()["id"]
 
-    # calcolo row_index
-    cur.execute("SELECT COALESCE(MAX(row_index), -1) + 1 AS idx FROM corsi_data WHERE corso=%s AND mese=%s", (corso, mese))
-    row_index = cur.fetchone()["idx"]
+    materialize_months(cur, corso, [mese_date(mese)])
+    row_index = allocate_row_indexes(cur, corso, mese)
 
     cur.execute(
-        "INSERT INTO corsi_data (corso,row_index,mese,nome,cognome,email,cell,tessera,dataCert,pagato,importo) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)",
-        (corso, row_index, mese, nome, cognome, email, cell, tessera, dataCert, pagato, importo)
+        "INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,dataCert,pagato,importo) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)",
+        (corso, row_index, mese_date(mese), nome, cognome, email, cell, tessera, dataCert, pagato, importo)
     )
 
     conn.commit()
+    if created:
+        response_cache.invalidate()
+    else:
+        response_cache.invalidate(corso, mese)
     return jsonify({"status": "ok", "message": "Riga salvata correttamente", "user_id": user_id, "row_index": row_index})
     
+@app.route("/admin/course-import/<corso>", methods=["POST"])
+def import_course_members(corso):
+    # multipart: file (CSV), mese, dry_run=1 per la sola validazione
+    if not session.get("admin_logged_in"):
+        return jsonify({"status": "error", "message": "Non autorizzato"}), 401
+
+    mese = request.form.get("mese", "Ottobre-2025")
+    dry_run = request.form.get("dry_run") in ("1", "true")
+    if not valid_mese(mese):
+        return jsonify({"status": "error", "message": "Mese non valido"}), 400
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({"status": "error", "message": "Nessun file selezionato"}), 400
+
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        summary = import_members(cur, corso, mese, mese_date(mese), request.files['file'].stream, dry_run)
+    except ImportFormatError as e:
+        conn.rollback()
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+        # nuovi utenti: cambia l'id associato per email anche negli altri corsi
+        if summary["users_created"]:
+            response_cache.invalidate()
+        else:
+            response_cache.invalidate(corso, mese)
+    return jsonify(dict(summary, status="ok"))
+
 @app.route("/admin/send-payment-reminder", methods=["POST"])
 def send_payment_reminder():
     if not session.get("admin_logged_in"):
@@ -583,27 +1265,173 @@ def send_payment_reminder():
         "Saluti,\nGymnica Fitness Club"
     )
 
-    # Restituiamo i dati al frontend per aprire il client email
+    # le mail vanno in coda e le invia il mail worker in background
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    ids = enqueue(cur, [(email, subject, body) for email in dict.fromkeys(emails) if email])
+    conn.commit()
+    mail_worker.wake()
+
     return jsonify({
         "status": "ok",
-        "sent": emails,       # ⚡ compatibile col JS esistente
-        "subject": subject,
-        "body": body,
-        "message": f"Preparati a inviare {len(emails)} mail tramite il client di posta."
+        "queued": len(ids),
+        "ids": ids,
+        "message": f"{len(ids)} promemoria messi in coda di invio."
     })
 
+@app.route("/admin/mail-queue", methods=["GET"])
+def admin_mail_queue():
+    if not session.get("admin_logged_in"):
+        return jsonify({"status": "error", "message": "Non autorizzato"}), 401
+    cur = get_db().cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    counts, recent = queue_status(cur)
+    return jsonify({"status": "ok", "counts": counts, "messages": recent})
+
+def load_course_totals(corso, mese):
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.execute("SELECT total_cassa, total_istruttore FROM course_totals WHERE corso=%s AND mese=%s", (corso, mese))
+    row = cur.fetchone()
+    if not row:
+        return {"total_cassa":0,"total_istruttore":0}
+    # total_cassa è NUMERIC: in JSON resta un numero
+    return {"total_cassa":float(row["total_cassa"] or 0),"total_istruttore":row["total_istruttore"] or 0}
+
 @app.route("/admin/course-totals/<corso>", methods=["GET"])
 def get_course_totals(corso):
     if not session.get("admin_logged_in"):
         return jsonify({"status":"error","message":"Non autorizzato"}), 401
     mese = request.args.get("mese", "Ottobre-2025")
+    if not valid_mese(mese):
+        return jsonify({"status":"error","message":"Mese non valido"}), 400
+    return cached_json(("course-totals", corso, mese),
+                       lambda: {"status":"ok","totals":load_course_totals(corso, mese)})
+
+# --- LETTURA DI PIÙ MESI / CORSI IN UNA RICHIESTA ---
+# ?corsi=BodyBuilding,Karate più l'intervallo di mesi di months_from_args;
+# una query per tabella, risultato raggruppato per corso e mese
+BATCH_MAX_MONTHS = int(os.environ.get("BATCH_MAX_MONTHS", 24))
+BATCH_MAX_CORSI = int(os.environ.get("BATCH_MAX_CORSI", 10))
+
+def load_course_batch(corsi, mesi):
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT total_cassa, total_istruttore FROM course_totals WHERE corso=%s AND mese=%s", (corso, mese))
-    row = cur.fetchone()
-    if not row:
-        return jsonify({"status":"ok","totals":{"total_cassa":0,"total_istruttore":0}})
-    return jsonify({"status":"ok","totals":{"total_cassa":row["total_cassa"] or 0,"total_istruttore":row["total_istruttore"] or 0}})
+    result = {c: {m: {"rows": [], "totals": {"total_cassa":0,"total_istruttore":0}} for m in mesi} for c in corsi}
+    materialized = [materialize_months(cur, c, [mese_date(m) for m in mesi]) for c in corsi]
+    if any(materialized):
+        conn.commit()
+
+    cur.execute("""
+        SELECT cd.corso, cd.mese, cd.id AS row_id, cd.version, cd.row_index, u.id AS user_id, cd.nome, cd.cognome, cd.email, cd.cell, cd.tessera, cd.datacert, cd.pagato, cd.importo
+        FROM corsi_data cd
+        LEFT JOIN utenti u ON cd.email = u.email
+        WHERE cd.corso = ANY(%s) AND cd.mese_data = ANY(%s::date[])
+        ORDER BY cd.corso, cd.mese_data, cd.row_index
+    """, (corsi, [mese_date(m) for m in mesi]))
+    for r in cur.fetchall():
+        result[r["corso"]][r["mese"]]["rows"].append(course_row_json(r))
+
+    cur.execute("""
+        SELECT corso, mese, total_cassa, total_istruttore FROM course_totals
+        WHERE corso = ANY(%s) AND mese = ANY(%s)
+    """, (corsi, mesi))
+    for r in cur.fetchall():
+        result[r["corso"]][r["mese"]]["totals"] = {"total_cassa":float(r["total_cassa"] or 0),
+                                                   "total_istruttore":r["total_istruttore"] or 0}
+    return result
+
+@app.route("/admin/course-batch", methods=["GET"])
+def get_course_batch():
+    if not session.get("admin_logged_in"):
+        return jsonify({"status":"error","message":"Non autorizzato"}), 401
+
+    try:
+        mesi = months_from_args(request.args)
+    except ValueError:
+        return jsonify({"status":"error","message":"Intervallo di mesi non valido"}), 400
+    corsi = list(dict.fromkeys(c for c in (request.args.get("corsi") or "").split(",") if c))
+    if not corsi:
+        return jsonify({"status":"error","message":"Nessun corso indicato"}), 400
+    if len(mesi) > BATCH_MAX_MONTHS or len(corsi) > BATCH_MAX_CORSI:
+        return jsonify({"status":"error",
+                        "message":f"Massimo {BATCH_MAX_MONTHS} mesi e {BATCH_MAX_CORSI} corsi per richiesta"}), 400
+    mesi = list(dict.fromkeys(mesi))
+
+    # ETag dalle generazioni di response_cache (lette prima della query, come
+    # cached_json): If-None-Match uguale -> 304 senza toccare il DB
+    etag = response_cache.generation_etag("course-batch", corsi, mesi)
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        payload = app.json.dumps({"status":"ok","mesi":mesi,"corsi":load_course_batch(corsi, mesi)})
+        resp = app.response_class(payload, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+EXPORT_FORMATS = {
+    "csv": (csv_chunks, "text/csv; charset=utf-8"),
+    "xlsx": (xlsx_chunks, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+@app.route("/admin/export", methods=["GET"])
+def export_course_data():
+    # ?format=csv|xlsx&corsi=Yoga,Pilates (vuoto = tutti) e mesi come /admin/course-batch, senza limiti
+    if not session.get("admin_logged_in"):
+        return jsonify({"status":"error","message":"Non autorizzato"}), 401
+
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"status":"error","message":"Formato non valido (csv o xlsx)"}), 400
+    try:
+        mesi = list(dict.fromkeys(months_from_args(request.args)))
+    except ValueError:
+        return jsonify({"status":"error","message":"Intervallo di mesi non valido"}), 400
+    if not mesi:
+        return jsonify({"status":"error","message":"Nessun mese indicato"}), 400
+    date_mesi = [mese_date(m) for m in mesi]
+
+    conn = get_db()
+    corsi = list(dict.fromkeys(c for c in (request.args.get("corsi") or "").split(",") if c))
+    if not corsi:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute("SELECT corso FROM course_months UNION SELECT corso FROM course_enrollments ORDER BY corso")
+        corsi = [r["corso"] for r in cur.fetchall()]
+        cur.close()
+
+    # cursore con nome: le righe arrivano a blocchi mentre la risposta è già partita.
+    # I mesi non ancora materializzati si leggono dalle iscrizioni nella stessa
+    # query, senza scriverli: l'esportazione non crea righe in corsi_data
+    cur = conn.cursor(name="course_export", cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.itersize = EXPORT_CHUNK_ROWS
+    cur.execute(f"""
+        SELECT r.corso, r.mese, r.nome, r.cognome, r.email, r.cell, r.tessera, r.datacert, r.pagato, r.importo_num
+        FROM (
+            SELECT cd.corso, cd.mese_data, cd.mese, cd.nome, cd.cognome, cd.email, cd.cell, cd.tessera,
+                   cd.datacert, cd.pagato, cd.importo_num, cd.row_index AS pos
+            FROM corsi_data cd
+            WHERE cd.corso = ANY(%(corsi)s) AND cd.mese_data = ANY(%(mesi)s::date[])
+            UNION ALL
+            SELECT p.corso, p.mese_data, date_to_mese(p.mese_data), p.nome, p.cognome, p.email, p.cell, p.tessera,
+                   p.datacert, 0, NULL::numeric, p.pos
+            FROM ({PENDING_ROWS_SQL}) p
+        ) r
+        ORDER BY r.corso, r.mese_data, r.pos
+    """, {"corsi": corsi, "mesi": date_mesi})
+
+    chunks, mimetype = EXPORT_FORMATS[fmt]
+
+    def generate():
+        try:
+            yield from chunks(cur)
+        finally:
+            cur.close()
+            conn.rollback()
+
+    resp = app.response_class(stream_with_context(generate()), mimetype=mimetype)
+    resp.headers.set("Content-Disposition", "attachment", filename=f"corsi_{mesi[0]}_{mesi[-1]}.{fmt}")
+    resp.headers["X-Accel-Buffering"] = "no"   # nginx non deve accumulare la risposta
+    return resp
 
 @app.route("/admin/course-totals/<corso>", methods=["POST"])
 def save_course_totals(corso):
@@ -612,21 +1440,153 @@ def save_course_totals(corso):
 
     data = request.get_json() or {}
     mese = data.get("mese", "Ottobre-2025")
-    total_cassa = float(data.get("total_cassa", 0) or 0)
-    total_istruttore = float(data.get("total_istruttore", 0) or 0)
+    if not valid_mese(mese):
+        return jsonify({"status":"error","message":"Mese non valido"}), 400
+    # total_cassa è calcolato dal database sui pagamenti (migrazione 7): si salva solo il totale istruttore
+    if "total_istruttore" in data:
+        total_istruttore = float(data.get("total_istruttore", 0) or 0)
+        conn = get_db()
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO course_totals (corso,mese,total_istruttore)
+            VALUES (%s,%s,%s)
+            ON CONFLICT (corso, mese)
+            DO UPDATE SET total_istruttore = EXCLUDED.total_istruttore
+        """, (corso, mese, total_istruttore))
+        conn.commit()
+        response_cache.invalidate(corso, mese)
+
+    return jsonify({"status":"ok","message":"Totali salvati"})
+
+# --- REPORT INCASSI ---
+# ?anno=2026 oppure ?da=Ottobre-2025&a=Settembre-2026, opzionale ?corsi=BodyBuilding,Karate
+@app.route("/admin/report", methods=["GET"])
+def admin_report():
+    if not session.get("admin_logged_in"):
+        return jsonify({"status":"error","message":"Non autorizzato"}), 401
+
+    try:
+        mesi = months_from_args(request.args)
+    except ValueError:
+        return jsonify({"status":"error","message":"Intervallo di mesi non valido"}), 400
+    corsi = [c for c in (request.args.get("corsi") or "").split(",") if c]
 
     conn = get_db()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO course_totals (corso,mese,total_cassa,total_istruttore)
-        VALUES (%s,%s,%s,%s)
-        ON CONFLICT (corso, mese)
-        DO UPDATE SET total_cassa = EXCLUDED.total_cassa, total_istruttore = EXCLUDED.total_istruttore
-    """, (corso, mese, total_cassa, total_istruttore))
-    conn.commit()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    sql = "SELECT corso, mese, total_cassa, total_istruttore FROM course_totals WHERE mese = ANY(%s)"
+    params = [mesi]
+    if corsi:
+        sql += " AND corso = ANY(%s)"
+        params.append(corsi)
+    cur.execute(sql, params)
+
+    report = {"status":"ok","mesi":mesi,"corsi":{},"total_cassa":0.0,"total_istruttore":0.0}
+    # le somme di total_cassa (NUMERIC) restano Decimal fino alla risposta
+    cassa_corsi, cassa_totale = {}, Decimal(0)
+    for r in cur.fetchall():
+        cassa = r["total_cassa"] or Decimal(0)
+        istruttore = float(r["total_istruttore"] or 0)
+        corso = report["corsi"].setdefault(r["corso"], {"mesi":{},"total_cassa":0.0,"total_istruttore":0.0})
+        corso["mesi"][r["mese"]] = {"total_cassa":float(cassa),"total_istruttore":istruttore}
+        corso["total_istruttore"] += istruttore
+        cassa_corsi[r["corso"]] = cassa_corsi.get(r["corso"], Decimal(0)) + cassa
+        cassa_totale += cassa
+        report["total_istruttore"] += istruttore
+    for nome, cassa in cassa_corsi.items():
+        report["corsi"][nome]["total_cassa"] = float(cassa)
+    report["total_cassa"] = float(cassa_totale)
+    return jsonify(report)
+
+# --- CERTIFICATI MEDICI ---
+# datacert resta il testo inserito; datacert_date (migrazione 11) è la data
+# interpretata e il certificato scade CERT_VALIDITY_MONTHS mesi dopo (0 se
+# datacert è già la data di scadenza). Per ogni email conta l'ultimo certificato.
+CERT_VALIDITY_MONTHS = int(os.environ.get("CERT_VALIDITY_MONTHS", 12))
+CERT_MAX_DAYS = 3660
+CERT_INVALID_LIMIT = 500
+
+@app.route("/admin/certificates", methods=["GET"])
+def admin_certificates():
+    # ?giorni=30 (in scadenza entro) &scaduti=60 (scaduti da non più di)
+    if not session.get("admin_logged_in"):
+        return jsonify({"status":"error","message":"Non autorizzato"}), 401
 
-    return jsonify({"status":"ok","message":"Totali salvati"})
+    try:
+        giorni = int(request.args.get("giorni", 30))
+        scaduti = int(request.args.get("scaduti", 60))
+        if not (0 <= giorni <= CERT_MAX_DAYS and 0 <= scaduti <= CERT_MAX_DAYS):
+            raise ValueError
+    except ValueError:
+        return jsonify({"status":"error","message":"Parametri non validi"}), 400
+
+    oggi = date.today()
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    # una sola query: intervallo su corsi_data_datacert_idx, ultimo certificato
+    # per email verificato su corsi_data_email_datacert_idx
+    cur.execute("""
+        SELECT DISTINCT ON (cd.email) cd.email, cd.nome, cd.cognome, cd.cell, cd.corso, cd.mese, cd.datacert,
+               cd.datacert_date, (cd.datacert_date + make_interval(months => %(validita)s))::date AS scadenza
+        FROM corsi_data cd
+        WHERE cd.datacert_date BETWEEN (%(da)s::date - make_interval(months => %(validita)s))::date
+                                   AND (%(a)s::date - make_interval(months => %(validita)s))::date
+          AND cd.email <> ''
+          AND NOT EXISTS (SELECT 1 FROM corsi_data x
+                          WHERE x.email = cd.email AND x.datacert_date > cd.datacert_date)
+        ORDER BY cd.email, cd.datacert_date DESC, cd.mese_data DESC
+    """, {"validita": CERT_VALIDITY_MONTHS, "da": date.fromordinal(oggi.toordinal() - scaduti),
+          "a": date.fromordinal(oggi.toordinal() + giorni)})
+    expiring, expired = [], []
+    for r in sorted(cur.fetchall(), key=lambda r: r["scadenza"]):
+        item = {"email": r["email"], "nome": r["nome"] or "", "cognome": r["cognome"] or "", "cell": r["cell"] or "",
+                "corso": r["corso"], "mese": r["mese"], "dataCert": r["datacert"] or "",
+                "scadenza": r["scadenza"].isoformat(), "giorni": (r["scadenza"] - oggi).days}
+        (expired if r["scadenza"] < oggi else expiring).append(item)
+
+    # date non interpretabili, per chi non ha nessun certificato valido
+    cur.execute("""
+        SELECT DISTINCT ON (cd.email) cd.email, cd.nome, cd.cognome, cd.corso, cd.mese, cd.datacert
+        FROM corsi_data cd
+        WHERE cd.datacert_invalid
+          AND NOT EXISTS (SELECT 1 FROM corsi_data x WHERE x.email = cd.email AND x.datacert_date IS NOT NULL)
+        ORDER BY cd.email, cd.mese_data DESC
+        LIMIT %s
+    """, (CERT_INVALID_LIMIT,))
+    invalid = [{"email": r["email"], "nome": r["nome"] or "", "cognome": r["cognome"] or "", "corso": r["corso"],
+                "mese": r["mese"], "dataCert": r["datacert"]} for r in cur.fetchall()]
+    return jsonify({"status":"ok","validity_months":CERT_VALIDITY_MONTHS,
+                    "expiring":expiring,"expired":expired,"invalid":invalid})
+
+# --- STATISTICHE POOL DB ---
+@app.route("/admin/db-pool-stats", methods=["GET"])
+def db_pool_stats():
+    if not session.get("admin_logged_in"):
+        return jsonify({"status":"error","message":"Non autorizzato"}), 401
+    return jsonify({"status":"ok","pool":get_pool().stats(),"response_cache":response_cache.stats()})
 
+@app.route("/metrics", methods=["GET"])
+def metrics_route():
+    token = request.headers.get("Authorization", "")
+    if not session.get("admin_logged_in") and not (METRICS_TOKEN and hmac.compare_digest(token, f"Bearer {METRICS_TOKEN}")):
+        return jsonify({"status":"error","message":"Non autorizzato"}), 401
+    if not METRICS_ENABLED:
+        return jsonify({"status":"error","message":"Metriche disattivate"}), 404
+    pool = get_pool().stats()
+    cache = response_cache.stats()
+    hasher = get_hasher().stats()
+    gauges = {
+        "db_pool_size": pool["size"],
+        "db_pool_idle": pool["idle"],
+        "db_pool_in_use": pool["in_use"],
+        "db_pool_waits": pool["waits"],
+        "db_pool_timeouts": pool["timeouts"],
+        "response_cache_entries": cache["entries"],
+        "response_cache_hits": cache["hits"],
+        "response_cache_misses": cache["misses"],
+        "hash_in_flight": hasher["in_flight"],
+        "hash_rejected": hasher["rejected"],
+    }
+    return app.response_class(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
 
 # --- run ---
 if __name__ == "__main__":
@@ -0,0 +1,262 @@
+# asgi.py
+# Modalità di servizio asincrona (opzionale). Le rotte che passano la maggior
+# parte del tempo ad aspettare I/O (login, /me, /scheda, lettura della griglia
+# di un corso) sono riscritte come handler async su Quart, con un pool
+# asincrono psycopg 3; bcrypt gira sul pool di hashing.py senza bloccare
+# l'event loop. Tutte le altre rotte restano quelle Flask di app.py, servite in
+# un pool di thread dallo stesso processo: URL, cookie di sessione (stessa
+# SECRET_KEY e stesso formato) e risposte JSON non cambiano.
+#
+#   gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:application
+#
+# Dipendenze aggiuntive in requirements-async.txt (Quart 0.18, l'ultima serie
+# compatibile con Flask 2.3). Le rotte async passano dalle stesse metriche per
+# richiesta di metrics.py (esposte da /metrics) e hanno gli stessi header CORS
+# delle rotte Flask, tramite quart_cors.
+#
+# Ogni worker ha due pool di connessioni: quello async di questo file
+# (ASGI_DB_POOL_MIN/ASGI_DB_POOL_MAX) per le rotte async e quello di db_pool.py
+# (DB_POOL_MIN/DB_POOL_MAX) per le rotte Flask e per la materializzazione dei
+# mesi. Le connessioni verso PostgreSQL per worker arrivano quindi fino a
+# ASGI_DB_POOL_MAX + DB_POOL_MAX.
+import os
+import re
+import asyncio
+import mimetypes
+from urllib.parse import quote
+
+import psycopg2.extras
+from a2wsgi import WSGIMiddleware
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from quart import Quart, request, session, jsonify, send_file
+from quart_cors import cors
+from werkzeug.datastructures import ContentRange
+from werkzeug.exceptions import HTTPException
+
+import app as wsgi
+from course_months import materialize_months
+from db_pool import connect_kwargs_from_env
+from hashing import get_hasher, HashingBusy
+from rate_limit import AsyncPostgresRateLimiter, MemoryRateLimiter
+
+flask_app = wsgi.app
+
+aapp = Quart(__name__, static_folder=None)
+aapp.secret_key = flask_app.secret_key
+for key in ("SESSION_COOKIE_NAME", "SESSION_COOKIE_DOMAIN", "SESSION_COOKIE_PATH", "SESSION_COOKIE_HTTPONLY",
+            "SESSION_COOKIE_SECURE", "SESSION_COOKIE_SAMESITE", "PERMANENT_SESSION_LIFETIME"):
+    aapp.config[key] = flask_app.config[key]
+# come CORS(app, supports_credentials=True) di app.py: qualunque origine,
+# rimandata indietro (con le credenziali "*" non è ammesso)
+aapp = cors(aapp, allow_origin=re.compile(".*"), allow_credentials=True)
+
+connect_kwargs = dict(connect_kwargs_from_env(), row_factory=dict_row)
+if wsgi.METRICS_ENABLED:
+    wsgi.metrics.init_quart(aapp)
+    connect_kwargs["cursor_factory"] = wsgi.metrics.async_cursor_factory()
+
+pool = AsyncConnectionPool(
+    conninfo="",
+    kwargs=connect_kwargs,
+    min_size=int(os.environ.get("ASGI_DB_POOL_MIN", 1)),
+    max_size=int(os.environ.get("ASGI_DB_POOL_MAX", 10)),
+    max_lifetime=float(os.environ.get("DB_POOL_MAX_LIFETIME", 1800)),
+    timeout=float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+    open=False,
+)
+
+# stesso backend scelto da app.py con RATE_LIMIT_BACKEND
+if isinstance(wsgi.rate_limiter, MemoryRateLimiter):
+    rate_limiter = wsgi.rate_limiter
+else:
+    rate_limiter = AsyncPostgresRateLimiter(wsgi.MAX_ATTEMPTS, wsgi.BLOCK_TIME_SECONDS, pool)
+
+
+async def _limiter(method, *args):
+    result = getattr(rate_limiter, method)(*args)
+    return await result if asyncio.iscoroutine(result) else result
+
+
+@aapp.before_serving
+async def open_pool():
+    await pool.open()
+
+
+@aapp.after_serving
+async def close_pool():
+    await pool.close()
+
+
+@aapp.errorhandler(HashingBusy)
+async def hashing_busy(e):
+    resp = jsonify({"status":"error","message":"Server occupato, riprova tra poco"})
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
+
+
+# --- LOGIN ---
+@aapp.route("/login", methods=["POST"])
+async def login():
+    ip = request.remote_addr
+    blocked, remaining = await _limiter("check", "login_attempts", ip)
+    if blocked:
+        return jsonify({"status":"error","message":f"Superato il numero di tentativi: attendi {remaining} secondi", "remaining_seconds": remaining}), 429
+
+    data = await request.get_json(silent=True) or {}
+    email = (data.get("email") or "").strip()
+    password = (data.get("password") or "").strip()
+
+    if not email or not password:
+        return jsonify({"status":"error","message":"Compila tutti i campi"}), 400
+
+    async with pool.connection() as conn:
+        cur = await conn.execute("SELECT id, password_hash, nome_cognome FROM utenti WHERE email=%s", (email,))
+        row = await cur.fetchone()
+    hasher = get_hasher()
+    if row and await hasher.verify_async(password, row["password_hash"]):
+        session['user_id'] = row["id"]
+        if hasher.needs_rehash(row["password_hash"]):
+            try:
+                new_hash = await hasher.hash_async(password)
+                async with pool.connection() as conn:
+                    await conn.execute("UPDATE utenti SET password_hash=%s WHERE id=%s", (new_hash, row["id"]))
+            except HashingBusy:
+                pass
+        await _limiter("reset", "login_attempts", ip)
+        return jsonify({"status":"ok","message":"Login riuscito","nome_cognome": row["nome_cognome"]})
+    await _limiter("record_failure", "login_attempts", ip)
+    return jsonify({"status":"error","message":"Email o Password errate"}), 401
+
+
+@aapp.route("/me", methods=["GET"])
+async def me():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"status":"error","message":"Non autenticato"}), 401
+    async with pool.connection() as conn:
+        cur = await conn.execute(
+            "SELECT id, nome_cognome, username, email, phone, data_creazione FROM utenti WHERE id=%s", (user_id,))
+        row = await cur.fetchone()
+    if not row:
+        return jsonify({"status":"error","message":"Utente non trovato"}), 404
+    return jsonify({"status":"ok","user":row})
+
+
+# --- SCARICA PDF ---
+@aapp.route("/scheda", methods=["GET"])
+async def get_scheda():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"status":"error","message":"Non autenticato"}), 401
+
+    async with pool.connection() as conn:
+        cur = await conn.execute("SELECT pdf_path, pdf_name FROM utenti WHERE id=%s", (user_id,))
+        row = await cur.fetchone()
+    if not row or not row["pdf_path"]:
+        return jsonify({"status":"error","message":"Nessun file disponibile"}), 200
+
+    pdf_filename = row["pdf_path"]
+    pdf_path = os.path.join(wsgi.UPLOAD_FOLDER, pdf_filename)
+    download_name = row["pdf_name"] or pdf_filename
+
+    if not await asyncio.to_thread(os.path.isfile, pdf_path):
+        return jsonify({"status":"error","message":"File non trovato sul server"}), 200
+
+    mimetype = mimetypes.guess_type(pdf_filename)[0] or "application/octet-stream"
+    if wsgi.SCHEDA_OFFLOAD == "x-accel":
+        resp = aapp.response_class("", mimetype=mimetype)
+        resp.headers["X-Accel-Redirect"] = f"{wsgi.SCHEDA_ACCEL_PREFIX}/{quote(pdf_filename)}"
+        resp.headers.set("Content-Disposition", "attachment", **wsgi.attachment_disposition(download_name))
+    elif wsgi.SCHEDA_OFFLOAD == "x-sendfile":
+        resp = aapp.response_class("", mimetype=mimetype)
+        resp.headers["X-Sendfile"] = os.path.abspath(pdf_path)
+        resp.headers.set("Content-Disposition", "attachment", **wsgi.attachment_disposition(download_name))
+    else:
+        # il file è letto a blocchi senza bloccare il loop; ETag, 304 e Range come in Flask
+        resp = await send_file(pdf_path, mimetype=mimetype, as_attachment=True,
+                               attachment_filename=download_name, conditional=True)
+        # correzioni per Quart 0.18: nomi non ASCII codificati come in Flask,
+        # niente Expires di 12 ore (contraddirebbe il no-cache qui sotto) e
+        # Content-Range con la fine inclusiva giusta (0.18 la scrive con un byte in meno)
+        resp.headers.set("Content-Disposition", "attachment", **wsgi.attachment_disposition(download_name))
+        resp.headers.pop("Expires", None)
+        if resp.status_code == 206:
+            sent = resp.content_range
+            resp.content_range = ContentRange(sent.units, sent.start, sent.stop + 1, sent.length)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+# --- GRIGLIA DI UN CORSO ---
+def _materialize_sync(corso, mese_data):
+    # primo accesso al mese: la materializzazione resta quella sincrona di course_months.py
+    with flask_app.app_context():
+        conn = wsgi.get_db()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        if materialize_months(cur, corso, [mese_data]):
+            conn.commit()
+
+
+async def load_course_rows(corso, mese):
+    mese_data = wsgi.mese_date(mese)
+    async with pool.connection() as conn:
+        cur = await conn.execute("SELECT 1 FROM course_months WHERE corso=%s AND mese_data=%s", (corso, mese_data))
+        materialized = await cur.fetchone() is not None
+    if not materialized:
+        await asyncio.to_thread(_materialize_sync, corso, mese_data)
+    async with pool.connection() as conn:
+        cur = await conn.execute("""
+            SELECT cd.id AS row_id, cd.version, cd.row_index, u.id AS user_id,
+                   cd.nome, cd.cognome, cd.email, cd.cell, cd.tessera, cd.datacert, cd.pagato, cd.importo
+            FROM corsi_data cd
+            LEFT JOIN utenti u ON cd.email = u.email
+            WHERE cd.corso = %s AND cd.mese_data = %s
+            ORDER BY cd.row_index
+        """, (corso, mese_data))
+        return [wsgi.course_row_json(r) for r in await cur.fetchall()]
+
+
+@aapp.route("/admin/course-data/<corso>", methods=["GET"])
+async def get_course_data_route(corso):
+    if not session.get("admin_logged_in"):
+        return jsonify({"status":"error","message":"Non autorizzato"}), 401
+
+    mese = request.args.get("mese", "Ottobre-2025")
+    if not wsgi.valid_mese(mese):
+        return jsonify({"status":"error","message":"Mese non valido"}), 400
+
+    # stessa cache (e stessi ETag) delle rotte Flask: le scritture la invalidano per tutti
+    key = ("course-data", corso, mese)
+    cached = wsgi.response_cache.get(key)
+    if cached is None:
+        generations = wsgi.response_cache.generations(key)
+        payload = flask_app.json.dumps({"status":"ok","rows": await load_course_rows(corso, mese)}).encode("utf-8")
+        etag = wsgi.response_cache.put(key, payload, generations)
+    else:
+        etag, payload = cached
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+    if request.if_none_match.contains(etag):
+        return "", 304, headers
+    return aapp.response_class(payload, mimetype="application/json", headers=headers)
+
+
+# --- dispatcher ASGI ---
+# le richieste che corrispondono a una rotta async vanno a Quart, tutte le altre all'app Flask
+flask_asgi = WSGIMiddleware(flask_app, workers=int(os.environ.get("ASGI_WSGI_THREADS", 10)))
+_url_adapter = aapp.url_map.bind("")
+
+
+def _is_async_route(scope):
+    try:
+        _url_adapter.match(scope["path"], method=scope["method"])
+    except HTTPException:
+        return False
+    return True
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan" or (scope["type"] == "http" and _is_async_route(scope)):
+        await aapp(scope, receive, send)
+    else:
+        await flask_asgi(scope, receive, send)
@@ -0,0 +1,152 @@
+# assets.py
+# Build degli asset statici: copia css/js/immagini in frontend/build/static con
+# l'hash del contenuto nel nome (style.3f2a9c1b7d4e.css), riscrive i riferimenti
+# nei css e negli html e prepara le varianti .gz/.br per i file testuali.
+# I file con hash sono immutabili e possono essere messi in cache per un anno.
+# L'app rilegge il manifest quando cambia il suo mtime (AssetManifest), quindi
+# un build fatto con il server avviato non richiede un riavvio.
+#
+#   python assets.py            (oppure: flask build-assets)
+import os
+import re
+import json
+import gzip
+import shutil
+import hashlib
+
+try:
+    import brotli
+except ImportError:  # opzionale: senza brotli si generano solo le varianti gzip
+    brotli = None
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+FRONTEND_ROOT = os.path.join(BASE_DIR, "..", "frontend")
+STATIC_DIR = os.path.join(FRONTEND_ROOT, "static")
+TEMPLATES_DIR = os.path.join(FRONTEND_ROOT, "templates")
+BUILD_DIR = os.path.join(FRONTEND_ROOT, "build")
+BUILD_STATIC_DIR = os.path.join(BUILD_DIR, "static")
+BUILD_TEMPLATES_DIR = os.path.join(BUILD_DIR, "templates")
+MANIFEST_PATH = os.path.join(BUILD_DIR, "manifest.json")
+
+# downloads/ resta fuori: i nomi dei file sono quelli che vede l'utente
+HASHED_DIRS = ("css", "js", "images")
+COMPRESSIBLE = (".css", ".js", ".html", ".svg", ".json")
+CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _hashed_name(rel_path, data):
+    root, ext = os.path.splitext(rel_path)
+    return f"{root}.{_digest(data)}{ext}"
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    if path.endswith(COMPRESSIBLE):
+        with open(path + ".gz", "wb") as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + ".br", "wb") as f:
+                f.write(brotli.compress(data, quality=11))
+
+
+def _rewrite_css(rel_path, text, manifest):
+    css_dir = os.path.dirname(rel_path)
+
+    def repl(m):
+        url = m.group(2)
+        if "://" in url or url.startswith(("data:", "/", "#")):
+            return m.group(0)
+        target = os.path.normpath(os.path.join(css_dir, url)).replace(os.sep, "/")
+        if target not in manifest:
+            return m.group(0)
+        new = os.path.relpath(manifest[target], css_dir).replace(os.sep, "/")
+        return f"url({m.group(1)}{new}{m.group(1)})"
+
+    return CSS_URL_RE.sub(repl, text)
+
+
+def _rewrite_html(text, manifest):
+    # i template usano percorsi relativi tipo "static/css/style.css"
+    for original in sorted(manifest, key=len, reverse=True):
+        text = text.replace(f"static/{original}", f"static/{manifest[original]}")
+    return text
+
+
+def build_assets():
+    """Genera frontend/build e restituisce il manifest {percorso originale: percorso con hash}."""
+    if os.path.isdir(BUILD_DIR):
+        shutil.rmtree(BUILD_DIR)
+
+    files = []
+    for d in HASHED_DIRS:
+        for root, _, names in os.walk(os.path.join(STATIC_DIR, d)):
+            for name in sorted(names):
+                full = os.path.join(root, name)
+                files.append(os.path.relpath(full, STATIC_DIR).replace(os.sep, "/"))
+
+    manifest = {}
+    # prima i file non css, così i css possono puntare alle immagini con hash
+    for rel in sorted(files, key=lambda p: p.endswith(".css")):
+        with open(os.path.join(STATIC_DIR, rel), "rb") as f:
+            data = f.read()
+        if rel.endswith(".css"):
+            data = _rewrite_css(rel, data.decode("utf-8"), manifest).encode("utf-8")
+        manifest[rel] = _hashed_name(rel, data)
+        _write(os.path.join(BUILD_STATIC_DIR, manifest[rel]), data)
+
+    for name in os.listdir(TEMPLATES_DIR):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(TEMPLATES_DIR, name), encoding="utf-8") as f:
+            html = _rewrite_html(f.read(), manifest)
+        _write(os.path.join(BUILD_TEMPLATES_DIR, name), html.encode("utf-8"))
+
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class AssetManifest:
+    """Manifest corrente: un stat() per lettura, ricaricato quando cambia l'mtime del file."""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self._state = (None, {}, frozenset())   # (mtime, manifest, nomi con hash)
+
+    def _current(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        state = self._state
+        if state[0] != mtime:
+            # sostituito in blocco: chi legge in parallelo vede il vecchio o il nuovo, mai metà
+            manifest = load_manifest(self.path) if mtime is not None else {}
+            state = self._state = (mtime, manifest, frozenset(manifest.values()))
+        return state
+
+    @property
+    def manifest(self):
+        return self._current()[1]
+
+    def is_hashed(self, filename):
+        return filename in self._current()[2]
+
+
+if __name__ == "__main__":
+    built = build_assets()
+    print(f"build_assets: {len(built)} file in {os.path.normpath(BUILD_DIR)}")
@@ -0,0 +1,231 @@
+# bench/bench_async.py
+# Confronto tra il deployment sincrono (gunicorn, worker gthread, app:app) e la
+# modalità ASGI di asgi.py (gunicorn + UvicornWorker) con lo stesso numero di
+# worker, sullo stesso database seminato. Entrambi i server girano come
+# processi veri e vengono caricati via HTTP con più richieste concorrenti che
+# worker, così da vedere il tetto di concorrenza delle rotte che aspettano I/O.
+# Prima del carico si verifica che le due modalità diano le stesse risposte.
+#
+#   pip install -r requirements-async.txt
+#   BENCH_DSN=postgresql://... python bench/bench_async.py [--workers 2] [--concurrency 64] [--requests 1000]
+import io
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from datetime import datetime
+
+import psycopg2.extras
+
+from common import BACKEND_DIR, connect, create_schema, point_app_at_bench_db, seed_corsi_data, run_concurrent, summary
+from bench_load import git_commit, RESULTS_DIR
+from hashing import _hashpw
+from storage import store_upload
+
+CORSI = ("BodyBuilding", "Pilates")
+ADMIN = ("bench-admin", "bench-password")
+DEPLOYMENTS = (
+    ("sync", "app:app", []),
+    ("async", "asgi:application", ["-k", "uvicorn.workers.UvicornWorker"]),
+)
+
+
+def seed(conn, args, mesi, pdf_name):
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.execute("""
+        INSERT INTO utenti (nome_cognome, username, email, password_hash, phone, pdf_path, pdf_name)
+        SELECT 'Utente ' || i, 'Utente ' || i, 'user' || i || '@example.com', %s, '333' || lpad(i::text, 7, '0'),
+               %s, 'scheda.pdf'
+        FROM generate_series(0, %s - 1) AS i
+    """, (_hashpw(b"password", args.rounds), pdf_name, args.users))
+    seed_corsi_data(cur, mesi, args.rows_per_month, corsi=CORSI)
+    conn.commit()
+
+
+def request(port, method, path, body=None, cookie=None, local=None):
+    # una connessione keep-alive per thread e per porta
+    conns = local.__dict__.setdefault("conns", {}) if local is not None else {}
+    conn = conns.get(port) or http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    conns[port] = conn
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    if cookie:
+        headers["Cookie"] = cookie
+    try:
+        conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        res = conn.getresponse()
+        data = res.read()
+    except (OSError, http.client.HTTPException):
+        conns.pop(port, None)
+        conn.close()
+        raise
+    if local is None:
+        conn.close()
+    return res.status, res.headers, data
+
+
+def session_cookie(headers):
+    for value in headers.get_all("Set-Cookie") or []:
+        if value.startswith("session="):
+            return value.split(";", 1)[0]
+    return None
+
+
+def start_server(name, target, extra, port, workers, env):
+    cmd = ["gunicorn", "-c", "gunicorn.conf.py", "-w", str(workers), "-b", f"127.0.0.1:{port}"] + extra + [target]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"{name}: il server è terminato\n{proc.stderr.read().decode(errors='replace')}")
+        try:
+            if request(port, "GET", "/me")[0] == 401:
+                return proc
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit(f"{name}: il server non risponde su :{port}")
+
+
+def login_cookies(port, args):
+    status, headers, _ = request(port, "POST", "/admin/login", {"username": ADMIN[0], "password": ADMIN[1]})
+    admin = session_cookie(headers)
+    users = []
+    for i in range(min(args.users, args.logged_users)):
+        status, headers, _ = request(port, "POST", "/login", {"email": f"user{i}@example.com", "password": "password"})
+        if status == 200:
+            users.append(session_cookie(headers))
+    if not admin or not users:
+        raise SystemExit(f"login non riuscito su :{port}")
+    return admin, users
+
+
+def scenarios(args, mesi):
+    # (nome, metodo, path(i), corpo(i), ruolo)
+    return [
+        ("login", "POST", lambda i: "/login",
+         lambda i: {"email": f"user{i % args.users}@example.com", "password": "password"}, None),
+        ("me", "GET", lambda i: "/me", None, "user"),
+        ("scheda", "GET", lambda i: "/scheda", None, "user"),
+        ("course-data GET", "GET",
+         lambda i: f"/admin/course-data/{CORSI[i % len(CORSI)]}?mese={mesi[i % len(mesi)]}", None, "admin"),
+        ("course-batch (Flask)", "GET",
+         lambda i: f"/admin/course-batch?corsi={','.join(CORSI)}&da={mesi[0]}&a={mesi[min(2, len(mesi) - 1)]}",
+         None, "admin"),
+    ]
+
+
+def cookie_for(role, i, cookies):
+    admin, users = cookies
+    return admin if role == "admin" else users[i % len(users)] if role == "user" else None
+
+
+def parity(ports, cookies, args, mesi):
+    # stessa richiesta su entrambe le modalità: stesso status e stesso corpo
+    mismatches = []
+    for name, method, path, body, role in scenarios(args, mesi):
+        answers = [request(port, method, path(0), body(0) if body else None, cookie_for(role, 0, cookies[port]))
+                   for port in ports]
+        (s1, h1, b1), (s2, h2, b2) = answers
+        if "json" in (h1.get("Content-Type") or ""):
+            b1, b2 = json.loads(b1), json.loads(b2)
+        if s1 != s2 or b1 != b2:
+            mismatches.append(name)
+        print(f"  {name:<24} {s1} / {s2} {'OK' if name not in mismatches else 'DIVERSO'}")
+    return mismatches
+
+
+def run_scenario(port, cookies, spec, total, concurrency):
+    name, method, path, body, role = spec
+    local = threading.local()
+    errors = []
+
+    def call(i):
+        try:
+            status = request(port, method, path(i), body(i) if body else None,
+                             cookie_for(role, i, cookies), local)[0]
+        except (OSError, http.client.HTTPException):
+            status = 599
+        if status >= 400:
+            errors.append(status)
+
+    samples, elapsed = run_concurrent(call, total, concurrency)
+    result = summary(name, samples)
+    result.update({"throughput_rps": total / elapsed, "errors": len(errors)})
+    print(f"    {result['throughput_rps']:.1f} req/s, errori={len(errors)}")
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=2000)
+    ap.add_argument("--logged-users", type=int, default=50, help="Sessioni utente usate per /me e /scheda")
+    ap.add_argument("--rows-per-month", type=int, default=300)
+    ap.add_argument("--months", type=int, default=12)
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--workers", type=int, default=2, help="Worker gunicorn per entrambe le modalità")
+    ap.add_argument("--rounds", type=int, default=10)
+    ap.add_argument("--port", type=int, default=8710)
+    ap.add_argument("--output", default=None)
+    args = ap.parse_args()
+
+    from app import generate_months
+    mesi = generate_months()[:args.months]
+    upload_dir = tempfile.mkdtemp(prefix="bench-schede-")
+    pdf_name, _ = store_upload(io.BytesIO(b"%PDF-1.4\n" + os.urandom(200 * 1024)), upload_dir, 0, ".pdf")
+
+    conn = connect()
+    create_schema(conn)
+    seed(conn, args, mesi, pdf_name)
+    point_app_at_bench_db()
+    env = dict(os.environ, UPLOAD_FOLDER=upload_dir, SECRET_KEY="bench-secret", ADMIN_USERNAME=ADMIN[0],
+               ADMIN_PASSWORD=ADMIN[1], MAIL_WORKER="off", MIGRATE_ON_BOOT="0", METRICS="0",
+               BCRYPT_ROUNDS=str(args.rounds), RATE_LIMIT_BACKEND="memory",
+               # nessuna cache delle risposte: si misura il percorso fino al database
+               RESPONSE_CACHE_SIZE="0", RESPONSE_CACHE_DIR=tempfile.mkdtemp(prefix="bench-cache-"))
+
+    procs, ports, cookies = [], [], {}
+    try:
+        for n, (name, target, extra) in enumerate(DEPLOYMENTS):
+            port = args.port + n
+            procs.append(start_server(name, target, extra, port, args.workers, env))
+            ports.append(port)
+            cookies[port] = login_cookies(port, args)
+
+        print("parità delle risposte (sync / async):")
+        mismatches = parity(ports, cookies, args, mesi)
+
+        results = {}
+        for (name, _, _), port in zip(DEPLOYMENTS, ports):
+            print(f"\n{name} ({args.workers} worker, concorrenza {args.concurrency}):")
+            results[name] = {spec[0]: run_scenario(port, cookies[port], spec, args.requests, args.concurrency)
+                             for spec in scenarios(args, mesi)}
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait(timeout=30)
+        conn.close()
+
+    print(f"\n{'scenario':<24} {'rps sync':>10} {'rps async':>10} {'p95 sync':>10} {'p95 async':>10}")
+    for name in results["sync"]:
+        s, a = results["sync"][name], results["async"][name]
+        print(f"{name:<24} {s['throughput_rps']:10.1f} {a['throughput_rps']:10.1f} "
+              f"{s['p95_ms']:8.1f}ms {a['p95_ms']:8.1f}ms")
+
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    report = {"commit": git_commit(), "timestamp": datetime.now().isoformat(timespec="seconds"),
+              "params": vars(args), "parity_mismatches": mismatches, "deployments": results}
+    output = args.output or os.path.join(RESULTS_DIR, f"async-{report['commit']}-{run_id}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"risultati: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# bench/bench_load.py
+# Carico concorrente sulle rotte principali attraverso l'app (test client
+# Flask, stesso pool e stesse query della produzione) su un database seminato
+# con volumi realistici: migliaia di utenti, più corsi, cinque anni di mesi.
+# Per ogni scenario: throughput, p50/p95/p99, errori e query per richiesta
+# (dalle metriche di metrics.py). I risultati vanno in un file JSON, da
+# confrontare con quello di un altro commit:
+#
+#   BENCH_DSN=postgresql://... python bench/bench_load.py [--users 5000] [--requests 500] [--concurrency 16]
+#   BENCH_DSN=postgresql://... python bench/bench_load.py --compare bench/results/<altro>.json
+import io
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+import psycopg2.extras
+
+from common import (BACKEND_DIR, connect, create_schema, point_app_at_bench_db, seed_corsi_data,
+                    run_concurrent, summary)
+from hashing import _hashpw
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, "bench", "results")
+CORSI = ("BodyBuilding", "Pilates", "Yoga", "Karate")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def seed(conn, args, mesi, pdf_name):
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    pw_hash = _hashpw(b"password", args.rounds)
+    cur.execute("""
+        INSERT INTO utenti (nome_cognome, username, email, password_hash, phone, pdf_path, pdf_name)
+        SELECT 'Utente ' || i, 'Utente ' || i, 'user' || i || '@example.com', %s, '333' || lpad(i::text, 7, '0'),
+               %s, 'scheda.pdf'
+        FROM generate_series(0, %s - 1) AS i
+    """, (pw_hash, pdf_name, args.users))
+    # ogni corso ha una parte degli utenti in tutti i mesi (stessi email/cell di utenti)
+    seed_corsi_data(cur, mesi, args.rows_per_month, corsi=CORSI)
+    cur.execute("SELECT id FROM utenti ORDER BY id")
+    user_ids = [r["id"] for r in cur.fetchall()]
+    conn.commit()
+    cur.execute("SELECT COUNT(*) AS n FROM corsi_data")
+    print(f"seed: {len(user_ids)} utenti, {cur.fetchone()['n']} righe corsi_data, "
+          f"{len(CORSI)} corsi x {len(mesi)} mesi")
+    return user_ids
+
+
+def month_rows(n, run):
+    return [{"nome": f"Nome{i}", "cognome": f"Cognome{i}", "email": f"user{i}@example.com",
+             "cell": f"333{i:07d}", "tessera": f"T{run}-{i}", "dataCert": "01/09/2025",
+             "pagato": i % 3 == 0, "importo": "35,00"} for i in range(n)]
+
+
+def query_stats(metrics):
+    # {(rotta, metodo): (richieste, query, secondi DB)}
+    with metrics._lock:
+        queries = {k: (v[2], v[1]) for k, v in metrics.request_queries.series.items()}
+        db_time = {k: v[1] for k, v in metrics.request_db_time.series.items()}
+    return {k: (n, q, db_time.get(k, 0.0)) for k, (n, q) in queries.items()}
+
+
+def run_scenario(gym_app, name, route, method, fn, total, concurrency, login):
+    local = threading.local()
+    errors = []
+
+    def call(i):
+        if not hasattr(local, "client"):
+            local.client = gym_app.app.test_client()
+            login(local.client, i)
+        res = fn(local.client, i)
+        if res.status_code >= 400:
+            errors.append(res.status_code)
+
+    before = query_stats(gym_app.metrics).get((route, method), (0, 0, 0.0))
+    samples, elapsed = run_concurrent(call, total, concurrency)
+    after = query_stats(gym_app.metrics).get((route, method), (0, 0, 0.0))
+    result = summary(name, samples)
+    requests_seen = after[0] - before[0]
+    result.update({
+        "route": route,
+        "method": method,
+        "throughput_rps": total / elapsed,
+        "errors": len(errors),
+        "queries_per_request": (after[1] - before[1]) / requests_seen if requests_seen else None,
+        "db_ms_per_request": (after[2] - before[2]) * 1000 / requests_seen if requests_seen else None,
+    })
+    print(f"    {result['throughput_rps']:.1f} req/s, errori={len(errors)}, "
+          f"query/richiesta={result['queries_per_request'] or 0:.1f}")
+    return result
+
+
+def compare(current, previous_path, max_regression):
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\nconfronto con {previous.get('commit')} ({previous_path}):")
+    regressions = []
+    for name, cur in current["scenarios"].items():
+        old = previous.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        delta = (cur["p95_ms"] - old["p95_ms"]) / old["p95_ms"] if old["p95_ms"] else 0.0
+        print(f"  {name:<28} p95 {old['p95_ms']:8.2f} -> {cur['p95_ms']:8.2f} ms ({delta:+.0%}), "
+              f"rps {old['throughput_rps']:.1f} -> {cur['throughput_rps']:.1f}, "
+              f"query {old.get('queries_per_request')} -> {cur.get('queries_per_request')}")
+        if delta > max_regression:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=5000)
+    ap.add_argument("--rows-per-month", type=int, default=300, help="Membri per corso e mese")
+    ap.add_argument("--years", type=int, default=5)
+    ap.add_argument("--requests", type=int, default=500)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--rounds", type=int, default=int(os.environ.get("BCRYPT_ROUNDS", 12)))
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--output", default=None, help="File JSON dei risultati (default bench/results/<commit>-<data>.json)")
+    ap.add_argument("--compare", default=None, help="Risultati di un altro commit da confrontare")
+    ap.add_argument("--max-regression", type=float, default=0.2, help="Peggioramento p95 tollerato con --compare")
+    args = ap.parse_args()
+    random.seed(args.seed)
+
+    os.environ.setdefault("BCRYPT_ROUNDS", str(args.rounds))
+    os.environ["MAIL_WORKER"] = "off"
+    os.environ["METRICS"] = "1"
+    point_app_at_bench_db()
+    import app as gym_app
+    from app import generate_months
+    from storage import store_upload
+
+    mesi = generate_months(years_ahead=args.years - 1)
+    upload_dir = tempfile.mkdtemp(prefix="bench-schede-")
+    gym_app.UPLOAD_FOLDER = upload_dir
+    pdf_name, _ = store_upload(io.BytesIO(b"%PDF-1.4\n" + os.urandom(200 * 1024)), upload_dir, 0, ".pdf")
+
+    conn = connect()
+    create_schema(conn)
+    user_ids = seed(conn, args, mesi, pdf_name)
+    gym_app.app.config["TESTING"] = True
+
+    def as_admin(client, i):
+        with client.session_transaction() as s:
+            s["admin_logged_in"] = True
+
+    def as_user(client, i):
+        with client.session_transaction() as s:
+            s["user_id"] = user_ids[i % len(user_ids)]
+
+    def anonymous(client, i):
+        pass
+
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    n = args.requests
+    scenarios = [
+        ("register", "/register", "POST", anonymous, max(1, n // 5),
+         lambda c, i: c.post("/register", json={"nome_cognome": f"Nuovo Utente{i}",
+                                                "email": f"new{run_id}-{i}@example.com",
+                                                "password": "password", "phone": f"39{i:08d}"})),
+        ("login", "/login", "POST", anonymous, n,
+         lambda c, i: c.post("/login", json={"email": f"user{random.randrange(args.users)}@example.com",
+                                             "password": "password"})),
+        ("course-data GET", "/admin/course-data/<corso>", "GET", as_admin, n,
+         lambda c, i: c.get(f"/admin/course-data/{random.choice(CORSI)}?mese={random.choice(mesi)}")),
+        ("course-data POST", "/admin/course-data/<corso>", "POST", as_admin, max(1, n // 5),
+         lambda c, i: c.post(f"/admin/course-data/{random.choice(CORSI)}",
+                             json={"mese": random.choice(mesi[1:]), "rows": month_rows(args.rows_per_month, i)})),
+        ("course-data POST Ottobre", "/admin/course-data/<corso>", "POST", as_admin, max(1, n // 50),
+         lambda c, i: c.post(f"/admin/course-data/{random.choice(CORSI)}",
+                             json={"mese": "Ottobre-2025", "rows": month_rows(args.rows_per_month, i)})),
+        ("course-data-single", "/admin/course-data-single/<corso>", "POST", as_admin, n,
+         lambda c, i: c.post(f"/admin/course-data-single/{random.choice(CORSI)}",
+                             json={"mese": random.choice(mesi),
+                                   "row": dict(month_rows(1, i)[0],
+                                               email=f"user{random.randrange(args.users)}@example.com")})),
+        ("scheda", "/scheda", "GET", as_user, n, lambda c, i: c.get("/scheda")),
+    ]
+
+    results = {}
+    for name, route, method, login, total, fn in scenarios:
+        results[name] = run_scenario(gym_app, name, route, method, fn, total, args.concurrency, login)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "params": vars(args),
+        "dataset": {"users": len(user_ids), "corsi": list(CORSI), "mesi": len(mesi)},
+        "scenarios": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}-{run_id}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"risultati: {output}")
+    conn.close()
+
+    if args.compare:
+        regressions = compare(report, args.compare, args.max_regression)
+        if regressions:
+            print(f"regressioni p95 oltre {args.max_regression:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# bench/bench_login.py
+# Latenza p50/p99 di POST /login sotto carico concorrente, con bcrypt eseguito
+# inline (come prima) oppure sul pool dedicato di hashing.py.
+#
+#   BENCH_DSN=postgresql://... python bench/bench_login.py [--users 200] [--requests 400] [--concurrency 16]
+import argparse
+
+from common import connect, create_schema, point_app_at_bench_db, run_concurrent, summary
+from hashing import PasswordHasher, set_hasher, _hashpw
+import app as gym_app
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--rounds", type=int, default=12)
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--max-queue", type=int, default=16)
+    args = ap.parse_args()
+
+    conn = connect()
+    create_schema(conn)
+    cur = conn.cursor()
+    pw_hash = _hashpw(b"password", args.rounds)
+    cur.execute("""
+        INSERT INTO utenti (nome_cognome, username, email, password_hash, phone)
+        SELECT 'Utente ' || i, 'Utente ' || i, 'login' || i || '@example.com', %s, '333' || i
+        FROM generate_series(0, %s - 1) AS i
+    """, (pw_hash, args.users))
+    conn.commit()
+
+    point_app_at_bench_db()
+    gym_app.app.config["TESTING"] = True
+    client_local = __import__("threading").local()
+
+    def login(i):
+        if not hasattr(client_local, "c"):
+            client_local.c = gym_app.app.test_client()
+        res = client_local.c.post("/login", json={"email": f"login{i % args.users}@example.com",
+                                                  "password": "password"})
+        statuses.append(res.status_code)
+
+    for mode in ("inline", "thread", "process"):
+        set_hasher(PasswordHasher(rounds=args.rounds, mode=mode, workers=args.workers,
+                                  max_queue=args.max_queue))
+        statuses = []
+        samples, elapsed = run_concurrent(login, args.requests, args.concurrency)
+        summary(f"bcrypt {mode}", samples)
+        print(f"    {args.requests / elapsed:.1f} req/s, 200={statuses.count(200)} 503={statuses.count(503)}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# bench/bench_register.py
+# Confronta il fan-out BodyBuilding di /register: loop per mese (vecchio) vs
+# INSERT ... SELECT unico (insert_bodybuilding_months), su corsi_data con 100k+ righe.
+#
+#   BENCH_DSN=postgresql://... python bench/bench_register.py [--rows-per-month 2000] [--n 50]
+import argparse
+
+import psycopg2.extras
+
+from common import connect, create_schema, seed_corsi_data, timed, summary
+from app import generate_months, insert_bodybuilding_months
+
+
+def legacy_fan_out(cur, nome, cognome, email, phone, mesi):
+    for mese in mesi:
+        cur.execute("SELECT COALESCE(MAX(row_index), -1)+1 AS idx FROM corsi_data WHERE corso=%s AND mese=%s",
+                    ("BodyBuilding", mese))
+        row_index = cur.fetchone()["idx"]
+        cur.execute("SELECT 1 FROM corsi_data WHERE corso=%s AND nome=%s AND cognome=%s AND cell=%s AND mese=%s",
+                    ("BodyBuilding", nome, cognome, phone, mese))
+        if not cur.fetchone():
+            cur.execute(
+                "INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo) "
+                "VALUES (%s,%s,mese_to_date(%s),%s,%s,%s,%s,%s,%s,0,'')",
+                ("BodyBuilding", row_index, mese, nome, cognome, email, phone, "", "")
+            )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows-per-month", type=int, default=2000)
+    ap.add_argument("--n", type=int, default=50)
+    args = ap.parse_args()
+
+    mesi = generate_months(years_ahead=4)
+    conn = connect()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    create_schema(conn)
+    seed_corsi_data(cur, mesi, args.rows_per_month)
+    conn.commit()
+    cur.execute("SELECT COUNT(*) AS n FROM corsi_data")
+    print(f"corsi_data: {cur.fetchone()['n']} righe, {len(mesi)} mesi")
+
+    def run_legacy(i):
+        legacy_fan_out(cur, "Legacy", f"Utente{i}", f"legacy{i}@example.com", f"390{i:07d}", mesi)
+        conn.commit()
+
+    def run_set_based(i):
+        insert_bodybuilding_months(cur, "Set", f"Utente{i}", f"set{i}@example.com", f"391{i:07d}", mesi)
+        conn.commit()
+
+    legacy = summary("loop per mese", timed(run_legacy, args.n))
+    new = summary("INSERT ... SELECT", timed(run_set_based, args.n))
+    print(f"speedup p50: {legacy['p50_ms'] / new['p50_ms']:.1f}x")
+
+    # stesso risultato: una riga per mese e utente, row_index senza buchi
+    cur.execute("""
+        SELECT COUNT(*) AS n FROM (
+            SELECT mese FROM corsi_data WHERE corso='BodyBuilding'
+            GROUP BY mese HAVING MAX(row_index) + 1 <> COUNT(*)
+        ) x
+    """)
+    assert cur.fetchone()["n"] == 0, "row_index non contigui"
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# bench/bench_save_course.py
+# Confronta il salvataggio di POST /admin/course-data/<corso> per Ottobre-2025:
+# vecchio loop riga per riga + propagazione per mese vs save_course_month (batch + staging).
+# Verifica anche che i due percorsi producano gli stessi dati.
+#
+#   BENCH_DSN=postgresql://... python bench/bench_save_course.py [--members 60] [--n 10]
+import argparse
+
+import psycopg2.extras
+
+from common import connect, create_schema, seed_corsi_data, timed, summary
+from app import generate_months, save_course_month, course_row_values
+
+
+def legacy_save(cur, corso, mese, rows):
+    cur.execute("DELETE FROM corsi_data WHERE corso=%s AND mese=%s", (corso, mese))
+    for r in rows:
+        nome, cognome, email, cell, tessera, dataCert, pagato, importo = course_row_values(r)
+        cur.execute("SELECT COALESCE(MAX(row_index), -1) + 1 AS idx FROM corsi_data WHERE corso=%s AND mese=%s", (corso, mese))
+        idx = cur.fetchone()["idx"]
+        cur.execute(
+            "INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo) VALUES (%s,%s,mese_to_date(%s),%s,%s,%s,%s,%s,%s,%s,%s)",
+            (corso, idx, mese, nome, cognome, email, cell, tessera, dataCert, pagato, importo)
+        )
+        if mese == "Ottobre-2025":
+            for m in generate_months():
+                cur.execute("SELECT row_index FROM corsi_data WHERE corso=%s AND email=%s AND cell=%s AND mese=%s", (corso, email, cell, m))
+                if cur.fetchone():
+                    cur.execute(
+                        "UPDATE corsi_data SET nome=%s, cognome=%s, tessera=%s, datacert=%s WHERE corso=%s AND email=%s AND cell=%s AND mese=%s",
+                        (nome, cognome, tessera, dataCert, corso, email, cell, m)
+                    )
+                else:
+                    cur.execute("SELECT COALESCE(MAX(row_index),-1)+1 AS idx FROM corsi_data WHERE corso=%s AND mese=%s", (corso, m))
+                    new_idx = cur.fetchone()["idx"]
+                    cur.execute(
+                        "INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo) VALUES (%s,%s,mese_to_date(%s),%s,%s,%s,%s,%s,%s,0,'')",
+                        (corso, new_idx, m, nome, cognome, email, cell, tessera, dataCert)
+                    )
+
+
+def make_rows(members, run):
+    rows = []
+    for i in range(members):
+        # metà membri già presenti nel seed, metà nuovi ad ogni run
+        n = i if i % 2 == 0 else 100000 + run * members + i
+        rows.append({"nome": f"Nome{n}", "cognome": f"Cognome{n}", "email": f"user{n}@example.com",
+                     "cell": f"333{n:07d}", "tessera": f"T{run}-{i}", "dataCert": "01/09/2025",
+                     "pagato": i % 3 == 0, "importo": "35,00"})
+    return rows
+
+
+def snapshot(cur, corso):
+    cur.execute("""
+        SELECT mese,row_index,nome,cognome,email,cell,tessera,datacert,pagato,importo
+        FROM corsi_data WHERE corso=%s ORDER BY mese,row_index
+    """, (corso,))
+    return cur.fetchall()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--members", type=int, default=60)
+    ap.add_argument("--n", type=int, default=10)
+    args = ap.parse_args()
+
+    conn = connect()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    create_schema(conn)
+    seed_corsi_data(cur, generate_months(), 40, corsi=("Legacy", "Batch"))
+    conn.commit()
+
+    def run_legacy(i):
+        legacy_save(cur, "Legacy", "Ottobre-2025", make_rows(args.members, i))
+        conn.commit()
+
+    def run_batch(i):
+        save_course_month(cur, "Batch", "Ottobre-2025", make_rows(args.members, i))
+        conn.commit()
+
+    legacy = summary("riga per riga", timed(run_legacy, args.n))
+    new = summary("batch + staging", timed(run_batch, args.n))
+    print(f"speedup p50: {legacy['p50_ms'] / new['p50_ms']:.1f}x")
+
+    assert snapshot(cur, "Legacy") == snapshot(cur, "Batch"), "i due percorsi producono dati diversi"
+    print("dati identici")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench/common.py
+# Helper condivisi dai benchmark: usano un database PostgreSQL usa-e-getta
+# indicato da BENCH_DSN, in uno schema dedicato che viene ricreato ad ogni run.
+import os
+import sys
+import time
+import statistics
+
+import psycopg2
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+BENCH_SCHEMA = os.environ.get("BENCH_SCHEMA", "bench")
+
+
+def connect():
+    dsn = os.environ.get("BENCH_DSN")
+    if not dsn:
+        sys.exit("Imposta BENCH_DSN (es. postgresql://user:pw@localhost/bench_db)")
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+    cur.execute(f"SET search_path TO {BENCH_SCHEMA}")
+    conn.commit()
+    return conn
+
+
+def point_app_at_bench_db():
+    # il pool dell'app legge DB_*; PGOPTIONS fa usare lo schema di benchmark
+    from psycopg2.extensions import parse_dsn
+    params = parse_dsn(os.environ["BENCH_DSN"])
+    for key, env in (("host", "DB_HOST"), ("user", "DB_USER"), ("password", "DB_PASSWORD"),
+                     ("dbname", "DB_NAME"), ("port", "DB_PORT")):
+        if params.get(key):
+            os.environ[env] = params[key]
+    os.environ["PGOPTIONS"] = f"-c search_path={BENCH_SCHEMA}"
+
+
+def run_concurrent(fn, total, concurrency):
+    # esegue fn(i) per i in range(total) con `concurrency` thread, restituisce le latenze in ms
+    from concurrent.futures import ThreadPoolExecutor
+
+    def one(i):
+        t0 = time.perf_counter()
+        fn(i)
+        return (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        samples = list(ex.map(one, range(total)))
+    elapsed = time.perf_counter() - t0
+    return samples, elapsed
+
+
+def create_schema(conn):
+    # stesso schema dell'app, creato nello schema di benchmark
+    from migrations import migrate
+    migrate(conn, log=lambda msg: None)
+
+
+def seed_corsi_data(cur, mesi, rows_per_month, corsi=("BodyBuilding",)):
+    # righe sintetiche: rows_per_month membri per ogni (corso, mese)
+    cur.execute("""
+        INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+        SELECT c.corso, i, mese_to_date(m.mese), 'Nome' || i, 'Cognome' || i, 'user' || i || '@example.com',
+               '333' || lpad(i::text, 7, '0'), '', '', (i % 2), ''
+        FROM unnest(%s::varchar[]) AS c(corso)
+        CROSS JOIN unnest(%s::varchar[]) AS m(mese)
+        CROSS JOIN generate_series(0, %s - 1) AS i
+    """, (list(corsi), list(mesi), rows_per_month))
+    # mesi già scritti: la materializzazione pigra non li deve ricreare
+    cur.execute("""
+        INSERT INTO course_months (corso, mese_data)
+        SELECT c.corso, mese_to_date(m.mese)
+        FROM unnest(%s::varchar[]) AS c(corso) CROSS JOIN unnest(%s::varchar[]) AS m(mese)
+        ON CONFLICT DO NOTHING
+    """, (list(corsi), list(mesi)))
+    cur.execute("ANALYZE corsi_data")
+
+
+def timed(fn, repeat):
+    samples = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def summary(label, samples):
+    samples = sorted(samples)
+    p = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    print(f"{label:<28} n={len(samples):<5} mean={statistics.mean(samples):8.2f}ms "
+          f"p50={p(0.50):8.2f}ms p95={p(0.95):8.2f}ms p99={p(0.99):8.2f}ms")
+    return {"n": len(samples), "mean_ms": statistics.mean(samples),
+            "p50_ms": p(0.50), "p95_ms": p(0.95), "p99_ms": p(0.99)}
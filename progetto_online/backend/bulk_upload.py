@@ -0,0 +1,263 @@
+# bulk_upload.py
+# Caricamento di molte schede con un solo ZIP. I file vengono associati agli
+# utenti tramite un manifest (JSON {"file.pdf": id o email} oppure CSV
+# "file,id_o_email") o, in mancanza, dal nome: "123.pdf", "123_scheda.pdf"
+# oppure "mario.rossi@example.com.pdf". Il lavoro gira in background: le voci
+# sono estratte in parallelo, tutti i pdf_path aggiornati con un solo UPDATE e
+# lo stato del job è salvato in upload_jobs, così qualsiasi worker può
+# rispondere al polling. Ogni aggiornamento del job fa da heartbeat
+# (updated_at): i job fermi da più di stale_seconds, perché il processo che li
+# aveva è morto, vengono segnati come falliti da fail_stale.
+import os
+import io
+import re
+import csv
+import json
+import uuid
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2.extras
+
+from storage import store_upload, release_if_unreferenced, UploadTooLarge
+
+MANIFEST_NAMES = ("manifest.json", "manifest.csv")
+ID_PREFIX_RE = re.compile(r"^(\d+)(?:[_\-. ].*)?$")
+PROGRESS_EVERY = 25
+
+
+class ZipTooLarge(Exception):
+    pass
+
+
+def parse_manifest(text):
+    """Restituisce {nome file: id (int) o email (str)}."""
+    text = (text or "").strip()
+    if not text:
+        return {}
+    if text.startswith("{"):
+        data = json.loads(text)
+    else:
+        data = {row[0].strip(): row[1].strip() for row in csv.reader(io.StringIO(text))
+                if len(row) >= 2 and row[0].strip() and not row[0].startswith("#")}
+    return {name: _target(value) for name, value in data.items()}
+
+
+def _target(value):
+    value = str(value).strip()
+    return int(value) if value.isdigit() else value.lower()
+
+
+def target_from_filename(name):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    m = ID_PREFIX_RE.match(stem)
+    if m:
+        return int(m.group(1))
+    if "@" in stem:
+        return stem.lower()
+    return None
+
+
+class BulkUploader:
+    def __init__(self, get_pool, upload_folder, max_file_bytes, job_workers=1, entry_workers=4,
+                 max_entries=2000, max_uncompressed_bytes=2 * 1024 ** 3, stale_seconds=900):
+        self.get_pool = get_pool
+        self.upload_folder = upload_folder
+        self.max_file_bytes = max_file_bytes
+        self.entry_workers = entry_workers
+        self.max_entries = max_entries
+        self.max_uncompressed_bytes = max_uncompressed_bytes
+        self.stale_seconds = stale_seconds
+        self._jobs = ThreadPoolExecutor(max_workers=job_workers, thread_name_prefix="bulk-upload")
+        self._queued = set()   # job di questo processo ancora in coda nell'executor
+        self._queued_lock = threading.Lock()
+
+    # --- stato job su Postgres ---
+    def _execute(self, sql, params):
+        pool = self.get_pool()
+        conn = pool.getconn()
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            conn.commit()
+            return cur.rowcount
+        finally:
+            pool.putconn(conn)
+
+    def _progress(self, job_id, finished=False, **fields):
+        sets = [f"{k}=%s" for k in fields] + ["updated_at=NOW()"]
+        if finished:
+            sets.append("finished_at=NOW()")
+        values = [psycopg2.extras.Json(v) if k == "errors" else v for k, v in fields.items()]
+        # un job già dato per perso da fail_stale resta fallito
+        self._execute(f"UPDATE upload_jobs SET {', '.join(sets)} WHERE id=%s AND state='running'",
+                      values + [job_id])
+        # heartbeat anche per i job in coda dietro a questo, che non sono fermi
+        with self._queued_lock:
+            queued = list(self._queued)
+        if queued:
+            self._execute("UPDATE upload_jobs SET updated_at=NOW() WHERE id = ANY(%s) AND state='queued'",
+                          (queued,))
+
+    def _claim(self, job_id):
+        # parte solo se è ancora in coda: un job segnato come fallito non va elaborato
+        return self._execute("UPDATE upload_jobs SET state='running', updated_at=NOW() WHERE id=%s AND state='queued'",
+                             (job_id,)) == 1
+
+    def fail_stale(self):
+        """Segna come falliti i job in coda o in corso fermi da più di stale_seconds; restituisce quanti."""
+        error = psycopg2.extras.Json([{"file": None, "error": "Job interrotto: il worker non risponde"}])
+        return self._execute("""
+            UPDATE upload_jobs SET state='failed', finished_at=NOW(), updated_at=NOW(),
+                   errors = COALESCE(errors, '[]'::jsonb) || %s::jsonb
+            WHERE state IN ('queued', 'running') AND updated_at < NOW() - make_interval(secs => %s)
+        """, (error, self.stale_seconds))
+
+    def check_zip(self, zf):
+        """Solleva ZipTooLarge se lo ZIP ha troppe voci o decompresso supera max_uncompressed_bytes."""
+        infos = zf.infolist()
+        if len(infos) > self.max_entries:
+            raise ZipTooLarge(f"Lo ZIP contiene più di {self.max_entries} file")
+        # file_size è la dimensione dichiarata, ma ZipFile non decomprime oltre: il limite è reale
+        if sum(i.file_size for i in infos) > self.max_uncompressed_bytes:
+            raise ZipTooLarge(f"Lo ZIP decompresso supera {self.max_uncompressed_bytes // (1024 * 1024)} MB")
+
+    def submit(self, zip_path, manifest=None):
+        self.fail_stale()
+        job_id = str(uuid.uuid4())
+        self._execute("INSERT INTO upload_jobs (id, state, spool_name) VALUES (%s, 'queued', %s)",
+                      (job_id, os.path.basename(zip_path)))
+        with self._queued_lock:
+            self._queued.add(job_id)
+        self._jobs.submit(self._run, job_id, zip_path, manifest or {})
+        return job_id
+
+    # --- elaborazione ---
+    def _run(self, job_id, zip_path, manifest):
+        with self._queued_lock:
+            self._queued.discard(job_id)
+        errors = []
+        try:
+            if not self._claim(job_id):
+                return
+            with zipfile.ZipFile(zip_path) as zf:
+                self.check_zip(zf)
+                names = [i.filename for i in zf.infolist()
+                         if not i.is_dir() and not os.path.basename(i.filename).startswith(".")
+                         and not i.filename.startswith("__MACOSX/")]
+                for candidate in MANIFEST_NAMES:
+                    if candidate in names:
+                        names.remove(candidate)
+                        if not manifest:
+                            manifest = parse_manifest(zf.read(candidate).decode("utf-8-sig"))
+            self._progress(job_id, total=len(names))
+
+            stored = []   # (target, nome salvato, nome originale)
+            lock = threading.Lock()
+            done = [0]
+            local = threading.local()
+            handles = []
+
+            def process(name):
+                # ogni thread usa il proprio handle: ZipFile non è thread-safe in lettura
+                if not hasattr(local, "zf"):
+                    local.zf = zipfile.ZipFile(zip_path)
+                    with lock:
+                        handles.append(local.zf)
+                base = os.path.basename(name)
+                target = manifest.get(name, manifest.get(base)) if manifest else None
+                if target is None:
+                    target = target_from_filename(base)
+                try:
+                    if target is None:
+                        raise ValueError("utente non riconosciuto dal nome del file")
+                    with local.zf.open(name) as entry:
+                        stored_name, _ = store_upload(entry, self.upload_folder, self.max_file_bytes,
+                                                      os.path.splitext(base)[1].lower())
+                    with lock:
+                        stored.append((target, stored_name, base))
+                except (ValueError, UploadTooLarge, OSError, zipfile.BadZipFile) as e:
+                    with lock:
+                        errors.append({"file": name, "error": str(e)})
+                with lock:
+                    done[0] += 1
+                    report = done[0] % PROGRESS_EVERY == 0
+                if report:
+                    self._progress(job_id, processed=done[0])
+
+            try:
+                with ThreadPoolExecutor(max_workers=self.entry_workers) as ex:
+                    list(ex.map(process, names))
+            finally:
+                for zf in handles:
+                    zf.close()
+
+            updated = self._apply(stored, errors)
+            self._progress(job_id, state="done", processed=len(names), updated=updated,
+                           errors=errors, finished=True)
+        except Exception as e:
+            errors.append({"file": None, "error": str(e)})
+            self._progress(job_id, state="failed", errors=errors, finished=True)
+        finally:
+            try:
+                os.unlink(zip_path)
+            except OSError:
+                pass
+
+    def _apply(self, stored, errors):
+        if not stored:
+            return 0
+        pool = self.get_pool()
+        conn = pool.getconn()
+        try:
+            cur = conn.cursor()
+            # id o email -> id utente, in una query
+            ids = [t for t, _, _ in stored if isinstance(t, int)]
+            emails = [t for t, _, _ in stored if isinstance(t, str)]
+            cur.execute("""
+                SELECT id, LOWER(email), pdf_path FROM utenti
+                WHERE id = ANY(%s::int[]) OR LOWER(email) = ANY(%s::varchar[])
+                FOR UPDATE
+            """, (ids, emails))
+            by_id, by_email, old_paths = {}, {}, set()
+            for user_id, email, pdf_path in cur.fetchall():
+                by_id[user_id] = user_id
+                by_email[email] = user_id
+                if pdf_path:
+                    old_paths.add(pdf_path)
+
+            rows = {}
+            for target, stored_name, original in stored:
+                user_id = by_id.get(target) if isinstance(target, int) else by_email.get(target)
+                if user_id is None:
+                    errors.append({"file": original, "error": f"utente {target} non trovato"})
+                    continue
+                rows[user_id] = (user_id, stored_name, original)   # a parità di utente vince l'ultimo
+
+            if rows:
+                psycopg2.extras.execute_values(cur, """
+                    UPDATE utenti AS u SET pdf_path = v.pdf_path, pdf_name = v.pdf_name
+                    FROM (VALUES %s) AS v(id, pdf_path, pdf_name)
+                    WHERE u.id = v.id
+                """, list(rows.values()), template="(%s::int, %s, %s)")
+            conn.commit()
+
+            new_paths = {r[1] for r in rows.values()}
+            for old in old_paths - new_paths:
+                try:
+                    release_if_unreferenced(cur, self.upload_folder, old)
+                except OSError:
+                    pass
+            conn.commit()
+            return len(rows)
+        finally:
+            pool.putconn(conn)
+
+
+def job_status(cur, job_id):
+    cur.execute("""
+        SELECT id, state, total, processed, updated, errors, created_at, updated_at, finished_at
+        FROM upload_jobs WHERE id=%s
+    """, (job_id,))
+    return cur.fetchone()
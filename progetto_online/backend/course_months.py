@@ -0,0 +1,136 @@
+# course_months.py
+# Materializzazione pigra dei mesi di corsi_data. L'iscrizione di un membro a
+# un corso è salvata una volta in course_enrollments (intervallo di mesi); le
+# righe di un mese vengono create alla prima lettura o scrittura di quel mese
+# e il mese è segnato in course_months. Sui mesi già materializzati le
+# iscrizioni vanno scritte subito, come prima.
+#
+# Le righe create qui sono quelle che avrebbe scritto la registrazione o la
+# propagazione da Ottobre-2025: un membro per (email, cell), in ordine di
+# iscrizione, pagato 0 e importo vuoto.
+from row_index import allocate_row_index_blocks
+
+COURSE_LOCK_CLASS = 72015002
+
+
+def _value(row):
+    return list(row.values())[0] if isinstance(row, dict) else row[0]
+
+
+def lock_course(cur, corso):
+    # serializza materializzazione e nuove iscrizioni dello stesso corso fino al commit
+    cur.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s))", (COURSE_LOCK_CLASS, corso))
+
+
+def materialized_months(cur, corso, mesi):
+    """Restituisce l'insieme dei mesi (date) di mesi già materializzati."""
+    cur.execute("SELECT mese_data FROM course_months WHERE corso = %s AND mese_data = ANY(%s::date[])",
+                (corso, list(mesi)))
+    return {_value(r) for r in cur.fetchall()}
+
+
+def mark_materialized(cur, corso, mesi):
+    # per chi riscrive il mese da zero: nessuna riga da creare
+    lock_course(cur, corso)
+    cur.execute("""
+        INSERT INTO course_months (corso, mese_data)
+        SELECT %s, d FROM unnest(%s::date[]) AS d
+        ON CONFLICT DO NOTHING
+    """, (corso, list(mesi)))
+
+
+# righe che materialize_months creerebbe nei mesi non ancora materializzati,
+# lette senza scriverle (esportazione): stesso membro per (email, cell) e
+# stesso ordine nel mese (pos), pagato 0 e importo vuoto
+PENDING_ROWS_SQL = """
+    SELECT c.corso, m.d AS mese_data, x.nome, x.cognome, x.email, x.cell, x.tessera, x.datacert,
+           ROW_NUMBER() OVER (PARTITION BY c.corso, m.d ORDER BY x.id) - 1 AS pos
+    FROM unnest(%(corsi)s::varchar[]) AS c(corso)
+    CROSS JOIN unnest(%(mesi)s::date[]) AS m(d)
+    CROSS JOIN LATERAL (
+        SELECT DISTINCT ON (e.email, e.cell) e.id, e.nome, e.cognome, e.email, e.cell, e.tessera, e.datacert
+        FROM course_enrollments e
+        WHERE e.corso = c.corso AND m.d BETWEEN e.from_mese AND e.to_mese
+        ORDER BY e.email, e.cell, e.id
+    ) x
+    WHERE NOT EXISTS (SELECT 1 FROM course_months cm WHERE cm.corso = c.corso AND cm.mese_data = m.d)
+"""
+
+
+def materialize_months(cur, corso, mesi):
+    """Crea le righe dei mesi non ancora materializzati; restituisce i mesi materializzati ora."""
+    mesi = sorted(set(mesi))
+    if not mesi or len(materialized_months(cur, corso, mesi)) == len(mesi):
+        return []
+    lock_course(cur, corso)
+    cur.execute("""
+        INSERT INTO course_months (corso, mese_data)
+        SELECT %s, d FROM unnest(%s::date[]) AS d
+        ON CONFLICT DO NOTHING
+        RETURNING mese_data
+    """, (corso, mesi))
+    nuovi = sorted(_value(r) for r in cur.fetchall())
+    if not nuovi:
+        return []
+
+    # un membro per (email, cell) per mese: conta la prima iscrizione che copre il mese
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS staging_month_members (
+            mese VARCHAR(20), enrollment_id INT, pos INT
+        ) ON COMMIT DELETE ROWS
+    """)
+    cur.execute("TRUNCATE staging_month_members")
+    cur.execute("""
+        INSERT INTO staging_month_members (mese, enrollment_id, pos)
+        SELECT date_to_mese(m.d), x.id, ROW_NUMBER() OVER (PARTITION BY m.d ORDER BY x.id) - 1
+        FROM unnest(%(mesi)s::date[]) AS m(d)
+        CROSS JOIN LATERAL (
+            SELECT DISTINCT ON (e.email, e.cell) e.id
+            FROM course_enrollments e
+            WHERE e.corso = %(corso)s AND m.d BETWEEN e.from_mese AND e.to_mese
+            ORDER BY e.email, e.cell, e.id
+        ) x
+    """, {"corso": corso, "mesi": nuovi})
+    cur.execute("SELECT mese, COUNT(*) AS n FROM staging_month_members GROUP BY mese")
+    counts = {}
+    for r in cur.fetchall():
+        mese, n = (r["mese"], r["n"]) if isinstance(r, dict) else r
+        counts[mese] = n
+    blocchi = allocate_row_index_blocks(cur, corso, counts)
+    if blocchi:
+        cur.execute("""
+            INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+            SELECT %s, b.first_index + s.pos, mese_to_date(s.mese), e.nome, e.cognome, e.email, e.cell,
+                   e.tessera, e.datacert, 0, ''
+            FROM staging_month_members s
+            JOIN course_enrollments e ON e.id = s.enrollment_id
+            JOIN unnest(%s::varchar[], %s::int[]) AS b(mese, first_index) ON b.mese = s.mese
+        """, (corso, list(blocchi), list(blocchi.values())))
+    return nuovi
+
+
+def enroll(cur, corso, members, da, a):
+    """Iscrive i membri [(nome, cognome, email, cell, tessera, datacert)] dal mese da al mese a (date).
+
+    Chi ha già un'iscrizione che copre tutto l'intervallo viene saltato.
+    """
+    if not members:
+        return 0
+    lock_course(cur, corso)
+    cols = list(zip(*members))
+    cur.execute("""
+        INSERT INTO course_enrollments (corso, nome, cognome, email, cell, tessera, datacert, from_mese, to_mese)
+        SELECT %(corso)s, m.nome, m.cognome, m.email, m.cell, m.tessera, m.datacert, %(da)s, %(a)s
+        FROM unnest(%(nome)s::varchar[], %(cognome)s::varchar[], %(email)s::varchar[], %(cell)s::varchar[],
+                    %(tessera)s::varchar[], %(datacert)s::varchar[])
+             WITH ORDINALITY AS m(nome, cognome, email, cell, tessera, datacert, ord)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM course_enrollments e
+            WHERE e.corso = %(corso)s AND e.email IS NOT DISTINCT FROM m.email AND e.cell IS NOT DISTINCT FROM m.cell
+              AND e.from_mese <= %(da)s AND e.to_mese >= %(a)s
+        )
+        ORDER BY m.ord
+    """, {"corso": corso, "da": da, "a": a,
+          "nome": list(cols[0]), "cognome": list(cols[1]), "email": list(cols[2]),
+          "cell": list(cols[3]), "tessera": list(cols[4]), "datacert": list(cols[5])})
+    return cur.rowcount
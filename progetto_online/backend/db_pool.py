@@ -0,0 +1,218 @@
+# db_pool.py
+import os
+import time
+import threading
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Pool di connessioni PostgreSQL per processo (thread-safe)."""
+
+    def __init__(self, minconn=1, maxconn=10, max_lifetime=1800, timeout=10.0,
+                 health_check=True, **connect_kwargs):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError("DB pool: dimensioni non valide")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.health_check = health_check
+        self.connect_kwargs = connect_kwargs
+
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._idle = []          # [(conn, created_at)]
+        self._created = {}       # id(conn) -> created_at
+        self._reserved = 0       # connessioni in apertura, già contate nel massimo
+        self._stats = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "expired": 0,
+            "resets": 0,
+        }
+
+        for _ in range(minconn):
+            conn = self._connect()
+            self._idle.append((conn, self._created[id(conn)]))
+
+    # --- interni ---
+    # Sotto self._cond si toccano solo _idle, _created, _reserved e _stats:
+    # connessione, health check, rollback e close avvengono fuori dal lock,
+    # così un server lento non blocca gli altri thread del pool.
+    def _connect(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        with self._cond:
+            self._created[id(conn)] = time.monotonic()
+            self._stats["connections_created"] += 1
+        return conn
+
+    def _discard(self, conn, reason=None):
+        with self._cond:
+            self._created.pop(id(conn), None)
+            self._stats["connections_closed"] += 1
+            if reason:
+                self._stats[reason] += 1
+            # si è liberato un posto per chi aspetta
+            self._cond.notify()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, created_at):
+        return bool(self.max_lifetime) and time.monotonic() - created_at > self.max_lifetime
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if not self.health_check:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _checkout(self, deadline):
+        # sotto lock: una connessione inattiva, oppure None con un posto prenotato
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if len(self._created) + self._reserved < self.maxconn:
+                    self._reserved += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout("Nessuna connessione disponibile nel pool")
+                self._stats["waits"] += 1
+                self._cond.wait(remaining)
+
+    # --- API ---
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            idle = self._checkout(deadline)
+            if idle is None:
+                try:
+                    conn = self._connect()
+                finally:
+                    with self._cond:
+                        self._reserved -= 1
+                        # se la connessione è fallita il posto torna libero
+                        self._cond.notify()
+                break
+            conn, created_at = idle
+            if self._expired(created_at):
+                self._discard(conn, "expired")
+                continue
+            if not self._is_healthy(conn):
+                self._discard(conn, "health_check_failures")
+                continue
+            break
+        with self._cond:
+            self._stats["checkouts"] += 1
+        return conn
+
+    def putconn(self, conn, close=False):
+        with self._cond:
+            created_at = self._created.get(id(conn))
+        if created_at is None:
+            return
+        if close or conn.closed or self._expired(created_at):
+            self._discard(conn)
+            return
+        try:
+            # riporta la connessione allo stato pulito
+            status = conn.get_transaction_status()
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                raise psycopg2.InterfaceError("connessione in stato sconosciuto")
+            reset = status != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+            if reset:
+                conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            if reset:
+                self._stats["resets"] += 1
+            self._idle.append((conn, created_at))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            total = len(self._created) + self._reserved
+            idle = len(self._idle)
+            return dict(self._stats,
+                        pid=self._pid,
+                        min_size=self.minconn,
+                        max_size=self.maxconn,
+                        max_lifetime=self.max_lifetime,
+                        size=total,
+                        idle=idle,
+                        in_use=total - idle)
+
+
+def connect_kwargs_from_env():
+    return dict(
+        host=os.environ.get("DB_HOST"),
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PASSWORD"),
+        dbname=os.environ.get("DB_NAME"),
+        port=os.environ.get("DB_PORT"),
+    )
+
+
+def pool_from_env():
+    extra = {"connection_factory": _connection_factory} if _connection_factory else {}
+    return ConnectionPool(
+        minconn=int(os.environ.get("DB_POOL_MIN", 1)),
+        maxconn=int(os.environ.get("DB_POOL_MAX", 10)),
+        max_lifetime=int(os.environ.get("DB_POOL_MAX_LIFETIME", 1800)),
+        timeout=float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+        health_check=os.environ.get("DB_POOL_HEALTH_CHECK", "1") != "0",
+        **connect_kwargs_from_env(),
+        **extra
+    )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_connection_factory = None
+
+
+def set_connection_factory(factory):
+    """Classe di connessione psycopg2 per i pool creati da qui in poi (es. metrics.py)."""
+    global _connection_factory
+    _connection_factory = factory
+
+
+def get_pool():
+    """Restituisce il pool del processo corrente (ricreato dopo un fork di gunicorn)."""
+    global _pool
+    if _pool is None or _pool._pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool._pid != os.getpid():
+                _pool = pool_from_env()
+    return _pool
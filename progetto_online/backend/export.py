@@ -0,0 +1,145 @@
+# export.py
+# Esportazione in streaming delle righe di corsi_data in CSV o XLSX. Le righe
+# arrivano da un cursore con nome (lato server) e vengono scritte a blocchi:
+# la memoria resta costante qualunque sia il numero di righe e il primo blocco
+# parte prima che la query sia finita. L'XLSX è scritto direttamente come ZIP
+# in streaming (stringhe inline, nessuna tabella condivisa), senza dipendenze.
+import io
+import re
+import csv
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+EXPORT_CHUNK_ROWS = 500
+
+# (colonna della query, intestazione)
+EXPORT_COLUMNS = (
+    ("corso", "Corso"),
+    ("mese", "Mese"),
+    ("nome", "Nome"),
+    ("cognome", "Cognome"),
+    ("email", "Email"),
+    ("cell", "Cellulare"),
+    ("tessera", "Numero Tessera"),
+    ("datacert", "Data Certificato"),
+    ("pagato", "Pagato"),
+    ("importo_num", "Importo"),
+)
+
+XML_INVALID_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _cell(row, col):
+    value = row[col]
+    if col == "pagato":
+        return "Sì" if value else "No"
+    return "" if value is None else value
+
+
+def csv_chunks(rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    """CSV UTF-8 con BOM (Excel lo apre con gli accenti corretti), a blocchi di chunk_rows righe."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([title for _, title in EXPORT_COLUMNS])
+    yield "\ufeff" + buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    n = 0
+    for row in rows:
+        writer.writerow([_cell(row, col) for col, _ in EXPORT_COLUMNS])
+        n += 1
+        if n % chunk_rows == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+class _Sink(io.RawIOBase):
+    # destinazione non posizionabile per zipfile: i byte scritti si raccolgono
+    # e vengono ceduti a ogni drain()
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Corsi" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'),
+}
+
+
+def _xlsx_row(values):
+    cells = []
+    for v in values:
+        if isinstance(v, (int, float, Decimal)) and not isinstance(v, bool):
+            cells.append(f'<c t="n"><v>{v}</v></c>')
+        else:
+            text = escape(XML_INVALID_RE.sub("", str(v)))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return "<row>" + "".join(cells) + "</row>"
+
+
+def xlsx_chunks(rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Cartella XLSX con un foglio, a blocchi di chunk_rows righe."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, xml in _XLSX_PARTS.items():
+            zf.writestr(name, xml)
+        yield sink.drain()
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                         '<sheetData>').encode("utf-8"))
+            sheet.write(_xlsx_row([title for _, title in EXPORT_COLUMNS]).encode("utf-8"))
+            n = 0
+            for row in rows:
+                sheet.write(_xlsx_row([_cell(row, col) for col, _ in EXPORT_COLUMNS]).encode("utf-8"))
+                n += 1
+                if n % chunk_rows == 0:
+                    data = sink.drain()
+                    if data:
+                        yield data
+            sheet.write(b"</sheetData></worksheet>")
+    yield sink.drain()
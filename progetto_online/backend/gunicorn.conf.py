@@ -0,0 +1,51 @@
+# gunicorn.conf.py
+# Applica le migrazioni una volta, nel master, prima di avviare i worker, e
+# crea le partizioni di corsi_data per i prossimi PARTITIONS_AHEAD mesi.
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# I worker sono gthread: ogni processo serve GUNICORN_THREADS richieste insieme.
+# Il pool di hashing.py è limitato per processo (HASH_WORKERS calcoli più
+# HASH_MAX_QUEUE in coda, poi 503): con worker sync un processo ha una sola
+# richiesta alla volta e quel limite non scatterebbe mai. I thread devono
+# essere più degli slot di hashing (restano thread liberi per le altre rotte)
+# e non più di DB_POOL_MAX (una connessione per richiesta). Un -k da riga di
+# comando (UvicornWorker per asgi.py) ha la precedenza.
+import os
+
+import psycopg2
+from dotenv import load_dotenv
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+load_dotenv(os.path.join(BASE_DIR, "key.env"))
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+
+def check_hashing_bound(server):
+    cfg = server.cfg
+    slots = int(os.environ.get("HASH_WORKERS", 2)) + int(os.environ.get("HASH_MAX_QUEUE", 4))
+    if cfg.worker_class_str == "sync" or (cfg.worker_class_str == "gthread" and cfg.threads <= slots):
+        server.log.warning(f"hashing: con worker {cfg.worker_class_str} e {cfg.threads} thread il limite "
+                           f"di {slots} slot per processo non viene mai raggiunto (GUNICORN_THREADS > {slots})")
+
+
+def on_starting(server):
+    from db_pool import connect_kwargs_from_env
+    from migrations import migrate
+    from partitions import ensure_partitions, add_months
+    from datetime import date
+
+    check_hashing_bound(server)
+    if os.environ.get("MIGRATE_ON_BOOT", "1") == "0":
+        return
+    conn = psycopg2.connect(**connect_kwargs_from_env())
+    try:
+        migrate(conn, log=server.log.info)
+        oggi = date.today().replace(day=1)
+        created = ensure_partitions(conn.cursor(), oggi, add_months(oggi, int(os.environ.get("PARTITIONS_AHEAD", 12))))
+        conn.commit()
+        if created:
+            server.log.info(f"partizioni create: {', '.join(created)}")
+    finally:
+        conn.close()
@@ -0,0 +1,159 @@
+# hashing.py
+# Hash/verifica bcrypt su un pool dedicato e limitato: se il pool e la sua coda
+# sono pieni la richiesta viene rifiutata subito (HashingBusy -> 503) invece di
+# occupare il worker. Il costo è configurabile e gli hash con costo diverso
+# vengono rigenerati al login riuscito (needs_rehash).
+# Il limite è per processo: ha senso solo se un processo serve più richieste
+# insieme (worker gthread di gunicorn.conf.py con GUNICORN_THREADS maggiore di
+# HASH_WORKERS + HASH_MAX_QUEUE, oppure la modalità ASGI di asgi.py).
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+
+
+# password_hash degli utenti creati dall'admin (import, righe singole): non è
+# un hash bcrypt, quindi nessuna password corrisponde finché l'utente non si registra
+UNUSABLE_PASSWORD = "!"
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def usable_hash(hashed):
+    return bool(hashed) and hashed.startswith("$2")
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+class PasswordHasher:
+    def __init__(self, rounds=12, mode="thread", workers=2, max_queue=16, timeout=10.0):
+        self.rounds = rounds
+        self.mode = mode
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._pid = os.getpid()
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        if mode == "process":
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        elif mode == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        elif mode == "inline":
+            self._executor = None
+        else:
+            raise ValueError(f"HASH_EXECUTOR non valido: {mode}")
+
+    def _done(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _submit(self, fn, *args, submit=None):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HashingBusy("Troppe richieste di autenticazione in corso")
+        try:
+            future = (submit or self._executor.submit)(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_flight += 1
+        # lo slot si libera quando il calcolo finisce davvero, anche dopo un timeout
+        future.add_done_callback(self._done)
+        return future
+
+    def _run(self, fn, *args):
+        if self._executor is None:
+            return fn(*args)
+        try:
+            return self._submit(fn, *args).result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HashingBusy("Timeout del calcolo hash")
+
+    async def _run_async(self, fn, *args):
+        # modalità ASGI: si attende il pool senza occupare l'event loop
+        if self._executor is None:
+            # inline: nessun pool dedicato, il calcolo va sull'executor del loop
+            # ma con gli stessi slot; shield perché il timeout non liberi lo
+            # slot mentre il thread sta ancora calcolando
+            loop = asyncio.get_running_loop()
+            future = asyncio.shield(self._submit(fn, *args, submit=lambda *a: loop.run_in_executor(None, *a)))
+        else:
+            future = asyncio.wrap_future(self._submit(fn, *args))
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise HashingBusy("Timeout del calcolo hash")
+
+    def hash(self, password):
+        return self._run(_hashpw, password.encode("utf-8"), self.rounds)
+
+    def verify(self, password, hashed):
+        if not usable_hash(hashed):
+            return False
+        return self._run(_checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+
+    async def hash_async(self, password):
+        return await self._run_async(_hashpw, password.encode("utf-8"), self.rounds)
+
+    async def verify_async(self, password, hashed):
+        if not usable_hash(hashed):
+            return False
+        return await self._run_async(_checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+
+    def needs_rehash(self, hashed):
+        # formato: $2b$<costo>$<salt+hash>
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {"mode": self.mode, "rounds": self.rounds, "workers": self.workers,
+                    "max_queue": self.max_queue, "in_flight": self._in_flight,
+                    "rejected": self._rejected}
+
+
+def hasher_from_env():
+    return PasswordHasher(
+        rounds=int(os.environ.get("BCRYPT_ROUNDS", 12)),
+        mode=os.environ.get("HASH_EXECUTOR", "thread"),
+        workers=int(os.environ.get("HASH_WORKERS", 2)),
+        max_queue=int(os.environ.get("HASH_MAX_QUEUE", 4)),
+        timeout=float(os.environ.get("HASH_TIMEOUT", 10)),
+    )
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    """Hasher del processo corrente (ricreato dopo un fork, come il pool DB)."""
+    global _hasher
+    if _hasher is None or _hasher._pid != os.getpid():
+        with _hasher_lock:
+            if _hasher is None or _hasher._pid != os.getpid():
+                _hasher = hasher_from_env()
+    return _hasher
+
+
+def set_hasher(hasher):
+    global _hasher
+    _hasher = hasher
@@ -0,0 +1,198 @@
+# mailer.py
+# Coda di posta in uscita su Postgres (mail_queue). Le rotte inseriscono i
+# messaggi; un worker in background li preleva a blocchi (FOR UPDATE SKIP
+# LOCKED), li invia su una sola connessione SMTP per blocco rispettando
+# MAIL_RATE_PER_MINUTE e, in caso di errore, li riprova con backoff
+# esponenziale fino a MAIL_MAX_ATTEMPTS. Possono esserci più worker (uno per
+# processo gunicorn con MAIL_WORKER=thread) ma invia uno solo alla volta,
+# sotto un advisory lock: il limite di velocità vale per tutta l'applicazione.
+#
+# Per provarlo in locale con un server SMTP finto:
+#   python -m aiosmtpd -n -l localhost:1025
+#   MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=0 flask mail-worker
+import os
+import time
+import threading
+
+import psycopg2.extras
+from flask_mail import Message
+
+MAIL_LOCK_ID = 72015003
+
+
+def enqueue(cur, messages):
+    """messages: [(destinatario, oggetto, testo)]; restituisce gli id inseriti."""
+    if not messages:
+        return []
+    rows = psycopg2.extras.execute_values(
+        cur,
+        "INSERT INTO mail_queue (recipient, subject, body) VALUES %s RETURNING id",
+        messages, fetch=True
+    )
+    return [r["id"] if isinstance(r, dict) else r[0] for r in rows]
+
+
+class MailWorker:
+    def __init__(self, app, mail, get_pool, batch_size=50, rate_per_minute=60,
+                 max_attempts=5, backoff_seconds=30, idle_seconds=10, stale_seconds=600):
+        self.app = app
+        self.mail = mail
+        self.get_pool = get_pool
+        self.batch_size = batch_size
+        self.rate_per_minute = rate_per_minute
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.idle_seconds = idle_seconds
+        # un blocco resta "sending" per tutto l'invio: se l'advisory lock si perde
+        # (connessione caduta) un altro worker non deve riprenderlo prima che il
+        # blocco possa essere finito, quindi la finestra copre due blocchi interi
+        batch_seconds = batch_size * 60.0 / rate_per_minute if rate_per_minute else 0
+        self.stale_seconds = max(stale_seconds, 2 * batch_seconds)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    # --- accesso al DB ---
+    def _claim(self):
+        pool = self.get_pool()
+        conn = pool.getconn()
+        try:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            # i messaggi rimasti in "sending" da un worker morto tornano disponibili
+            cur.execute("""
+                UPDATE mail_queue SET status='pending'
+                WHERE status='sending' AND claimed_at < NOW() - make_interval(secs => %s)
+            """, (self.stale_seconds,))
+            cur.execute("""
+                UPDATE mail_queue SET status='sending', claimed_at=NOW(), attempts=attempts+1
+                WHERE id IN (
+                    SELECT id FROM mail_queue
+                    WHERE status='pending' AND next_attempt_at <= NOW()
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, recipient, subject, body, attempts
+            """, (self.batch_size,))
+            batch = cur.fetchall()
+            conn.commit()
+            return sorted(batch, key=lambda m: m["id"])
+        finally:
+            pool.putconn(conn)
+
+    def _record(self, sent_ids, failures):
+        pool = self.get_pool()
+        conn = pool.getconn()
+        try:
+            cur = conn.cursor()
+            if sent_ids:
+                cur.execute("""
+                    UPDATE mail_queue SET status='sent', sent_at=NOW(), last_error=NULL
+                    WHERE id = ANY(%s::int[])
+                """, (sent_ids,))
+            for msg, error in failures:
+                if msg["attempts"] >= self.max_attempts:
+                    cur.execute("UPDATE mail_queue SET status='failed', last_error=%s WHERE id=%s",
+                                (error[:1000], msg["id"]))
+                else:
+                    delay = self.backoff_seconds * 2 ** (msg["attempts"] - 1)
+                    cur.execute("""
+                        UPDATE mail_queue SET status='pending', last_error=%s,
+                               next_attempt_at = NOW() + make_interval(secs => %s)
+                        WHERE id=%s
+                    """, (error[:1000], delay, msg["id"]))
+            conn.commit()
+        finally:
+            pool.putconn(conn)
+
+    # --- invio ---
+    def drain_once(self):
+        """Invia un blocco di messaggi; restituisce quanti ne ha prelevati (0 se sta inviando un altro worker)."""
+        pool = self.get_pool()
+        conn = pool.getconn()
+        locked = False
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (MAIL_LOCK_ID,))
+            locked = cur.fetchone()[0]
+            conn.commit()
+            if not locked:
+                return 0
+            return self._drain_locked()
+        finally:
+            released = True
+            if locked:
+                try:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (MAIL_LOCK_ID,))
+                    conn.commit()
+                except Exception:
+                    released = False
+            # se l'unlock non è riuscito la connessione si chiude, e il lock con lei
+            pool.putconn(conn, close=not released)
+
+    def _drain_locked(self):
+        batch = self._claim()
+        if not batch:
+            return 0
+        interval = 60.0 / self.rate_per_minute if self.rate_per_minute else 0
+        sent_ids, failures = [], []
+        with self.app.app_context():
+            try:
+                # una sola connessione SMTP per tutto il blocco
+                with self.mail.connect() as smtp:
+                    for msg in batch:
+                        try:
+                            smtp.send(Message(msg["subject"], recipients=[msg["recipient"]], body=msg["body"]))
+                            sent_ids.append(msg["id"])
+                        except Exception as e:
+                            failures.append((msg, str(e)))
+                        # pausa anche dopo l'ultimo invio, ancora sotto lock: il blocco
+                        # successivo, di qualunque worker, rispetta lo stesso intervallo
+                        if interval:
+                            time.sleep(interval)
+            except Exception as e:
+                # connessione SMTP non disponibile: tutto il resto del blocco va ritentato
+                done = set(sent_ids) | {m["id"] for m, _ in failures}
+                failures.extend((m, str(e)) for m in batch if m["id"] not in done)
+        self._record(sent_ids, failures)
+        return len(batch)
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                claimed = self.drain_once()
+            except Exception:
+                self.app.logger.exception("mail worker: errore")
+                claimed = 0
+            if not claimed:
+                self._wake.wait(self.idle_seconds)
+                self._wake.clear()
+
+    def wake(self):
+        self._wake.set()
+
+    def start(self):
+        # un thread per processo (dopo un fork di gunicorn il thread va ricreato);
+        # start() arriva da before_request, quindi da più thread insieme
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self.run_forever, name="mail-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+def queue_status(cur, limit=50):
+    cur.execute("SELECT status, COUNT(*) AS n FROM mail_queue GROUP BY status")
+    counts = {r["status"]: r["n"] for r in cur.fetchall()}
+    cur.execute("""
+        SELECT id, recipient, subject, status, attempts, last_error, created_at, sent_at
+        FROM mail_queue ORDER BY id DESC LIMIT %s
+    """, (limit,))
+    return counts, cur.fetchall()
@@ -0,0 +1,141 @@
+# member_import.py
+# Importazione di molti iscritti di un corso e di un mese da un CSV (anche
+# esportato da Excel, separatore "," o ";"). Il file viene normalizzato in
+# Python e caricato con un solo COPY in una tabella di appoggio; validazione,
+# creazione degli utenti mancanti e inserimento in corsi_data sono poi poche
+# istruzioni set-based, qualunque sia il numero di righe. Le righe non valide
+# sono restituite con numero di riga e motivo, le altre vengono importate.
+import csv
+import tempfile
+
+from course_months import materialize_months
+from hashing import UNUSABLE_PASSWORD
+from row_index import allocate_row_indexes, lock_row_counters
+
+IMPORT_FIELDS = ("nome", "cognome", "email", "cell", "tessera", "datacert", "pagato", "importo")
+
+# intestazioni accettate (minuscole, spazi -> "_")
+HEADER_ALIASES = {
+    "nome": "nome",
+    "cognome": "cognome",
+    "email": "email", "e-mail": "email", "mail": "email",
+    "cell": "cell", "cellulare": "cell", "telefono": "cell", "phone": "cell",
+    "tessera": "tessera", "numero_tessera": "tessera",
+    "datacert": "datacert", "data_certificato": "datacert", "certificato": "datacert",
+    "pagato": "pagato",
+    "importo": "importo", "importo_pagato": "importo",
+}
+PAGATO_TRUE = ("1", "si", "sì", "x", "true", "pagato")
+PAGATO_FALSE = ("", "0", "no", "false")
+SPOOL_MAX_MEMORY = 4 * 1024 * 1024
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def _lines(stream):
+    for i, raw in enumerate(stream):
+        try:
+            line = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            raise ImportFormatError(f"Riga {i + 1}: il file deve essere in UTF-8")
+        yield line.lstrip("\ufeff") if i == 0 else line
+
+
+def _normalize(stream):
+    """Legge il CSV caricato (binario) e lo riscrive come CSV per COPY (riga, campi in ordine fisso)."""
+    text = _lines(stream)
+    first = next(text, "")
+    if not first.strip():
+        raise ImportFormatError("File vuoto")
+    delimiter = ";" if first.count(";") > first.count(",") else ","
+    header = [h.strip().lower().replace(" ", "_") for h in next(csv.reader([first], delimiter=delimiter))]
+    columns = {}
+    for pos, h in enumerate(header):
+        field = HEADER_ALIASES.get(h)
+        if field and field not in columns:
+            columns[field] = pos
+    if "email" not in columns:
+        raise ImportFormatError("Colonna email mancante nell'intestazione")
+
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY, mode="w+", newline="")
+    writer = csv.writer(out)
+    n = 0
+    for line, record in enumerate(csv.reader(text, delimiter=delimiter), start=2):
+        if not any(v.strip() for v in record):
+            continue
+        writer.writerow([line] + [record[columns[f]].strip() if f in columns and columns[f] < len(record) else ""
+                                  for f in IMPORT_FIELDS])
+        n += 1
+    out.seek(0)
+    return out, n
+
+
+def import_members(cur, corso, mese, mese_data, stream, dry_run=False):
+    """Importa gli iscritti del CSV in (corso, mese); restituisce il riepilogo con gli errori per riga.
+
+    cur è un RealDictCursor. Solleva ImportFormatError se il file non è
+    leggibile. Commit (o rollback con dry_run) a carico del chiamante.
+    """
+    data, n = _normalize(stream)
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS staging_member_import (
+            line INT, nome TEXT, cognome TEXT, email TEXT, cell TEXT, tessera TEXT,
+            datacert TEXT, pagato TEXT, importo TEXT, error TEXT
+        ) ON COMMIT DELETE ROWS
+    """)
+    cur.execute("TRUNCATE staging_member_import")
+    with data:
+        fields = ", ".join(IMPORT_FIELDS)
+        # FORCE_NOT_NULL: i campi vuoti restano '' come nel resto di corsi_data
+        cur.copy_expert(f"COPY staging_member_import (line, {fields}) FROM STDIN "
+                        f"WITH (FORMAT csv, FORCE_NOT_NULL ({fields}))", data)
+
+    # righe del mese già presenti (anche se materializzate ora) e contatore
+    # bloccato fino al commit: nessuna scrittura concorrente sullo stesso mese
+    materialize_months(cur, corso, [mese_data])
+    lock_row_counters(cur, corso, [mese])
+
+    # validazione: un solo UPDATE, il primo motivo trovato per ogni riga
+    cur.execute("""
+        UPDATE staging_member_import s SET error = CASE
+            WHEN s.email = '' THEN 'Email mancante'
+            WHEN s.email !~ '^[^@[:space:]]+@[^@[:space:]]+\\.[^@[:space:]]+$' THEN 'Email non valida'
+            WHEN d.first_line <> s.line THEN 'Email ripetuta nel file (riga ' || d.first_line || ')'
+            WHEN EXISTS (SELECT 1 FROM corsi_data cd
+                         WHERE cd.corso = %(corso)s AND cd.mese_data = %(mese_data)s AND cd.email = s.email)
+                THEN 'Già presente nel mese'
+            WHEN lower(s.pagato) <> ALL(%(pagato)s) THEN 'Valore di pagato non valido'
+            WHEN s.importo <> '' AND parse_importo(s.importo) IS NULL THEN 'Importo non valido'
+            WHEN s.datacert <> '' AND parse_datacert(s.datacert) IS NULL THEN 'Data certificato non valida'
+        END
+        FROM (SELECT email, MIN(line) AS first_line FROM staging_member_import GROUP BY email) d
+        WHERE d.email = s.email
+    """, {"corso": corso, "mese_data": mese_data, "pagato": list(PAGATO_TRUE + PAGATO_FALSE)})
+    cur.execute("SELECT line, email, error FROM staging_member_import WHERE error IS NOT NULL ORDER BY line")
+    errors = [{"line": r["line"], "email": r["email"], "message": r["error"]} for r in cur.fetchall()]
+    valid = n - len(errors)
+    summary = {"rows": n, "imported": 0, "users_created": 0, "errors": errors, "dry_run": dry_run}
+    if dry_run or not valid:
+        return summary
+
+    # utenti mancanti, come /admin/course-data-single (senza password utilizzabile)
+    cur.execute("""
+        INSERT INTO utenti (nome_cognome, email, password_hash, phone)
+        SELECT DISTINCT ON (email) trim(nome || ' ' || cognome), email, %s, cell
+        FROM staging_member_import WHERE error IS NULL
+        ORDER BY email, line
+        ON CONFLICT (email) DO NOTHING
+    """, (UNUSABLE_PASSWORD,))
+    summary["users_created"] = cur.rowcount
+
+    first = allocate_row_indexes(cur, corso, mese, valid)
+    cur.execute("""
+        INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+        SELECT %s, %s + ROW_NUMBER() OVER (ORDER BY line) - 1, %s, nome, cognome, email, cell, tessera, datacert,
+               CASE WHEN lower(pagato) = ANY(%s) THEN 1 ELSE 0 END, importo
+        FROM staging_member_import WHERE error IS NULL
+    """, (corso, first, mese_data, list(PAGATO_TRUE)))
+    summary["imported"] = cur.rowcount
+    return summary
@@ -0,0 +1,286 @@
+# metrics.py
+# Strumentazione per richiesta: latenza per rotta, numero di query e tempo DB
+# per richiesta, log delle query lente (testo SQL senza parametri) e avviso di
+# possibile N+1 quando una richiesta supera METRICS_N_PLUS_ONE query.
+# Le query sono misurate da una sottoclasse della connessione psycopg2 (vedi
+# db_pool.set_connection_factory), quindi qualunque cursor_factory usino le
+# rotte. Esposizione in formato testo Prometheus; ogni processo gunicorn ha i
+# propri contatori, distinti dall'etichetta pid (sommarli in Prometheus).
+# Le rotte async di asgi.py usano gli stessi contatori (init_quart e
+# async_cursor_factory per psycopg 3).
+import os
+import re
+import time
+import logging
+import threading
+import contextvars
+
+import psycopg2.extensions
+from flask import g, request, has_request_context
+
+log = logging.getLogger("metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SQL_MAX_LEN = 500
+WHITESPACE_RE = re.compile(r"\s+")
+
+# richiesta async in corso (Quart): rotta e contatori, visibili anche nei
+# thread avviati con asyncio.to_thread dalla richiesta
+_async_request = contextvars.ContextVar("metrics_async_request", default=None)
+
+
+def sql_template(query):
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    query = WHITESPACE_RE.sub(" ", str(query)).strip()
+    return query if len(query) <= SQL_MAX_LEN else query[:SQL_MAX_LEN] + "..."
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}   # etichette -> [conteggi per bucket, somma, totale]
+
+    def observe(self, labels, value):
+        entry = self.series.setdefault(labels, [[0] * len(self.buckets), 0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self, extra_names, extra_values):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.label_names + extra_names
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            base = _labels(names, labels + extra_values)
+            for bound, n in zip(self.buckets, counts):
+                yield f'{self.name}_bucket{{{base},le="{bound}"}} {n}'
+            yield f'{self.name}_bucket{{{base},le="+Inf"}} {count}'
+            yield f"{self.name}_sum{{{base}}} {total}"
+            yield f"{self.name}_count{{{base}}} {count}"
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.series = {}
+
+    def inc(self, labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self, extra_names, extra_values):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        names = self.label_names + extra_names
+        for labels, value in sorted(self.series.items()):
+            yield f"{self.name}{{{_labels(names, labels + extra_values)}}} {value}"
+
+
+class Metrics:
+    def __init__(self, slow_query_seconds=0.2, n_plus_one_threshold=50):
+        self.slow_query_seconds = slow_query_seconds
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._lock = threading.Lock()
+        route = ("route", "method")
+        self.request_latency = Histogram("http_request_duration_seconds", "Durata delle richieste per rotta",
+                                         route + ("status",), LATENCY_BUCKETS)
+        self.request_queries = Histogram("http_request_db_queries", "Query eseguite per richiesta",
+                                         route, QUERY_COUNT_BUCKETS)
+        self.request_db_time = Histogram("http_request_db_seconds", "Tempo speso nel database per richiesta",
+                                         route, LATENCY_BUCKETS)
+        self.query_latency = Histogram("db_query_duration_seconds", "Durata delle singole query",
+                                       ("route",), LATENCY_BUCKETS)
+        self.slow_queries = Counter("db_slow_queries_total", "Query oltre la soglia di lentezza", ("route",))
+        self.n_plus_one = Counter("http_request_n_plus_one_total",
+                                  "Richieste oltre la soglia di query (possibile N+1)", route)
+
+    # --- query ---
+    def observe_query(self, query, seconds):
+        route = "-"
+        state = _async_request.get()
+        if state is not None:
+            route = state["route"]
+            state["queries"] += 1
+            state["db_time"] += seconds
+        elif has_request_context():
+            route = _route()
+            g._metrics_queries = g.get("_metrics_queries", 0) + 1
+            g._metrics_db_time = g.get("_metrics_db_time", 0.0) + seconds
+        with self._lock:
+            self.query_latency.observe((route,), seconds)
+            if seconds >= self.slow_query_seconds:
+                self.slow_queries.inc((route,))
+        if seconds >= self.slow_query_seconds:
+            log.warning("query lenta (%.0f ms) su %s: %s", seconds * 1000, route, sql_template(query))
+
+    # --- richieste ---
+    def init_app(self, app):
+        @app.before_request
+        def _metrics_start():
+            g._metrics_start = time.perf_counter()
+            g._metrics_queries = 0
+            g._metrics_db_time = 0.0
+
+        @app.after_request
+        def _metrics_response(response):
+            self._finish(response.status_code)
+            return response
+
+        @app.teardown_request
+        def _metrics_error(exc):
+            # eccezione non gestita: after_request non è stato chiamato
+            if exc is not None:
+                self._finish(500)
+
+    def init_quart(self, app):
+        from quart import request as async_request
+
+        @app.before_request
+        async def _metrics_start():
+            rule = async_request.url_rule
+            _async_request.set({"start": time.perf_counter(), "queries": 0, "db_time": 0.0,
+                                "route": rule.rule if rule is not None else "<non trovata>",
+                                "method": async_request.method})
+
+        @app.after_request
+        async def _metrics_response(response):
+            self._finish_async(response.status_code)
+            return response
+
+        @app.teardown_request
+        async def _metrics_error(exc):
+            if exc is not None:
+                self._finish_async(500)
+
+    def _finish(self, status):
+        start = g.pop("_metrics_start", None)
+        if start is None:
+            return
+        self._record_request(_route(), request.method, status, time.perf_counter() - start,
+                             g.get("_metrics_queries", 0), g.get("_metrics_db_time", 0.0))
+
+    def _finish_async(self, status):
+        state = _async_request.get()
+        start = state.pop("start", None) if state is not None else None
+        if start is None:
+            return
+        self._record_request(state["route"], state["method"], status, time.perf_counter() - start,
+                             state["queries"], state["db_time"])
+
+    def _record_request(self, route, method, status, seconds, queries, db_time):
+        labels = (route, method)
+        with self._lock:
+            self.request_latency.observe(labels + (str(status),), seconds)
+            self.request_queries.observe(labels, queries)
+            self.request_db_time.observe(labels, db_time)
+            if self.n_plus_one_threshold and queries > self.n_plus_one_threshold:
+                self.n_plus_one.inc(labels)
+        if self.n_plus_one_threshold and queries > self.n_plus_one_threshold:
+            log.warning("possibile N+1: %s %s ha eseguito %d query (%.0f ms nel DB)",
+                        labels[1], labels[0], queries, db_time * 1000)
+
+    def render(self, gauges=None):
+        """Testo Prometheus; gauges: {nome: valore} aggiunti come gauge del processo."""
+        extra_names, extra_values = ("pid",), (str(os.getpid()),)
+        lines = []
+        with self._lock:
+            for metric in (self.request_latency, self.request_queries, self.request_db_time,
+                           self.query_latency, self.slow_queries, self.n_plus_one):
+                lines.extend(metric.render(extra_names, extra_values))
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f'{name}{{pid="{extra_values[0]}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    # --- psycopg2 ---
+    def connection_factory(self):
+        """Classe di connessione psycopg2 i cui cursori misurano ogni query."""
+        metrics = self
+        cursor_classes = {}
+
+        def timed_cursor(base):
+            if base not in cursor_classes:
+                class TimedCursor(base):
+                    def execute(self, query, vars=None):
+                        t0 = time.perf_counter()
+                        try:
+                            return super().execute(query, vars)
+                        finally:
+                            metrics.observe_query(query, time.perf_counter() - t0)
+
+                    def executemany(self, query, vars_list):
+                        t0 = time.perf_counter()
+                        try:
+                            return super().executemany(query, vars_list)
+                        finally:
+                            metrics.observe_query(query, time.perf_counter() - t0)
+
+                    def copy_expert(self, sql, file, size=8192):
+                        t0 = time.perf_counter()
+                        try:
+                            return super().copy_expert(sql, file, size)
+                        finally:
+                            metrics.observe_query(sql, time.perf_counter() - t0)
+
+                TimedCursor.__name__ = f"Timed{base.__name__}"
+                cursor_classes[base] = TimedCursor
+            return cursor_classes[base]
+
+        class InstrumentedConnection(psycopg2.extensions.connection):
+            def cursor(self, *args, **kwargs):
+                base = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+                kwargs["cursor_factory"] = timed_cursor(base)
+                return super().cursor(*args, **kwargs)
+
+        return InstrumentedConnection
+
+    # --- psycopg 3 (asgi.py) ---
+    def async_cursor_factory(self):
+        """Classe di cursore psycopg 3 async che misura ogni query (cursor_factory della connessione)."""
+        from psycopg import AsyncCursor
+        metrics = self
+
+        class TimedAsyncCursor(AsyncCursor):
+            async def execute(self, query, params=None, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return await super().execute(query, params, **kwargs)
+                finally:
+                    metrics.observe_query(query, time.perf_counter() - t0)
+
+            async def executemany(self, query, params_seq, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return await super().executemany(query, params_seq, **kwargs)
+                finally:
+                    metrics.observe_query(query, time.perf_counter() - t0)
+
+        return TimedAsyncCursor
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else "<non trovata>"
+
+
+def metrics_from_env():
+    return Metrics(
+        slow_query_seconds=float(os.environ.get("METRICS_SLOW_QUERY_MS", 200)) / 1000,
+        n_plus_one_threshold=int(os.environ.get("METRICS_N_PLUS_ONE", 50)),
+    )
@@ -0,0 +1,651 @@
+# migrations.py
+# Migrazioni di schema versionate. Ogni migrazione è (versione, nome, passi),
+# dove un passo è una stringa SQL o una funzione che riceve il cursore.
+# Le versioni applicate sono registrate in schema_migrations; un advisory lock
+# evita che più worker gunicorn migrino in parallelo.
+import json
+from datetime import date
+
+from partitions import ensure_partitions, add_months, DEFAULT_PARTITION
+
+MIGRATIONS_LOCK_ID = 72015001
+
+MIGRATIONS = [
+    (1, "tabelle base", [
+        """
+        CREATE TABLE IF NOT EXISTS utenti (
+            id SERIAL PRIMARY KEY,
+            nome_cognome VARCHAR(255),
+            username VARCHAR(255),
+            email VARCHAR(255) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            phone VARCHAR(50),
+            pdf_path TEXT,
+            data_creazione TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS login_attempts (
+            id SERIAL PRIMARY KEY,
+            ip VARCHAR(50) NOT NULL,
+            tentativi_falliti INT DEFAULT 0,
+            last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS admin_attempts (
+            id SERIAL PRIMARY KEY,
+            ip VARCHAR(50) NOT NULL,
+            tentativi_falliti INT DEFAULT 0,
+            last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS corsi_data (
+            id SERIAL PRIMARY KEY,
+            corso VARCHAR(100) NOT NULL,
+            row_index INT NOT NULL,
+            mese VARCHAR(20) NOT NULL DEFAULT 'Gennaio-2025',
+            nome VARCHAR(100),
+            cognome VARCHAR(100),
+            email VARCHAR(255),
+            cell VARCHAR(50),
+            tessera VARCHAR(50),
+            datacert VARCHAR(50),
+            pagato SMALLINT DEFAULT 0,
+            importo VARCHAR(50),
+            UNIQUE (corso, row_index, mese)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS course_totals (
+            corso VARCHAR(100) NOT NULL,
+            mese VARCHAR(20) NOT NULL,
+            total_cassa DOUBLE PRECISION DEFAULT 0,
+            total_istruttore DOUBLE PRECISION DEFAULT 0,
+            PRIMARY KEY (corso, mese)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS corsi_row_counters (
+            corso VARCHAR(100) NOT NULL,
+            mese VARCHAR(20) NOT NULL,
+            next_index INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (corso, mese)
+        );
+        """,
+    ]),
+
+    (2, "indici per le query principali", [
+        "CREATE INDEX IF NOT EXISTS corsi_data_corso_mese_idx ON corsi_data (corso, mese, row_index)",
+        "CREATE INDEX IF NOT EXISTS corsi_data_email_idx ON corsi_data (email)",
+        "CREATE INDEX IF NOT EXISTS corsi_data_corso_email_cell_mese_idx ON corsi_data (corso, email, cell, mese)",
+        # una sola riga per ip nelle tabelle dei tentativi: si tiene la più recente
+        "DELETE FROM login_attempts a USING login_attempts b WHERE a.ip = b.ip AND a.id < b.id",
+        "ALTER TABLE login_attempts ADD CONSTRAINT login_attempts_ip_key UNIQUE (ip)",
+        "DELETE FROM admin_attempts a USING admin_attempts b WHERE a.ip = b.ip AND a.id < b.id",
+        "ALTER TABLE admin_attempts ADD CONSTRAINT admin_attempts_ip_key UNIQUE (ip)",
+    ]),
+
+    (3, "schede per hash del contenuto", [
+        # nome originale del file, mostrato al download
+        "ALTER TABLE utenti ADD COLUMN IF NOT EXISTS pdf_name TEXT",
+        # conteggio riferimenti per file
+        "CREATE INDEX IF NOT EXISTS utenti_pdf_path_idx ON utenti (pdf_path)",
+    ]),
+
+    (4, "job di caricamento zip", [
+        """
+        CREATE TABLE IF NOT EXISTS upload_jobs (
+            id VARCHAR(36) PRIMARY KEY,
+            state VARCHAR(20) NOT NULL,
+            total INT DEFAULT 0,
+            processed INT DEFAULT 0,
+            updated INT DEFAULT 0,
+            errors JSONB DEFAULT '[]',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+        """,
+    ]),
+
+    (5, "coda mail in uscita", [
+        """
+        CREATE TABLE IF NOT EXISTS mail_queue (
+            id SERIAL PRIMARY KEY,
+            recipient VARCHAR(255) NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            claimed_at TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS mail_queue_pending_idx ON mail_queue (next_attempt_at, id) WHERE status = 'pending'",
+    ]),
+
+    (6, "indici di ricerca utenti", [
+        lambda cur: search_indexes(cur),
+    ]),
+
+    (7, "importo numerico e totali mantenuti dal database", [
+        # "35", "35,50", "1.234,56", "€ 35" -> numeric; testo non interpretabile -> NULL
+        r"""
+        CREATE OR REPLACE FUNCTION parse_importo(txt TEXT) RETURNS NUMERIC AS $$
+        DECLARE
+            clean TEXT := regexp_replace(COALESCE(txt, ''), '[^0-9,.\-]', '', 'g');
+        BEGIN
+            IF clean LIKE '%,%' THEN
+                clean := replace(replace(clean, '.', ''), ',', '.');
+            END IF;
+            IF clean ~ '^-?[0-9]+(\.[0-9]+)?$' THEN
+                RETURN clean::NUMERIC;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql IMMUTABLE
+        """,
+        "ALTER TABLE corsi_data ADD COLUMN IF NOT EXISTS importo_num NUMERIC(12,2)",
+        "UPDATE corsi_data SET importo_num = parse_importo(importo) WHERE importo IS NOT NULL AND importo <> ''",
+        # importo_num segue sempre importo, qualunque sia la rotta che scrive
+        """
+        CREATE OR REPLACE FUNCTION corsi_data_importo_num() RETURNS TRIGGER AS $$
+        BEGIN
+            NEW.importo_num := parse_importo(NEW.importo);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE TRIGGER corsi_data_importo_num_trg
+        BEFORE INSERT OR UPDATE OF importo ON corsi_data
+        FOR EACH ROW EXECUTE FUNCTION corsi_data_importo_num()
+        """,
+        # total_cassa = somma degli importi pagati, aggiornata per differenza a fine statement
+        """
+        CREATE OR REPLACE FUNCTION course_totals_apply_delta() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO course_totals (corso, mese, total_cassa)
+                SELECT corso, mese, SUM(importo_num) FILTER (WHERE pagato = 1)
+                FROM new_rows GROUP BY corso, mese
+                ON CONFLICT (corso, mese) DO UPDATE
+                SET total_cassa = COALESCE(course_totals.total_cassa, 0) + COALESCE(EXCLUDED.total_cassa, 0);
+            ELSIF TG_OP = 'DELETE' THEN
+                UPDATE course_totals t
+                SET total_cassa = COALESCE(t.total_cassa, 0) - d.delta
+                FROM (SELECT corso, mese, COALESCE(SUM(importo_num) FILTER (WHERE pagato = 1), 0) AS delta
+                      FROM old_rows GROUP BY corso, mese) d
+                WHERE t.corso = d.corso AND t.mese = d.mese AND d.delta <> 0;
+            ELSE
+                INSERT INTO course_totals (corso, mese, total_cassa)
+                SELECT corso, mese, SUM(delta) FROM (
+                    SELECT corso, mese, COALESCE(importo_num, 0) AS delta FROM new_rows WHERE pagato = 1
+                    UNION ALL
+                    SELECT corso, mese, -COALESCE(importo_num, 0) FROM old_rows WHERE pagato = 1
+                ) x GROUP BY corso, mese
+                HAVING SUM(delta) <> 0
+                ON CONFLICT (corso, mese) DO UPDATE
+                SET total_cassa = COALESCE(course_totals.total_cassa, 0) + EXCLUDED.total_cassa;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE TRIGGER corsi_data_totals_ins AFTER INSERT ON corsi_data
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION course_totals_apply_delta()
+        """,
+        """
+        CREATE TRIGGER corsi_data_totals_upd AFTER UPDATE ON corsi_data
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION course_totals_apply_delta()
+        """,
+        """
+        CREATE TRIGGER corsi_data_totals_del AFTER DELETE ON corsi_data
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION course_totals_apply_delta()
+        """,
+        "CREATE INDEX IF NOT EXISTS course_totals_mese_idx ON course_totals (mese)",
+        # riallinea i totali già salvati dal browser con i dati reali
+        """
+        INSERT INTO course_totals (corso, mese, total_cassa)
+        SELECT corso, mese, COALESCE(SUM(importo_num) FILTER (WHERE pagato = 1), 0)
+        FROM corsi_data GROUP BY corso, mese
+        ON CONFLICT (corso, mese) DO UPDATE SET total_cassa = EXCLUDED.total_cassa
+        """,
+    ]),
+
+    (8, "mese come data e partizionamento mensile di corsi_data", [
+        # "Ottobre-2025" <-> 2025-10-01; stringa non valida -> NULL
+        """
+        CREATE OR REPLACE FUNCTION mese_to_date(m TEXT) RETURNS DATE AS $$
+            SELECT make_date(split_part(m, '-', 2)::INT,
+                             array_position(ARRAY['Gennaio','Febbraio','Marzo','Aprile','Maggio','Giugno',
+                                                  'Luglio','Agosto','Settembre','Ottobre','Novembre','Dicembre'],
+                                            split_part(m, '-', 1)),
+                             1)
+            WHERE m ~ '^[A-Za-z]+-[0-9]{4}$'
+        $$ LANGUAGE sql IMMUTABLE STRICT
+        """,
+        """
+        CREATE OR REPLACE FUNCTION date_to_mese(d DATE) RETURNS TEXT AS $$
+            SELECT (ARRAY['Gennaio','Febbraio','Marzo','Aprile','Maggio','Giugno',
+                          'Luglio','Agosto','Settembre','Ottobre','Novembre','Dicembre'])[EXTRACT(MONTH FROM d)::INT]
+                   || '-' || EXTRACT(YEAR FROM d)::INT
+        $$ LANGUAGE sql IMMUTABLE STRICT
+        """,
+        lambda cur: partition_corsi_data(cur),
+    ]),
+
+    (9, "iscrizioni ai corsi e mesi materializzati al primo accesso", [
+        """
+        CREATE TABLE IF NOT EXISTS course_enrollments (
+            id SERIAL PRIMARY KEY,
+            corso VARCHAR(100) NOT NULL,
+            nome VARCHAR(100),
+            cognome VARCHAR(100),
+            email VARCHAR(255),
+            cell VARCHAR(50),
+            tessera VARCHAR(50),
+            datacert VARCHAR(50),
+            from_mese DATE NOT NULL,
+            to_mese DATE NOT NULL
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS course_enrollments_corso_from_idx ON course_enrollments (corso, from_mese, to_mese)",
+        "CREATE INDEX IF NOT EXISTS course_enrollments_corso_email_cell_idx ON course_enrollments (corso, email, cell)",
+        """
+        CREATE TABLE IF NOT EXISTS course_months (
+            corso VARCHAR(100) NOT NULL,
+            mese_data DATE NOT NULL,
+            materialized_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (corso, mese_data)
+        );
+        """,
+        # compattazione: i mesi futuri con sole righe vuote (pagato 0, importo vuoto)
+        # diventano iscrizioni, se rimaterializzandoli si ottengono le stesse righe
+        """
+        CREATE TEMP TABLE compact_months ON COMMIT DROP AS
+        SELECT corso, mese_data FROM corsi_data
+        WHERE mese_data > date_trunc('month', CURRENT_DATE)
+        GROUP BY corso, mese_data
+        HAVING bool_and(COALESCE(pagato, 0) = 0 AND COALESCE(importo, '') = '')
+        """,
+        """
+        INSERT INTO course_enrollments (corso, nome, cognome, email, cell, tessera, datacert, from_mese, to_mese)
+        SELECT corso, nome, cognome, email, cell, tessera, datacert, from_mese, to_mese
+        FROM (
+            SELECT cd.corso, cd.nome, cd.cognome, cd.email, cd.cell, cd.tessera, cd.datacert,
+                   MIN(cd.mese_data) AS from_mese, MAX(cd.mese_data) AS to_mese,
+                   MIN((cd.mese_data - DATE '2000-01-01')::BIGINT * 100000 + cd.row_index) AS first_seen
+            FROM corsi_data cd
+            JOIN compact_months c ON c.corso = cd.corso AND c.mese_data = cd.mese_data
+            GROUP BY cd.corso, cd.nome, cd.cognome, cd.email, cd.cell, cd.tessera, cd.datacert
+        ) x
+        ORDER BY corso, first_seen
+        """,
+        # si tengono materializzati i mesi che le iscrizioni non riprodurrebbero identici
+        """
+        WITH expected AS (
+            SELECT c.corso, c.mese_data, x.nome, x.cognome, x.email, x.cell, x.tessera, x.datacert,
+                   (ROW_NUMBER() OVER (PARTITION BY c.corso, c.mese_data ORDER BY x.id) - 1)::INT AS row_index
+            FROM compact_months c
+            CROSS JOIN LATERAL (
+                SELECT DISTINCT ON (e.email, e.cell) e.*
+                FROM course_enrollments e
+                WHERE e.corso = c.corso AND c.mese_data BETWEEN e.from_mese AND e.to_mese
+                ORDER BY e.email, e.cell, e.id
+            ) x
+        ), actual AS (
+            SELECT cd.corso, cd.mese_data, cd.nome, cd.cognome, cd.email, cd.cell, cd.tessera, cd.datacert, cd.row_index
+            FROM corsi_data cd
+            JOIN compact_months c ON c.corso = cd.corso AND c.mese_data = cd.mese_data
+        ), diff AS (
+            (SELECT * FROM expected EXCEPT ALL SELECT * FROM actual)
+            UNION ALL
+            (SELECT * FROM actual EXCEPT ALL SELECT * FROM expected)
+        )
+        DELETE FROM compact_months c
+        USING (SELECT DISTINCT corso, mese_data FROM diff) d
+        WHERE c.corso = d.corso AND c.mese_data = d.mese_data
+        """,
+        """
+        INSERT INTO course_months (corso, mese_data)
+        SELECT DISTINCT cd.corso, cd.mese_data FROM corsi_data cd
+        WHERE NOT EXISTS (SELECT 1 FROM compact_months c WHERE c.corso = cd.corso AND c.mese_data = cd.mese_data)
+        ON CONFLICT DO NOTHING
+        """,
+        """
+        DELETE FROM corsi_data cd USING compact_months c
+        WHERE cd.corso = c.corso AND cd.mese_data = c.mese_data
+        """,
+        # i contatori ripartono da zero alla materializzazione
+        """
+        DELETE FROM corsi_row_counters r USING compact_months c
+        WHERE r.corso = c.corso AND r.mese = date_to_mese(c.mese_data)
+        """,
+    ]),
+
+    (10, "versioni di riga e registro modifiche per la sincronizzazione incrementale", [
+        "CREATE SEQUENCE IF NOT EXISTS corsi_data_change_seq",
+        "ALTER TABLE corsi_data ADD COLUMN IF NOT EXISTS version INT NOT NULL DEFAULT 1",
+        "ALTER TABLE corsi_data ADD COLUMN IF NOT EXISTS change_seq BIGINT NOT NULL DEFAULT nextval('corsi_data_change_seq')",
+        "CREATE INDEX IF NOT EXISTS corsi_data_changes_idx ON corsi_data (corso, mese_data, change_seq)",
+        # ogni scrittura, da qualunque rotta, avanza change_seq e (negli UPDATE) la versione
+        """
+        CREATE OR REPLACE FUNCTION corsi_data_version() RETURNS TRIGGER AS $$
+        BEGIN
+            NEW.change_seq := nextval('corsi_data_change_seq');
+            IF TG_OP = 'UPDATE' THEN
+                NEW.version := OLD.version + 1;
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE TRIGGER corsi_data_version_trg
+        BEFORE INSERT OR UPDATE ON corsi_data
+        FOR EACH ROW EXECUTE FUNCTION corsi_data_version()
+        """,
+        # righe eliminate singolarmente (PATCH); una riscrittura completa del mese
+        # azzera invece il registro e avanza course_months.reset_seq
+        """
+        CREATE TABLE IF NOT EXISTS corsi_data_tombstones (
+            id INT NOT NULL,
+            corso VARCHAR(100) NOT NULL,
+            mese_data DATE NOT NULL,
+            change_seq BIGINT NOT NULL DEFAULT nextval('corsi_data_change_seq'),
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS corsi_data_tombstones_idx ON corsi_data_tombstones (corso, mese_data, change_seq)",
+        "ALTER TABLE course_months ADD COLUMN IF NOT EXISTS reset_seq BIGINT NOT NULL DEFAULT 0",
+    ]),
+
+    (11, "data del certificato medico tipizzata e indicizzata", [
+        # "01/09/2025", "1-9-25", "01.09.2025", "2025-09-01" -> date; testo non interpretabile -> NULL
+        r"""
+        CREATE OR REPLACE FUNCTION parse_datacert(txt TEXT) RETURNS DATE AS $$
+        DECLARE
+            clean TEXT := btrim(COALESCE(txt, ''));
+            p TEXT[] := regexp_split_to_array(btrim(COALESCE(txt, '')), '\s*[-/.]\s*');
+            anno INT;
+        BEGIN
+            IF clean ~ '^[0-9]{4}\s*[-/.]\s*[0-9]{1,2}\s*[-/.]\s*[0-9]{1,2}$' THEN
+                RETURN make_date(p[1]::INT, p[2]::INT, p[3]::INT);
+            END IF;
+            IF clean ~ '^[0-9]{1,2}\s*[-/.]\s*[0-9]{1,2}\s*[-/.]\s*([0-9]{2}|[0-9]{4})$' THEN
+                anno := p[3]::INT;
+                IF anno < 100 THEN
+                    anno := anno + 2000;
+                END IF;
+                RETURN make_date(anno, p[2]::INT, p[1]::INT);
+            END IF;
+            RETURN NULL;
+        EXCEPTION WHEN datetime_field_overflow OR invalid_datetime_format THEN
+            -- 31/02/2025, mese 13, ...
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql IMMUTABLE
+        """,
+        # il testo resta com'è stato scritto; la data e il flag li calcola il database
+        """
+        ALTER TABLE corsi_data
+            ADD COLUMN IF NOT EXISTS datacert_date DATE GENERATED ALWAYS AS (parse_datacert(datacert)) STORED
+        """,
+        """
+        ALTER TABLE corsi_data
+            ADD COLUMN IF NOT EXISTS datacert_invalid BOOLEAN
+            GENERATED ALWAYS AS (btrim(COALESCE(datacert, '')) <> '' AND parse_datacert(datacert) IS NULL) STORED
+        """,
+        # certificati per intervallo di data e ultimo certificato per email
+        "CREATE INDEX IF NOT EXISTS corsi_data_datacert_idx ON corsi_data (datacert_date) WHERE datacert_date IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS corsi_data_email_datacert_idx ON corsi_data (email, datacert_date)",
+        "CREATE INDEX IF NOT EXISTS corsi_data_datacert_invalid_idx ON corsi_data (email) WHERE datacert_invalid",
+    ]),
+
+    (12, "total_cassa ricalcolato per tutti i totali salvati", [
+        # la 7 ha riallineato solo i mesi con righe in corsi_data: i totali dei
+        # mesi senza righe erano ancora quelli inviati dal browser
+        """
+        UPDATE course_totals t
+        SET total_cassa = COALESCE(s.total, 0)
+        FROM (
+            SELECT t2.corso, t2.mese, SUM(cd.importo_num) FILTER (WHERE cd.pagato = 1) AS total
+            FROM course_totals t2
+            LEFT JOIN corsi_data cd ON cd.corso = t2.corso AND cd.mese_data = mese_to_date(t2.mese)
+            GROUP BY t2.corso, t2.mese
+        ) s
+        WHERE t.corso = s.corso AND t.mese = s.mese AND t.total_cassa IS DISTINCT FROM COALESCE(s.total, 0)
+        """,
+    ]),
+
+    (13, "total_cassa come NUMERIC(12,2)", [
+        # somma di importi NUMERIC: in DOUBLE PRECISION i delta dei trigger
+        # accumulavano errori di arrotondamento (0.1 + 0.2)
+        """
+        ALTER TABLE course_totals
+        ALTER COLUMN total_cassa TYPE NUMERIC(12,2) USING round(total_cassa::numeric, 2)
+        """,
+    ]),
+
+    (14, "file zip dei job di caricamento", [
+        # il gc delle schede non tocca lo ZIP di un job ancora da elaborare
+        "ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS spool_name VARCHAR(255)",
+    ]),
+
+    (15, "heartbeat dei job di caricamento zip", [
+        # un job in coda o in corso senza aggiornamenti da troppo tempo (worker
+        # morto) viene segnato come fallito da BulkUploader.fail_stale
+        "ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP",
+        "UPDATE upload_jobs SET updated_at = COALESCE(finished_at, created_at) WHERE updated_at IS NULL",
+        "ALTER TABLE upload_jobs ALTER COLUMN updated_at SET DEFAULT CURRENT_TIMESTAMP",
+        """
+        CREATE INDEX IF NOT EXISTS upload_jobs_active_idx ON upload_jobs (updated_at)
+        WHERE state IN ('queued', 'running')
+        """,
+    ]),
+]
+
+
+def partition_corsi_data(cur):
+    # corsi_data viene ricreata come tabella partizionata su mese_data; mese
+    # resta come colonna generata, così le letture per stringa non cambiano
+    cur.execute("ALTER TABLE corsi_data RENAME TO corsi_data_old")
+    cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'corsi_data_old' AND schemaname = current_schema()")
+    for (index,) in cur.fetchall():
+        cur.execute(f"ALTER INDEX {index} RENAME TO old_{index}")
+    cur.execute("SELECT pg_get_serial_sequence('corsi_data_old', 'id')")
+    seq = cur.fetchone()[0]
+
+    cur.execute(f"""
+        CREATE TABLE corsi_data (
+            id INT NOT NULL DEFAULT nextval('{seq}'),
+            corso VARCHAR(100) NOT NULL,
+            row_index INT NOT NULL,
+            mese_data DATE NOT NULL,
+            mese VARCHAR(20) GENERATED ALWAYS AS (date_to_mese(mese_data)) STORED,
+            nome VARCHAR(100),
+            cognome VARCHAR(100),
+            email VARCHAR(255),
+            cell VARCHAR(50),
+            tessera VARCHAR(50),
+            datacert VARCHAR(50),
+            pagato SMALLINT DEFAULT 0,
+            importo VARCHAR(50),
+            importo_num NUMERIC(12,2),
+            PRIMARY KEY (id, mese_data),
+            UNIQUE (corso, mese_data, row_index)
+        ) PARTITION BY RANGE (mese_data)
+    """)
+    cur.execute("CREATE INDEX corsi_data_email_idx ON corsi_data (email)")
+    cur.execute("CREATE INDEX corsi_data_corso_email_cell_mese_idx ON corsi_data (corso, email, cell, mese_data)")
+    cur.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF corsi_data DEFAULT")
+
+    # una partizione per ogni mese già presente e per i cinque anni successivi
+    cur.execute("SELECT MIN(mese_to_date(mese)), MAX(mese_to_date(mese)) FROM corsi_data_old")
+    first, last = cur.fetchone()
+    today = date.today().replace(day=1)
+    ensure_partitions(cur, min(first or today, today), max(last or today, add_months(today, 60)))
+
+    # copia prima dei trigger: importo_num è già calcolato e i totali sono già allineati
+    cur.execute("""
+        INSERT INTO corsi_data (id, corso, row_index, mese_data, nome, cognome, email, cell,
+                                tessera, datacert, pagato, importo, importo_num)
+        SELECT id, corso, row_index, mese_to_date(mese), nome, cognome, email, cell,
+               tessera, datacert, pagato, importo, importo_num
+        FROM corsi_data_old
+        WHERE mese_to_date(mese) IS NOT NULL
+    """)
+    cur.execute(f"ALTER SEQUENCE {seq} OWNED BY corsi_data.id")
+    cur.execute("""
+        CREATE TRIGGER corsi_data_importo_num_trg
+        BEFORE INSERT OR UPDATE OF importo ON corsi_data
+        FOR EACH ROW EXECUTE FUNCTION corsi_data_importo_num()
+    """)
+    for name, event, transition in (("corsi_data_totals_ins", "INSERT", "NEW TABLE AS new_rows"),
+                                    ("corsi_data_totals_upd", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+                                    ("corsi_data_totals_del", "DELETE", "OLD TABLE AS old_rows")):
+        cur.execute(f"""
+            CREATE TRIGGER {name} AFTER {event} ON corsi_data
+            REFERENCING {transition}
+            FOR EACH STATEMENT EXECUTE FUNCTION course_totals_apply_delta()
+        """)
+
+    # le righe con un mese non interpretabile restano in corsi_data_legacy
+    cur.execute("SELECT COUNT(*) FROM corsi_data_old WHERE mese_to_date(mese) IS NULL")
+    if cur.fetchone()[0]:
+        cur.execute("ALTER TABLE corsi_data_old RENAME TO corsi_data_legacy")
+    else:
+        cur.execute("DROP TABLE corsi_data_old")
+    cur.execute("ANALYZE corsi_data")
+
+
+def search_indexes(cur):
+    # trigram per ILIKE '%q%' su nome/email/telefono; senza permessi per pg_trgm
+    # si ripiega su indici per prefisso (LIKE 'q%')
+    cur.execute("SAVEPOINT trgm")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cur.execute("RELEASE SAVEPOINT trgm")
+        ops, method = "gin_trgm_ops", "gin"
+    except Exception:
+        cur.execute("ROLLBACK TO SAVEPOINT trgm")
+        ops, method = "varchar_pattern_ops", "btree"
+    for name, expr in (("utenti_nome_search_idx", "(COALESCE(username, nome_cognome))"),
+                       ("utenti_email_search_idx", "email"),
+                       ("utenti_phone_search_idx", "phone")):
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON utenti USING {method} ({expr} {ops})")
+
+
+def applied_versions(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def migrate(conn, log=print):
+    """Applica le migrazioni mancanti, ognuna nella propria transazione. Restituisce le versioni applicate."""
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_ID,))
+    try:
+        done = applied_versions(cur)
+        conn.commit()
+        applied = []
+        for version, name, steps in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version in done:
+                continue
+            try:
+                for step in steps:
+                    if callable(step):
+                        step(cur)
+                    else:
+                        cur.execute(step)
+                cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                log(f"migrate: errore nella migrazione {version} ({name})")
+                raise
+            log(f"migrate: applicata {version} ({name})")
+            applied.append(version)
+        return applied
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_ID,))
+        conn.commit()
+
+
+# --- verifica piani di esecuzione ---
+# (descrizione, query, parametri, tabella che deve essere letta via indice)
+HOT_QUERIES = [
+    ("righe del mese", """
+        SELECT cd.row_index, u.id AS user_id, cd.nome, cd.cognome, cd.email
+        FROM corsi_data cd
+        LEFT JOIN utenti u ON cd.email = u.email
+        WHERE cd.corso = %s AND cd.mese_data = %s
+        ORDER BY cd.row_index
+    """, ("BodyBuilding", date(2025, 10, 1)), "corsi_data"),
+    ("join per email", "SELECT id FROM corsi_data WHERE email = %s", ("x@example.com",), "corsi_data"),
+    ("propagazione", """
+        SELECT row_index FROM corsi_data WHERE corso=%s AND email=%s AND cell=%s AND mese_data=%s
+    """, ("BodyBuilding", "x@example.com", "333", date(2025, 11, 1)), "corsi_data"),
+    ("certificati in scadenza", """
+        SELECT DISTINCT ON (cd.email) cd.email, cd.datacert_date
+        FROM corsi_data cd
+        WHERE cd.datacert_date BETWEEN %s AND %s AND cd.email <> ''
+          AND NOT EXISTS (SELECT 1 FROM corsi_data x WHERE x.email = cd.email AND x.datacert_date > cd.datacert_date)
+        ORDER BY cd.email, cd.datacert_date DESC
+    """, (date(2024, 9, 1), date(2024, 11, 1)), "corsi_data"),
+    ("tentativi login", "SELECT tentativi_falliti, last_attempt FROM login_attempts WHERE ip=%s",
+     ("127.0.0.1",), "login_attempts"),
+    ("tentativi admin", "SELECT tentativi_falliti, last_attempt FROM admin_attempts WHERE ip=%s",
+     ("127.0.0.1",), "admin_attempts"),
+]
+
+INDEX_NODES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+
+def _scans(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _scans(child)
+
+
+def explain_check(conn, queries=HOT_QUERIES):
+    """Esegue EXPLAIN sulle query principali e restituisce [(descrizione, ok, nodi)].
+
+    Le scansioni sequenziali sono disabilitate nella transazione: su tabelle
+    piccole il planner le preferirebbe comunque, qui si verifica che esista
+    un indice utilizzabile.
+    """
+    cur = conn.cursor()
+    results = []
+    try:
+        cur.execute("SET LOCAL enable_seqscan = off")
+        for desc, sql, params, table in queries:
+            cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            nodes = [(n["Node Type"], n.get("Relation Name") or n.get("Index Name", ""))
+                     for n in _scans(plan[0]["Plan"])]
+            ok = any(n.get("Node Type") in INDEX_NODES and
+                     (n.get("Relation Name") == table or table in n.get("Index Name", ""))
+                     for n in _scans(plan[0]["Plan"]))
+            results.append((desc, ok, nodes))
+    finally:
+        conn.rollback()
+    return results
@@ -0,0 +1,103 @@
+# partitions.py
+# corsi_data è partizionata per mese: RANGE su mese_data (primo giorno del
+# mese), una partizione corsi_data_yAAAAmMM per mese più corsi_data_default
+# per le righe fuori dalle partizioni esistenti. Le partizioni dei mesi
+# futuri si creano in anticipo (migrazione 8, avvio di gunicorn, `flask
+# partitions`); i mesi vecchi si staccano con detach_before e restano tabelle
+# normali, da archiviare (pg_dump -t) ed eliminare.
+from datetime import date
+
+PARENT = "corsi_data"
+DEFAULT_PARTITION = "corsi_data_default"
+
+
+def add_months(d, n):
+    m = d.year * 12 + d.month - 1 + n
+    return date(m // 12, m % 12 + 1, 1)
+
+
+def partition_name(d):
+    return f"{PARENT}_y{d.year}m{d.month:02d}"
+
+
+def _value(row):
+    return list(row.values())[0] if isinstance(row, dict) else row[0]
+
+
+def _exists(cur, name):
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    return _value(cur.fetchone())
+
+
+def _stored_columns(cur):
+    # colonne da copiare quando si spostano righe: tutte tranne le generate
+    cur.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+        ORDER BY attnum
+    """, (PARENT,))
+    return ", ".join(_value(r) for r in cur.fetchall())
+
+
+def ensure_partition(cur, d):
+    """Crea la partizione del mese di d se manca; restituisce True se l'ha creata.
+
+    Le righe di quel mese già finite nella partizione di default vengono
+    spostate nella nuova tabella prima di agganciarla.
+    """
+    start = date(d.year, d.month, 1)
+    end = add_months(start, 1)
+    name = partition_name(start)
+    if _exists(cur, name):
+        return False
+    cur.execute(f"""
+        CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING CONSTRAINTS)
+    """)
+    if _exists(cur, DEFAULT_PARTITION):
+        columns = _stored_columns(cur)
+        cur.execute(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE mese_data >= %s AND mese_data < %s
+                RETURNING {columns}
+            )
+            INSERT INTO {name} ({columns}) SELECT {columns} FROM moved
+        """, (start, end))
+    cur.execute(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+    return True
+
+
+def ensure_partitions(cur, start, end):
+    """Crea le partizioni mancanti dal mese di start al mese di end compresi; restituisce i nomi creati."""
+    created = []
+    d = date(start.year, start.month, 1)
+    while d <= end:
+        if ensure_partition(cur, d):
+            created.append(partition_name(d))
+        d = add_months(d, 1)
+    return created
+
+
+def list_partitions(cur):
+    """[(nome, limiti, righe stimate)] delle partizioni agganciate, in ordine di mese."""
+    cur.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::BIGINT
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        ORDER BY c.relname
+    """, (PARENT,))
+    return [tuple(r.values()) if isinstance(r, dict) else tuple(r) for r in cur.fetchall()]
+
+
+def detach_before(cur, d):
+    """Stacca le partizioni dei mesi precedenti a d; restituisce i nomi staccati.
+
+    I totali in course_totals restano: le tabelle staccate non sono più lette dall'app.
+    """
+    limit = partition_name(date(d.year, d.month, 1))
+    detached = []
+    for name, _, _ in list_partitions(cur):
+        if name != DEFAULT_PARTITION and name < limit:
+            cur.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {name}")
+            detached.append(name)
+    return detached
@@ -0,0 +1,174 @@
+# rate_limit.py
+# Blocco degli IP dopo troppi tentativi di login falliti: max_attempts
+# fallimenti dentro una finestra di block_seconds bloccano l'IP finché il più
+# vecchio non esce dalla finestra; un login riuscito azzera. Fallimenti sparsi
+# nel tempo non si accumulano.
+# Il backend in memoria tiene gli istanti degli ultimi max_attempts fallimenti
+# (finestra scorrevole esatta). Quello su Postgres ha un solo contatore per IP
+# (tabelle esistenti): riparte da 1 quando il fallimento precedente è fuori
+# dalla finestra e blocca per block_seconds dall'ultimo. Con tentativi
+# ravvicinati, il caso di un attacco, i due coincidono.
+# I backend scrivono solo quando lo stato cambia, mai sul semplice controllo.
+import os
+import time
+import threading
+from collections import deque
+
+
+class MemoryRateLimiter:
+    """Backend in-process a finestra scorrevole; adatto a un solo worker."""
+
+    def __init__(self, max_attempts, block_seconds, max_entries=100000):
+        self.max_attempts = max_attempts
+        self.block_seconds = block_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._state = {}   # (scope, ip) -> deque degli istanti degli ultimi max_attempts fallimenti
+
+    def check(self, scope, ip):
+        now = time.time()
+        with self._lock:
+            failures = self._state.get((scope, ip))
+            if not failures:
+                return False, 0
+            if now - failures[-1] >= self.block_seconds:
+                # tutti fuori dalla finestra
+                del self._state[(scope, ip)]
+                return False, 0
+            if len(failures) < self.max_attempts:
+                return False, 0
+            remaining = max(0, self.block_seconds - int(now - failures[0]))
+            return remaining > 0, remaining
+
+    def record_failure(self, scope, ip):
+        now = time.time()
+        with self._lock:
+            failures = self._state.get((scope, ip))
+            if failures is None:
+                if len(self._state) >= self.max_entries:
+                    self._evict(now)
+                failures = self._state[(scope, ip)] = deque(maxlen=self.max_attempts)
+            failures.append(now)
+
+    def reset(self, scope, ip):
+        with self._lock:
+            self._state.pop((scope, ip), None)
+
+    def _evict(self, now):
+        # elimina prima gli IP senza fallimenti nella finestra, poi i più vecchi
+        stale = [k for k, failures in self._state.items() if now - failures[-1] >= self.block_seconds]
+        for k in stale:
+            del self._state[k]
+        if len(self._state) >= self.max_entries:
+            oldest = sorted(self._state, key=lambda k: self._state[k][-1])
+            for k in oldest[:len(oldest) // 10 or 1]:
+                del self._state[k]
+
+
+class PostgresRateLimiter:
+    """Backend condiviso tra worker, sulle tabelle login_attempts / admin_attempts (ip UNIQUE)."""
+
+    SCOPES = ("login_attempts", "admin_attempts")
+
+    def __init__(self, max_attempts, block_seconds, get_conn):
+        self.max_attempts = max_attempts
+        self.block_seconds = block_seconds
+        self.get_conn = get_conn
+
+    def _table(self, scope):
+        if scope not in self.SCOPES:
+            raise ValueError(f"scope non valido: {scope}")
+        return scope
+
+    # --- query (condivise con AsyncPostgresRateLimiter) ---
+    def _check_sql(self, scope):
+        # una sola lettura: il tempo trascorso è calcolato da Postgres
+        return f"""
+            SELECT tentativi_falliti,
+                   FLOOR(EXTRACT(EPOCH FROM (NOW() - last_attempt)))::int
+            FROM {self._table(scope)} WHERE ip=%s
+        """
+
+    def _failure_sql(self, scope):
+        # UPSERT: se il fallimento precedente è fuori dalla finestra (anche un
+        # blocco scaduto) si riparte da 1 invece di azzerare in check()
+        table = self._table(scope)
+        return f"""
+            INSERT INTO {table} (ip, tentativi_falliti, last_attempt) VALUES (%s, 1, NOW())
+            ON CONFLICT (ip) DO UPDATE SET
+                tentativi_falliti = CASE
+                    WHEN {table}.last_attempt <= NOW() - make_interval(secs => %s)
+                    THEN 1
+                    ELSE {table}.tentativi_falliti + 1
+                END,
+                last_attempt = NOW()
+        """
+
+    def _reset_sql(self, scope):
+        # non scrive nulla se l'IP non ha tentativi falliti
+        return f"""
+            UPDATE {self._table(scope)} SET tentativi_falliti=0, last_attempt=NULL
+            WHERE ip=%s AND tentativi_falliti > 0
+        """
+
+    def _blocked(self, row):
+        if not row or row[0] < self.max_attempts or row[1] is None:
+            return False, 0
+        remaining = max(0, self.block_seconds - row[1])
+        return remaining > 0, remaining
+
+    def _run(self, sql, params, fetch=False):
+        # ogni operazione chiude la propria transazione, anche la sola lettura
+        # e anche in errore: la connessione della richiesta non resta "idle in
+        # transaction" né in una transazione abortita
+        conn = self.get_conn()
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            row = cur.fetchone() if fetch else None
+            conn.commit()
+            return row
+        except Exception:
+            conn.rollback()
+            raise
+
+    def check(self, scope, ip):
+        return self._blocked(self._run(self._check_sql(scope), (ip,), fetch=True))
+
+    def record_failure(self, scope, ip):
+        self._run(self._failure_sql(scope), (ip, self.block_seconds))
+
+    def reset(self, scope, ip):
+        self._run(self._reset_sql(scope), (ip,))
+
+
+class AsyncPostgresRateLimiter(PostgresRateLimiter):
+    """Stesse tabelle e query su un pool asincrono psycopg 3 (asgi.py)."""
+
+    def __init__(self, max_attempts, block_seconds, pool):
+        super().__init__(max_attempts, block_seconds, None)
+        self.pool = pool
+
+    async def check(self, scope, ip):
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(self._check_sql(scope), (ip,))
+            row = await cur.fetchone()
+        # le righe possono arrivare come dict (row_factory del pool)
+        return self._blocked(tuple(row.values()) if isinstance(row, dict) else row)
+
+    async def record_failure(self, scope, ip):
+        async with self.pool.connection() as conn:
+            await conn.execute(self._failure_sql(scope), (ip, self.block_seconds))
+
+    async def reset(self, scope, ip):
+        async with self.pool.connection() as conn:
+            await conn.execute(self._reset_sql(scope), (ip,))
+
+
+def rate_limiter_from_env(max_attempts, block_seconds, get_conn):
+    backend = os.environ.get("RATE_LIMIT_BACKEND", "postgres")
+    if backend == "memory":
+        return MemoryRateLimiter(max_attempts, block_seconds)
+    if backend == "postgres":
+        return PostgresRateLimiter(max_attempts, block_seconds, get_conn)
+    raise ValueError(f"RATE_LIMIT_BACKEND non valido: {backend}")
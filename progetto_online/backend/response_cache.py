@@ -0,0 +1,104 @@
+# response_cache.py
+# Cache LRU delle risposte JSON di lettura per (tipo, corso, mese), con ETag
+# forte. Ogni processo ha la propria cache; l'invalidazione passa da piccoli
+# file di "generazione" (globale, per corso e per corso+mese) di cui si legge
+# solo l'mtime, così una scrittura in un worker invalida anche gli altri senza
+# interrogare il database.
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    def __init__(self, max_entries=512, generation_dir=None):
+        self.max_entries = max_entries
+        self.generation_dir = generation_dir or os.path.join(tempfile.gettempdir(), "gym-response-cache")
+        os.makedirs(self.generation_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (generazioni, etag, payload)
+        self.hits = 0
+        self.misses = 0
+
+    # --- generazioni ---
+    def _gen_path(self, *parts):
+        name = hashlib.sha1("\x00".join(parts).encode("utf-8")).hexdigest() if parts else "_all"
+        return os.path.join(self.generation_dir, name)
+
+    def _generation(self, *parts):
+        try:
+            return os.stat(self._gen_path(*parts)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _generations(self, corso, mese):
+        return (self._generation(), self._generation(corso), self._generation(corso, mese))
+
+    def _bump(self, *parts):
+        path = self._gen_path(*parts)
+        before = self._generation(*parts)
+        with open(path, "a"):
+            pass
+        now = max(before + 1, time.time_ns())
+        os.utime(path, ns=(now, now))
+
+    # --- API ---
+    @staticmethod
+    def make_etag(payload):
+        return hashlib.sha256(payload).hexdigest()[:32]
+
+    def get(self, key):
+        """key = (tipo, corso, mese); restituisce (etag, payload) o None."""
+        gens = self._generations(key[1], key[2])
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != gens:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, payload, generations):
+        # generations va letto prima della query, così una scrittura concorrente
+        # durante il calcolo rende subito vecchia la voce
+        etag = self.make_etag(payload)
+        with self._lock:
+            self._entries[key] = (generations, etag, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag
+
+    def generations(self, key):
+        return self._generations(key[1], key[2])
+
+    def generation_etag(self, kind, corsi, mesi):
+        """ETag di una risposta su più corsi e mesi, dalle sole generazioni.
+
+        Cambia quando uno dei (corso, mese) viene invalidato, quindi permette
+        il 304 prima di leggere il database anche senza voce in cache.
+        """
+        parts = [kind, str(self._generation())]
+        for corso in corsi:
+            parts.append(f"{corso}\x00{self._generation(corso)}")
+            parts.extend(f"{mese}\x00{self._generation(corso, mese)}" for mese in mesi)
+        return self.make_etag("\x01".join(parts).encode("utf-8"))
+
+    def invalidate(self, corso=None, mese=None):
+        """Invalida un mese di un corso, un corso intero (mese=None) o tutto (corso=None)."""
+        if corso is None:
+            self._bump()
+        elif mese is None:
+            self._bump(corso)
+        else:
+            self._bump(corso, mese)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,74 @@
+# row_index.py
+# Allocazione di row_index per (corso, mese) tramite la tabella contatori
+# corsi_row_counters: ogni chiamata è un UPDATE ... RETURNING su una sola riga,
+# che fa anche da lock per le scritture concorrenti sullo stesso mese.
+
+def ensure_row_counters(cur, corso, mesi):
+    # Crea i contatori mancanti partendo dal MAX(row_index) attuale (una volta sola per mese)
+    cur.execute("""
+        INSERT INTO corsi_row_counters (corso, mese, next_index)
+        SELECT %(corso)s, m.mese,
+               COALESCE((SELECT MAX(cd.row_index) FROM corsi_data cd
+                         WHERE cd.corso = %(corso)s AND cd.mese_data = mese_to_date(m.mese)), -1) + 1
+        FROM unnest(%(mesi)s::varchar[]) AS m(mese)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM corsi_row_counters c WHERE c.corso = %(corso)s AND c.mese = m.mese
+        )
+        ON CONFLICT (corso, mese) DO NOTHING
+    """, {"corso": corso, "mesi": list(mesi)})
+
+
+def lock_row_counters(cur, corso, mesi):
+    # lock in ordine di mese, così scritture concorrenti su più mesi non vanno in deadlock
+    ensure_row_counters(cur, corso, mesi)
+    cur.execute("""
+        SELECT 1 FROM corsi_row_counters
+        WHERE corso = %s AND mese = ANY(%s::varchar[])
+        ORDER BY mese FOR UPDATE
+    """, (corso, list(mesi)))
+
+
+def allocate_row_indexes(cur, corso, mese, n=1):
+    """Riserva n row_index consecutivi per (corso, mese) e restituisce il primo."""
+    sql = """
+        UPDATE corsi_row_counters SET next_index = next_index + %s
+        WHERE corso = %s AND mese = %s
+        RETURNING next_index - %s AS first_index
+    """
+    cur.execute(sql, (n, corso, mese, n))
+    row = cur.fetchone()
+    if row is None:
+        ensure_row_counters(cur, corso, [mese])
+        cur.execute(sql, (n, corso, mese, n))
+        row = cur.fetchone()
+    return row["first_index"] if isinstance(row, dict) else row[0]
+
+
+def allocate_row_index_blocks(cur, corso, counts):
+    """Riserva un blocco per ogni mese in counts ({mese: n}); restituisce {mese: primo indice}."""
+    counts = {m: n for m, n in counts.items() if n > 0}
+    if not counts:
+        return {}
+    mesi = list(counts)
+    lock_row_counters(cur, corso, mesi)
+    cur.execute("""
+        UPDATE corsi_row_counters c SET next_index = c.next_index + r.n
+        FROM unnest(%s::varchar[], %s::int[]) AS r(mese, n)
+        WHERE c.corso = %s AND c.mese = r.mese
+        RETURNING c.mese, c.next_index - r.n AS first_index
+    """, (mesi, [counts[m] for m in mesi], corso))
+    result = {}
+    for row in cur.fetchall():
+        if isinstance(row, dict):
+            result[row["mese"]] = row["first_index"]
+        else:
+            result[row[0]] = row[1]
+    return result
+
+
+def reset_row_counter(cur, corso, mese, next_index):
+    # Usato quando il mese viene riscritto da zero; blocca il contatore fino al commit
+    cur.execute("""
+        INSERT INTO corsi_row_counters (corso, mese, next_index) VALUES (%s, %s, %s)
+        ON CONFLICT (corso, mese) DO UPDATE SET next_index = EXCLUDED.next_index
+    """, (corso, mese, next_index))
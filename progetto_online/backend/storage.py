@@ -0,0 +1,115 @@
+# storage.py
+# Archivio delle schede indirizzato per contenuto: ogni file è salvato come
+# <sha256><estensione> in UPLOAD_FOLDER, quindi lo stesso PDF inviato a più
+# utenti occupa spazio una volta sola. Il conteggio dei riferimenti è dato da
+# utenti.pdf_path; i file non più referenziati vengono rimossi (gc).
+import os
+import time
+import hashlib
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+TMP_PREFIX = ".upload-"
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def store_upload(stream, folder, max_bytes, ext=""):
+    """Copia lo stream su disco a blocchi calcolando l'hash; restituisce (nome, dimensione)."""
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(prefix=TMP_PREFIX, dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLarge(f"File oltre il limite di {max_bytes} byte")
+                digest.update(chunk)
+                out.write(chunk)
+
+        name = digest.hexdigest() + ext
+        final_path = os.path.join(folder, name)
+        if os.path.exists(final_path):
+            # già presente: si tiene la copia esistente e se ne aggiorna l'mtime per il gc
+            os.unlink(tmp_path)
+            os.utime(final_path)
+        else:
+            os.replace(tmp_path, final_path)
+        return name, size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def spool_upload(stream, folder, max_bytes):
+    """Copia lo stream in un file temporaneo di folder, a blocchi e con limite; restituisce il percorso."""
+    fd, tmp_path = tempfile.mkstemp(prefix=TMP_PREFIX, dir=folder)
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLarge(f"File oltre il limite di {max_bytes} byte")
+                out.write(chunk)
+        return tmp_path
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def reference_count(cur, name):
+    cur.execute("SELECT COUNT(*) FROM utenti WHERE pdf_path=%s", (name,))
+    row = cur.fetchone()
+    return list(row.values())[0] if isinstance(row, dict) else row[0]
+
+
+def _old_enough(path, min_age):
+    try:
+        return time.time() - os.path.getmtime(path) >= min_age
+    except OSError:
+        return False
+
+
+def release_if_unreferenced(cur, folder, name, min_age=60):
+    # min_age protegge un file appena caricato da un altro upload non ancora committato
+    if not name or os.path.basename(name) != name:
+        return False
+    path = os.path.join(folder, name)
+    if reference_count(cur, name) == 0 and _old_enough(path, min_age):
+        os.unlink(path)
+        return True
+    return False
+
+
+def collect_garbage(cur, folder, min_age=3600, dry_run=False):
+    """Rimuove i file (e i temporanei abbandonati) non referenziati da utenti.pdf_path.
+
+    Gli ZIP in attesa dei job di bulk_upload.py (stesso prefisso dei temporanei)
+    restano finché il job è in coda o in corso.
+    """
+    cur.execute("""
+        SELECT pdf_path FROM utenti WHERE pdf_path IS NOT NULL
+        UNION
+        SELECT spool_name FROM upload_jobs WHERE state IN ('queued', 'running') AND spool_name IS NOT NULL
+    """)
+    referenced = {list(r.values())[0] if isinstance(r, dict) else r[0] for r in cur.fetchall()}
+    removed = []
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if name in referenced or not os.path.isfile(path) or not _old_enough(path, min_age):
+            continue
+        if not dry_run:
+            os.unlink(path)
+        removed.append(name)
+    return removed
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+
+@pytest.fixture
+def users(conn, cur):
+    # prefisso unico: lo schema di test è condiviso e le righe vengono committate
+    prefix = f"paguser{os.urandom(4).hex()}"
+    cur.execute("""
+        INSERT INTO utenti (nome_cognome, email, password_hash)
+        SELECT 'Pag ' || n, %s || '-' || n || '@example.com', '!' FROM generate_series(1, 105) AS n
+        RETURNING id
+    """, (prefix,))
+    ids = sorted(r["id"] for r in cur.fetchall())
+    conn.commit()
+    return prefix, ids
+
+
+def test_pagination_defaults(flask_app, admin_client, users):
+    prefix, ids = users
+    first = admin_client.get(f"/admin/users?q={prefix}").get_json()
+    assert len(first["users"]) == flask_app.USERS_PAGE_SIZE == 100
+    assert first["next_cursor"] == first["users"][-1]["id"]
+
+    second = admin_client.get(f"/admin/users?q={prefix}&after={first['next_cursor']}").get_json()
+    assert len(second["users"]) == 5 and second["next_cursor"] is None
+    assert [u["id"] for u in first["users"] + second["users"]] == ids
+
+
+def test_limit_bounds(admin_client, users):
+    prefix, ids = users
+    res = admin_client.get(f"/admin/users?q={prefix}&limit=0").get_json()
+    assert [u["id"] for u in res["users"]] == ids[:1] and res["next_cursor"] == ids[0]
+    res = admin_client.get(f"/admin/users?q={prefix}&limit=5000").get_json()
+    assert [u["id"] for u in res["users"]] == ids and res["next_cursor"] is None
+
+    for query in ("limit=abc", "after=abc"):
+        res = admin_client.get(f"/admin/users?q={prefix}&{query}")
+        assert res.status_code == 400
+        assert res.get_json() == {"status": "error", "message": "Parametri non validi"}
+
+
+def test_search_escapes_wildcards(admin_client, users):
+    prefix, _ = users
+    assert admin_client.get(f"/admin/users?q={prefix}-10@").get_json()["users"][0]["email"] == \
+        f"{prefix}-10@example.com"
+    # % e _ sono caratteri letterali, non jolly
+    assert admin_client.get(f"/admin/users?q={prefix}%25").get_json()["users"] == []
+    assert admin_client.get(f"/admin/users?q={prefix[:-1]}_").get_json()["users"] == []
+
+
+def test_stream_returns_every_user(flask_app, admin_client, users):
+    prefix, ids = users
+    res = admin_client.get(f"/admin/users?q={prefix}&format=stream")
+    assert res.status_code == 200 and res.mimetype == "application/json"
+    body = res.get_json()
+    assert body["status"] == "ok" and [u["id"] for u in body["users"]] == ids
+    assert "next_cursor" not in body
+
+    anonymous = flask_app.app.test_client()
+    for query in ("", "?format=stream"):
+        assert anonymous.get(f"/admin/users{query}").status_code == 401
@@ -0,0 +1,162 @@
+# Le rotte async di asgi.py devono rispondere come le rotte Flask che
+# sostituiscono: stesse risposte JSON, stessi header su /scheda, stessa cache.
+# Servono le dipendenze di requirements-async.txt.
+import asyncio
+import json
+import os
+
+import pytest
+
+pytest.importorskip("quart")
+pytest.importorskip("quart_cors")
+pytest.importorskip("psycopg_pool")
+pytest.importorskip("a2wsgi")
+
+PASSWORD = "parita-123"
+
+
+@pytest.fixture(scope="module")
+def asgi(flask_app):
+    import asgi
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(asgi.pool.open())
+    asgi.run = loop.run_until_complete
+    yield asgi
+    loop.run_until_complete(asgi.pool.close())
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+def user(flask_app, schema):
+    cur = schema.cursor()
+    cur.execute("""
+        INSERT INTO utenti (nome_cognome, username, email, password_hash, phone)
+        VALUES ('Parità Test', 'parita', 'parita@example.com', %s, '333') RETURNING id
+    """, (flask_app.get_hasher().hash(PASSWORD),))
+    user_id = cur.fetchone()[0]
+    schema.commit()
+    return user_id
+
+
+def cookie(flask_app, **data):
+    value = flask_app.app.session_interface.get_signing_serializer(flask_app.app).dumps(data)
+    return {"Cookie": f"session={value}"}
+
+
+def both(flask_app, asgi, method, url, headers=None, body=None):
+    """(risposta Flask, risposta Quart) come (status, header, corpo)."""
+    headers = dict(headers or {})
+    client = flask_app.app.test_client()
+    if "Cookie" in headers:
+        # il client Flask manda solo i cookie del proprio cookie jar
+        client.set_cookie("session", headers["Cookie"].partition("=")[2])
+    res = client.open(url, method=method, headers=headers, json=body)
+    wsgi_res = (res.status_code, res.headers, res.get_data())
+
+    async def call():
+        res = await asgi.aapp.test_client().open(url, method=method, headers=headers, json=body)
+        return res.status_code, res.headers, await res.get_data()
+    return wsgi_res, asgi.run(call())
+
+
+def assert_same_json(pair):
+    (status_a, _, body_a), (status_b, _, body_b) = pair
+    assert (status_a, json.loads(body_a)) == (status_b, json.loads(body_b))
+
+
+@pytest.mark.parametrize("payload", [
+    {"email": "parita@example.com", "password": PASSWORD},
+    {"email": "parita@example.com", "password": "sbagliata"},
+    {"email": "", "password": ""},
+])
+def test_login_parity(flask_app, asgi, user, payload, monkeypatch):
+    # limitatore proprio: i tentativi falliti non devono bloccare gli altri test
+    from rate_limit import MemoryRateLimiter
+    limiter = MemoryRateLimiter(flask_app.MAX_ATTEMPTS, flask_app.BLOCK_TIME_SECONDS)
+    monkeypatch.setattr(flask_app, "rate_limiter", limiter)
+    monkeypatch.setattr(asgi, "rate_limiter", limiter)
+    assert_same_json(both(flask_app, asgi, "POST", "/login", body=payload))
+
+
+def test_me_parity(flask_app, asgi, user):
+    assert_same_json(both(flask_app, asgi, "GET", "/me"))
+    assert_same_json(both(flask_app, asgi, "GET", "/me", headers=cookie(flask_app, user_id=user)))
+    assert_same_json(both(flask_app, asgi, "GET", "/me", headers=cookie(flask_app, user_id=-1)))
+
+
+def give_scheda(flask_app, schema, user):
+    name = "parita-scheda.pdf"
+    with open(os.path.join(flask_app.UPLOAD_FOLDER, name), "wb") as f:
+        f.write(b"%PDF-1.4 parita " * 64)
+    cur = schema.cursor()
+    cur.execute("UPDATE utenti SET pdf_path = %s, pdf_name = 'Scheda è.pdf' WHERE id = %s", (name, user))
+    schema.commit()
+
+
+def test_scheda_parity(flask_app, asgi, user, schema):
+    headers = cookie(flask_app, user_id=user)
+    assert_same_json(both(flask_app, asgi, "GET", "/scheda", headers=headers))
+
+    give_scheda(flask_app, schema, user)
+    wsgi_res, async_res = both(flask_app, asgi, "GET", "/scheda", headers=headers)
+    assert wsgi_res[0] == async_res[0] == 200 and wsgi_res[2] == async_res[2]
+    for header in ("Content-Type", "Content-Disposition", "Content-Length", "Cache-Control", "Expires",
+                   "Last-Modified", "ETag", "Accept-Ranges"):
+        assert wsgi_res[1].get(header) == async_res[1].get(header), header
+
+    pair = both(flask_app, asgi, "GET", "/scheda", headers=dict(headers, **{"If-None-Match": wsgi_res[1]["ETag"]}))
+    assert [r[0] for r in pair] == [304, 304]
+    for range_, body in (("bytes=0-9", b"%PDF-1.4 p"), ("bytes=1020-", b"ita ")):
+        wsgi_res, async_res = both(flask_app, asgi, "GET", "/scheda", headers=dict(headers, Range=range_))
+        assert wsgi_res[0] == async_res[0] == 206 and wsgi_res[2] == async_res[2] == body
+        assert wsgi_res[1]["Content-Range"] == async_res[1]["Content-Range"]
+
+
+@pytest.mark.parametrize("offload, header", [("x-accel", "X-Accel-Redirect"), ("x-sendfile", "X-Sendfile")])
+def test_scheda_offload_parity(flask_app, asgi, user, schema, monkeypatch, offload, header):
+    give_scheda(flask_app, schema, user)
+    monkeypatch.setattr(flask_app, "SCHEDA_OFFLOAD", offload)
+    wsgi_res, async_res = both(flask_app, asgi, "GET", "/scheda", headers=cookie(flask_app, user_id=user))
+    assert wsgi_res[0] == async_res[0] == 200 and wsgi_res[2] == async_res[2] == b""
+    for name in (header, "Content-Type", "Content-Disposition", "Cache-Control"):
+        assert wsgi_res[1].get(name) == async_res[1].get(name), name
+
+
+def test_course_data_parity(flask_app, asgi, schema):
+    cur = schema.cursor()
+    cur.execute("""
+        INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+        VALUES ('Parita', 0, '2026-02-01', 'A', 'A', 'a@example.com', '1', '', '', 1, '10'),
+               ('Parita', 1, '2026-02-01', 'B', 'B', 'b@example.com', '2', '', '', 0, '')
+    """)
+    schema.commit()
+    headers = cookie(flask_app, admin_logged_in=True)
+    for url in ("/admin/course-data/Parita?mese=Febbraio-2026", "/admin/course-data/Parita?mese=Foo"):
+        assert_same_json(both(flask_app, asgi, "GET", url))
+        assert_same_json(both(flask_app, asgi, "GET", url, headers=headers))
+
+    # stessa cache e quindi stesso ETag: il 304 vale su entrambe
+    wsgi_res, async_res = both(flask_app, asgi, "GET", "/admin/course-data/Parita?mese=Febbraio-2026",
+                               headers=headers)
+    assert wsgi_res[1]["ETag"] == async_res[1]["ETag"]
+    pair = both(flask_app, asgi, "GET", "/admin/course-data/Parita?mese=Febbraio-2026",
+                headers=dict(headers, **{"If-None-Match": wsgi_res[1]["ETag"]}))
+    assert [r[0] for r in pair] == [304, 304]
+
+
+@pytest.mark.parametrize("method, headers", [
+    ("GET", {"Origin": "http://frontend.example"}),
+    ("OPTIONS", {"Origin": "http://frontend.example", "Access-Control-Request-Method": "POST"}),
+])
+def test_cors_parity(flask_app, asgi, method, headers):
+    wsgi_res, async_res = both(flask_app, asgi, method, "/me", headers=headers)
+    for header in ("Access-Control-Allow-Origin", "Access-Control-Allow-Credentials"):
+        assert wsgi_res[1].get(header) == async_res[1].get(header), header
+    assert async_res[1]["Access-Control-Allow-Origin"] == "http://frontend.example"
+
+
+def test_dispatch(asgi):
+    assert asgi._is_async_route({"path": "/login", "method": "POST"})
+    assert asgi._is_async_route({"path": "/admin/course-data/Yoga", "method": "GET"})
+    assert not asgi._is_async_route({"path": "/admin/course-data/Yoga", "method": "POST"})
+    assert not asgi._is_async_route({"path": "/register", "method": "POST"})
@@ -0,0 +1,111 @@
+import gzip
+import json
+import os
+
+import pytest
+
+import assets
+from assets import AssetManifest, build_assets
+
+
+@pytest.fixture
+def frontend(tmp_path, monkeypatch):
+    """Un frontend minimo in tmp_path, con assets.py puntato lì."""
+    files = {
+        "static/images/logo.png": b"\x89PNG logo",
+        "static/css/style.css": (b"body{background:url('../images/logo.png')}"
+                                 b".x{background:url(data:image/png;base64,AAAA)}"
+                                 b".y{background:url(/static/images/logo.png)}"),
+        "static/js/script.js": b"console.log('ciao');",
+        "static/downloads/modulo.pdf": b"%PDF modulo",
+        "templates/index.html": (b'<link href="static/css/style.css"><script src="static/js/script.js"></script>'
+                                 b'<a href="static/downloads/modulo.pdf">'),
+    }
+    for rel, data in files.items():
+        path = tmp_path / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    build = tmp_path / "build"
+    for name, value in (("STATIC_DIR", tmp_path / "static"), ("TEMPLATES_DIR", tmp_path / "templates"),
+                        ("BUILD_DIR", build), ("BUILD_STATIC_DIR", build / "static"),
+                        ("BUILD_TEMPLATES_DIR", build / "templates"), ("MANIFEST_PATH", build / "manifest.json")):
+        monkeypatch.setattr(assets, name, str(value))
+    return tmp_path
+
+
+def test_build_hashes_and_rewrites(frontend):
+    manifest = build_assets()
+    assert sorted(manifest) == ["css/style.css", "images/logo.png", "js/script.js"]
+    assert manifest["js/script.js"] == assets._hashed_name("js/script.js", b"console.log('ciao');")
+    assert json.loads((frontend / "build" / "manifest.json").read_text()) == manifest
+
+    css = (frontend / "build" / "static" / manifest["css/style.css"]).read_bytes()
+    # url relativi verso il file con hash; data: e percorsi assoluti restano
+    assert f"url('../{manifest['images/logo.png']}')".encode() in css
+    assert b"url(data:image/png;base64,AAAA)" in css and b"url(/static/images/logo.png)" in css
+    assert gzip.decompress((frontend / "build" / "static" / (manifest["css/style.css"] + ".gz")).read_bytes()) == css
+    assert not (frontend / "build" / "static" / (manifest["images/logo.png"] + ".gz")).exists()
+
+    html = (frontend / "build" / "templates" / "index.html").read_text()
+    assert f'static/{manifest["css/style.css"]}' in html and f'static/{manifest["js/script.js"]}' in html
+    assert "static/downloads/modulo.pdf" in html
+
+
+def test_css_hash_follows_referenced_image(frontend):
+    before = build_assets()
+    (frontend / "static" / "images" / "logo.png").write_bytes(b"\x89PNG nuovo logo")
+    after = build_assets()
+    # il css non cambia, ma punta all'immagine nuova: anche il suo nome cambia
+    assert after["images/logo.png"] != before["images/logo.png"]
+    assert after["css/style.css"] != before["css/style.css"]
+    assert after["js/script.js"] == before["js/script.js"]
+
+
+def test_manifest_reloads_when_the_file_changes(tmp_path):
+    path = tmp_path / "manifest.json"
+    current = AssetManifest(str(path))
+    assert current.manifest == {} and not current.is_hashed("css/style.1.css")
+
+    path.write_text(json.dumps({"css/style.css": "css/style.1.css"}))
+    assert current.is_hashed("css/style.1.css")
+    path.write_text(json.dumps({"css/style.css": "css/style.2.css"}))
+    os.utime(path, ns=(1, 1))
+    assert current.manifest == {"css/style.css": "css/style.2.css"}
+    assert not current.is_hashed("css/style.1.css")
+
+    path.unlink()
+    assert current.manifest == {}
+
+
+def test_cache_headers(flask_app, frontend, monkeypatch):
+    manifest = build_assets()
+    build = frontend / "build"
+    monkeypatch.setattr(flask_app, "asset_manifest", AssetManifest(str(build / "manifest.json")))
+    for name, value in (("STATIC_DIR", frontend / "static"), ("FRONTEND_DIR", frontend / "templates"),
+                        ("BUILD_STATIC_DIR", build / "static"), ("BUILD_TEMPLATES_DIR", build / "templates")):
+        monkeypatch.setattr(flask_app, name, str(value))
+    client = flask_app.app.test_client()
+
+    res = client.get(f"/static/{manifest['css/style.css']}", headers={"Accept-Encoding": "gzip"})
+    assert res.headers["Cache-Control"] == flask_app.IMMUTABLE_CACHE
+    assert res.headers["Content-Encoding"] == "gzip" and res.headers["Vary"] == "Accept-Encoding"
+    assert res.headers["Content-Type"].startswith("text/css")
+    res = client.get(f"/static/{manifest['css/style.css']}")
+    assert "Content-Encoding" not in res.headers and b"url(" in res.data
+
+    # file senza hash (downloads/ o nomi originali): revalidazione
+    for url in ("/static/downloads/modulo.pdf", "/static/css/style.css"):
+        res = client.get(url)
+        assert res.status_code == 200 and res.headers["Cache-Control"] == "no-cache"
+
+    res = client.get("/")
+    assert res.headers["Cache-Control"] == "no-cache"
+    assert manifest["css/style.css"].encode() in res.data
+    res = client.get("/", headers={"If-None-Match": res.headers["ETag"]})
+    assert res.status_code == 304
+
+    # senza build si torna ai template originali
+    (build / "manifest.json").unlink()
+    res = client.get("/")
+    assert b'href="static/css/style.css"' in res.data
+    assert client.get(f"/static/{manifest['css/style.css']}").status_code == 404
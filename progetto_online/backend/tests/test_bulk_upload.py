@@ -0,0 +1,131 @@
+import io
+import os
+import uuid
+import zipfile
+
+import pytest
+
+pytest.importorskip("psycopg2")
+from bulk_upload import BulkUploader, ZipTooLarge, job_status
+
+
+@pytest.fixture
+def uploader(flask_app, tmp_path):
+    uploader = BulkUploader(flask_app.get_pool, str(tmp_path), 1024, stale_seconds=60)
+    yield uploader
+    uploader._jobs.shutdown(wait=True)
+
+
+def make_zip(path, files):
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return str(path)
+
+
+def insert_job(conn, cur, state, age_seconds=0):
+    job_id = str(uuid.uuid4())
+    cur.execute("""
+        INSERT INTO upload_jobs (id, state, updated_at) VALUES (%s, %s, NOW() - make_interval(secs => %s))
+    """, (job_id, state, age_seconds))
+    conn.commit()
+    return job_id
+
+
+def state_of(cur, job_id):
+    cur.execute("SELECT state FROM upload_jobs WHERE id = %s", (job_id,))
+    return cur.fetchone()["state"]
+
+
+def test_job_lifecycle(uploader, conn, cur, tmp_path):
+    cur.execute("""
+        INSERT INTO utenti (nome_cognome, email, password_hash)
+        VALUES ('Zip Uno', 'zip-uno@example.com', '!'), ('Zip Due', 'zip-due@example.com', '!')
+        RETURNING id
+    """)
+    first, second = (r["id"] for r in cur.fetchall())
+    conn.commit()
+    zip_path = make_zip(tmp_path / ".upload-lifecycle", {
+        f"{first}_scheda.pdf": b"%PDF uno",
+        "zip-due@example.com.pdf": b"%PDF due",
+        "sconosciuto.pdf": b"%PDF ?",
+        "troppo.pdf": b"x" * 2048,
+        "__MACOSX/._x.pdf": b"",
+    })
+
+    job_id = uploader.submit(zip_path)
+    uploader._jobs.shutdown(wait=True)
+    job = job_status(cur, job_id)
+    assert (job["state"], job["total"], job["processed"], job["updated"]) == ("done", 4, 4, 2)
+    assert sorted(e["file"] for e in job["errors"]) == ["sconosciuto.pdf", "troppo.pdf"]
+    assert job["finished_at"] is not None and job["updated_at"] >= job["created_at"]
+    cur.execute("SELECT pdf_name FROM utenti WHERE id = ANY(%s) ORDER BY id", ([first, second],))
+    assert [r["pdf_name"] for r in cur.fetchall()] == [f"{first}_scheda.pdf", "zip-due@example.com.pdf"]
+    assert not os.path.exists(zip_path)
+
+
+def test_zip_limits(uploader, tmp_path):
+    files = {f"{i}.pdf": b"x" * 100 for i in range(3)}
+    with zipfile.ZipFile(make_zip(tmp_path / "limiti.zip", files)) as zf:
+        uploader.check_zip(zf)
+        uploader.max_entries = 2
+        with pytest.raises(ZipTooLarge):
+            uploader.check_zip(zf)
+        uploader.max_entries, uploader.max_uncompressed_bytes = 10, 299
+        with pytest.raises(ZipTooLarge):
+            uploader.check_zip(zf)
+
+
+def test_upload_route_rejects_oversized_zip(flask_app, admin_client, monkeypatch):
+    monkeypatch.setattr(flask_app.bulk_uploader, "max_entries", 1)
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as zf:
+        zf.writestr("1.pdf", b"%PDF")
+        zf.writestr("2.pdf", b"%PDF")
+    before = set(os.listdir(flask_app.UPLOAD_FOLDER))
+    res = admin_client.post("/admin/upload-zip", data={"file": (io.BytesIO(data.getvalue()), "schede.zip")},
+                            content_type="multipart/form-data")
+    assert res.status_code == 413
+    res = admin_client.post("/admin/upload-zip", data={"file": (io.BytesIO(b"non zip"), "schede.zip")},
+                            content_type="multipart/form-data")
+    assert res.status_code == 400
+    # lo ZIP rifiutato non resta nella cartella
+    assert set(os.listdir(flask_app.UPLOAD_FOLDER)) == before
+
+
+def test_stale_jobs_are_failed(uploader, conn, cur):
+    jobs = {name: insert_job(conn, cur, state, age) for name, state, age in (
+        ("queued_stale", "queued", 120), ("running_stale", "running", 120),
+        ("running_fresh", "running", 10), ("done_old", "done", 120))}
+    # altri test possono aver lasciato job fermi nello schema: conta solo lo stato di questi
+    assert uploader.fail_stale() >= 2
+    assert {name: state_of(cur, job_id) for name, job_id in jobs.items()} == {
+        "queued_stale": "failed", "running_stale": "failed", "running_fresh": "running", "done_old": "done"}
+    cur.execute("SELECT errors FROM upload_jobs WHERE id = %s", (jobs["running_stale"],))
+    assert cur.fetchone()["errors"][-1]["error"].startswith("Job interrotto")
+
+
+def test_failed_job_is_not_claimed(uploader, conn, cur, tmp_path):
+    # in coda in un processo morto e già segnato come fallito: non parte, ma lo ZIP va rimosso
+    job_id = insert_job(conn, cur, "failed")
+    zip_path = make_zip(tmp_path / ".upload-stale", {"1.pdf": b"%PDF"})
+    uploader._run(job_id, zip_path, {})
+    job = job_status(cur, job_id)
+    assert (job["state"], job["total"]) == ("failed", 0)
+    assert os.listdir(tmp_path) == []
+
+
+def test_progress_is_a_heartbeat(uploader, conn, cur):
+    running = insert_job(conn, cur, "running", 120)
+    queued = insert_job(conn, cur, "queued", 120)
+    uploader._queued.add(queued)
+    uploader._progress(running, processed=1)
+    # entrambi aggiornati: il job in coda dietro a quello in corso non è fermo
+    uploader.fail_stale()
+    assert (state_of(cur, running), state_of(cur, queued)) == ("running", "queued")
+
+    # un job dato per perso non torna "done" quando il worker lento finisce
+    cur.execute("UPDATE upload_jobs SET state = 'failed' WHERE id = %s", (running,))
+    conn.commit()
+    uploader._progress(running, state="done", finished=True)
+    assert state_of(cur, running) == "failed"
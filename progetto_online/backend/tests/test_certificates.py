@@ -0,0 +1,48 @@
+from datetime import date, timedelta
+
+from partitions import add_months
+
+
+def issued(validita, scadenza):
+    # data del certificato che scade intorno a `scadenza` (giorno <= 28: niente arrotondamenti di fine mese)
+    d = add_months(scadenza.replace(day=1), -validita)
+    return d.replace(day=min(scadenza.day, 28)).strftime("%d/%m/%Y")
+
+
+def test_expiring_expired_and_invalid(flask_app, admin_client, conn, cur):
+    oggi = date.today()
+    validita = flask_app.CERT_VALIDITY_MONTHS
+    in_scadenza = issued(validita, oggi + timedelta(days=10))
+    scaduto = issued(validita, oggi - timedelta(days=20))
+    rows = [
+        ("cert-a@example.com", in_scadenza, "2026-01-01"),
+        ("cert-b@example.com", scaduto, "2026-01-01"),
+        # certificato vecchio sostituito da uno più recente: conta solo l'ultimo
+        ("cert-c@example.com", scaduto, "2026-01-01"),
+        ("cert-c@example.com", in_scadenza, "2026-02-01"),
+        ("cert-d@example.com", "31/02/2025", "2026-01-01"),
+        ("cert-e@example.com", issued(validita, oggi + timedelta(days=200)), "2026-01-01"),
+    ]
+    for i, (email, datacert, mese_data) in enumerate(rows):
+        cur.execute("""
+            INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+            VALUES ('CertTest', %s, %s, 'N', 'C', %s, '1', '', %s, 0, '')
+        """, (i, mese_data, email, datacert))
+    conn.commit()
+
+    res = admin_client.get("/admin/certificates?giorni=30&scaduti=60")
+    assert res.status_code == 200
+    data = res.get_json()
+    mine = lambda items: {i["email"]: i for i in items if i["email"].startswith("cert-")}
+    expiring, expired, invalid = mine(data["expiring"]), mine(data["expired"]), mine(data["invalid"])
+    assert set(expiring) == {"cert-a@example.com", "cert-c@example.com"}
+    assert set(expired) == {"cert-b@example.com"}
+    assert set(invalid) == {"cert-d@example.com"}
+    assert expiring["cert-c@example.com"]["mese"] == "Febbraio-2026"
+    assert all(0 < i["giorni"] <= 10 for i in expiring.values())
+    assert all(-23 <= i["giorni"] < 0 for i in expired.values())
+
+
+def test_certificates_rejects_bad_params(admin_client):
+    assert admin_client.get("/admin/certificates?giorni=abc").status_code == 400
+    assert admin_client.get("/admin/certificates?giorni=-1").status_code == 400
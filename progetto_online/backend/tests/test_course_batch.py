@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+
+def insert_rows(conn, cur, corso):
+    cur.execute("""
+        INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+        VALUES (%(c)s, 0, '2026-05-01', 'A', 'A', 'a@example.com', '1', '', '', 1, '10'),
+               (%(c)s, 1, '2026-05-01', 'B', 'B', 'b@example.com', '2', '', '', 0, '20'),
+               (%(c)s, 0, '2026-06-01', 'A', 'A', 'a@example.com', '1', '', '', 1, '15')
+    """, {"c": corso})
+    conn.commit()
+
+
+def test_batch_groups_rows_and_totals(admin_client, conn, cur):
+    insert_rows(conn, cur, "BatchUno")
+    res = admin_client.get("/admin/course-batch?corsi=BatchUno,BatchVuoto&mesi=Maggio-2026,Giugno-2026")
+    assert res.status_code == 200
+    data = res.get_json()
+    assert data["mesi"] == ["Maggio-2026", "Giugno-2026"]
+    maggio = data["corsi"]["BatchUno"]["Maggio-2026"]
+    assert [r["nome"] for r in maggio["rows"]] == ["A", "B"]
+    assert maggio["totals"]["total_cassa"] == 10
+    assert data["corsi"]["BatchUno"]["Giugno-2026"]["totals"]["total_cassa"] == 15
+    assert data["corsi"]["BatchVuoto"]["Maggio-2026"]["rows"] == []
+
+
+def test_batch_not_modified_skips_the_database(flask_app, admin_client, conn, cur, monkeypatch):
+    insert_rows(conn, cur, "BatchEtag")
+    url = "/admin/course-batch?corsi=BatchEtag&mesi=Maggio-2026,Giugno-2026"
+    etag = admin_client.get(url).headers["ETag"]
+
+    def no_db(*args):
+        raise AssertionError("query eseguita per una richiesta condizionale")
+
+    monkeypatch.setattr(flask_app, "load_course_batch", no_db)
+    res = admin_client.get(url, headers={"If-None-Match": etag})
+    assert res.status_code == 304 and res.headers["ETag"] == etag
+    monkeypatch.undo()
+
+    # una scrittura su uno dei mesi cambia l'ETag
+    res = admin_client.post("/admin/course-totals/BatchEtag", json={"mese": "Giugno-2026", "total_istruttore": 3})
+    assert res.status_code == 200
+    res = admin_client.get(url, headers={"If-None-Match": etag})
+    assert res.status_code == 200 and res.headers["ETag"] != etag
+    assert res.get_json()["corsi"]["BatchEtag"]["Giugno-2026"]["totals"]["total_istruttore"] == 3
+
+
+@pytest.mark.parametrize("query", [
+    "corsi=Karate&anno=0",
+    "corsi=Karate&anno=10000",
+    "corsi=Karate&anno=abc",
+    "corsi=Karate&mesi=Maggio-20260",
+    "corsi=Karate&da=Gennaio-2020&a=Dicembre-2026",
+    "anno=2026",
+])
+def test_batch_rejects_bad_requests(admin_client, query):
+    assert admin_client.get(f"/admin/course-batch?{query}").status_code == 400
+
+
+def test_batch_requires_admin(flask_app):
+    assert flask_app.app.test_client().get("/admin/course-batch?corsi=Karate&anno=2026").status_code == 401
@@ -0,0 +1,61 @@
+from datetime import date
+
+import pytest
+
+pytest.importorskip("psycopg2")
+from course_months import enroll, materialize_months, materialized_months, mark_materialized, PENDING_ROWS_SQL
+
+GEN, FEB, MAR = date(2026, 1, 1), date(2026, 2, 1), date(2026, 3, 1)
+
+
+def month_rows(cur, corso, d):
+    cur.execute("""
+        SELECT row_index, nome, email, pagato, importo FROM corsi_data
+        WHERE corso = %s AND mese_data = %s ORDER BY row_index
+    """, (corso, d))
+    return [(r["row_index"], r["nome"], r["email"], r["pagato"], r["importo"]) for r in cur.fetchall()]
+
+
+def test_enroll_skips_covered_members(conn, cur):
+    corso = "LazyEnroll"
+    members = [("A", "Uno", "a@example.com", "1", "", ""), ("B", "Due", "b@example.com", "2", "", "")]
+    assert enroll(cur, corso, members, GEN, MAR) == 2
+    # già coperti su tutto l'intervallo
+    assert enroll(cur, corso, members[:1], FEB, MAR) == 0
+    # intervallo più lungo: nuova iscrizione
+    assert enroll(cur, corso, members[:1], GEN, date(2026, 6, 1)) == 1
+    assert enroll(cur, corso, [], GEN, MAR) == 0
+    conn.rollback()
+
+
+def test_materialize_once_per_month(conn, cur):
+    corso = "LazyMaterialize"
+    enroll(cur, corso, [("B", "Due", "b@example.com", "2", "", ""), ("A", "Uno", "a@example.com", "1", "", "")],
+           GEN, FEB)
+    # stessa persona iscritta di nuovo (email e cell uguali): una sola riga per mese
+    enroll(cur, corso, [("Bis", "Due", "b@example.com", "2", "", "")], FEB, MAR)
+    assert materialized_months(cur, corso, [GEN, FEB, MAR]) == set()
+
+    assert materialize_months(cur, corso, [FEB, GEN, GEN]) == [GEN, FEB]
+    assert materialize_months(cur, corso, [GEN, FEB]) == []
+    assert materialized_months(cur, corso, [GEN, FEB, MAR]) == {GEN, FEB}
+    expected = [(0, "B", "b@example.com", 0, ""), (1, "A", "a@example.com", 0, "")]
+    assert month_rows(cur, corso, GEN) == expected
+    assert month_rows(cur, corso, FEB) == expected
+
+    # le righe non ancora materializzate si leggono uguali senza scriverle
+    cur.execute(f"SELECT mese_data, nome, pos FROM ({PENDING_ROWS_SQL}) p ORDER BY mese_data, pos",
+                {"corsi": [corso], "mesi": [GEN, MAR]})
+    assert [(r["mese_data"], r["nome"], r["pos"]) for r in cur.fetchall()] == [(MAR, "Bis", 0)]
+    assert materialize_months(cur, corso, [MAR]) == [MAR]
+    assert month_rows(cur, corso, MAR) == [(0, "Bis", "b@example.com", 0, "")]
+    conn.rollback()
+
+
+def test_marked_month_is_not_filled(conn, cur):
+    corso = "LazyMarked"
+    enroll(cur, corso, [("A", "Uno", "a@example.com", "1", "", "")], GEN, GEN)
+    mark_materialized(cur, corso, [GEN])
+    assert materialize_months(cur, corso, [GEN]) == []
+    assert month_rows(cur, corso, GEN) == []
+    conn.rollback()
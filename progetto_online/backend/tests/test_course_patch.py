@@ -0,0 +1,81 @@
+MESE = "Marzo-2026"
+
+
+def patch(client, corso, **body):
+    res = client.patch(f"/admin/course-data/{corso}", json=dict(body, mese=MESE))
+    return res.status_code, res.get_json()
+
+
+def changes(client, corso, since):
+    res = client.get(f"/admin/course-data/{corso}/changes?mese={MESE}&since={since}")
+    assert res.status_code == 200
+    return res.get_json()
+
+
+def test_patch_versions_conflicts_and_tombstones(admin_client, conn, cur):
+    corso = "PatchTest"
+    status, data = patch(admin_client, corso, insert=[
+        {"client_id": "a", "nome": "A", "email": "patch-a@example.com", "importo": "15"},
+        {"client_id": "b", "nome": "B", "email": "patch-b@example.com"},
+    ])
+    assert status == 200
+    ids = data["inserted"]
+    assert set(ids) == {"a", "b"}
+    rows = {r["row_id"]: r for r in data["rows"]}
+    assert [rows[ids[k]]["row_index"] for k in "ab"] == [0, 1]
+    assert rows[ids["a"]]["version"] == 1
+    # senza since solo le righe toccate, e niente cursore
+    assert data["cursor"] is None and data["reset"] is False
+
+    start = changes(admin_client, corso, 0)
+    assert {r["row_id"] for r in start["rows"]} == set(ids.values())
+    cursor = start["cursor"]
+
+    status, data = patch(admin_client, corso, update=[{"row_id": ids["a"], "version": 1, "pagato": True}])
+    assert status == 200
+    (row,) = data["rows"]
+    assert (row["version"], row["pagato"], row["nome"], row["importo"]) == (2, True, "A", "15")
+
+    # versione vecchia su a: niente viene applicato, nemmeno l'aggiornamento valido di b
+    status, data = patch(admin_client, corso, update=[
+        {"row_id": ids["a"], "version": 1, "nome": "Perso"},
+        {"row_id": ids["b"], "version": 1, "nome": "Nemmeno"},
+    ])
+    assert status == 409
+    assert [(r["row_id"], r["version"], r["nome"]) for r in data["conflicts"]] == [(ids["a"], 2, "A")]
+    assert data["deleted"] == []
+    cur.execute("SELECT nome, version FROM corsi_data WHERE id = %s", (ids["b"],))
+    assert cur.fetchone() == {"nome": "B", "version": 1}
+    conn.rollback()
+
+    status, data = patch(admin_client, corso, delete=[{"row_id": ids["b"], "version": 1}])
+    assert status == 200 and data["deleted"] == [ids["b"]]
+    status, data = patch(admin_client, corso, delete=[{"row_id": ids["b"], "version": 1}])
+    assert status == 409 and data["deleted"] == [ids["b"]]
+
+    delta = changes(admin_client, corso, cursor)
+    assert [r["row_id"] for r in delta["rows"]] == [ids["a"]]
+    assert delta["deleted"] == [ids["b"]]
+    assert delta["reset"] is False and delta["cursor"] > cursor
+    assert changes(admin_client, corso, delta["cursor"])["rows"] == []
+
+    cur.execute("SELECT total_cassa FROM course_totals WHERE corso = %s AND mese = %s", (corso, MESE))
+    assert cur.fetchone()["total_cassa"] == 15
+    conn.rollback()
+
+    # salvataggio completo del mese: chi sincronizza deve ricaricare tutto
+    res = admin_client.post(f"/admin/course-data/{corso}", json={"mese": MESE, "rows": [
+        {"nome": "C", "email": "patch-c@example.com"}]})
+    assert res.status_code == 200
+    after = changes(admin_client, corso, delta["cursor"])
+    assert after["reset"] is True
+    assert [r["nome"] for r in after["rows"]] == ["C"]
+
+
+def test_patch_rejects_bad_input(admin_client):
+    assert admin_client.patch("/admin/course-data/PatchTest",
+                              json={"mese": MESE, "update": [{"row_id": "x", "version": 1}]}).status_code == 400
+    assert admin_client.patch("/admin/course-data/PatchTest",
+                              json={"mese": "Marzo", "update": []}).status_code == 400
+    assert admin_client.patch("/admin/course-data/PatchTest",
+                              json={"mese": MESE, "delete": {"row_id": 1}}).status_code == 400
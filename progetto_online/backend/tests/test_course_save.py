@@ -0,0 +1,83 @@
+# Il salvataggio set-based (save_course_month) deve produrre gli stessi dati
+# del vecchio ciclo riga per riga, propagazione da Ottobre-2025 compresa.
+import pytest
+
+pytest.importorskip("psycopg2")
+from course_months import materialize_months
+
+FIELDS = "row_index, nome, cognome, email, cell, tessera, datacert, pagato, importo"
+
+
+def legacy_save(flask_app, cur, corso, mese, rows):
+    # il ciclo originale di save_course_data_route, sulla colonna mese_data
+    d = flask_app.mese_date(mese)
+    cur.execute("DELETE FROM corsi_data WHERE corso=%s AND mese_data=%s", (corso, d))
+    saved_rows = []
+    for r in rows:
+        nome, cognome, email, cell, tessera, datacert, pagato, importo = flask_app.course_row_values(r)
+        cur.execute("SELECT COALESCE(MAX(row_index), -1) + 1 AS idx FROM corsi_data WHERE corso=%s AND mese_data=%s",
+                    (corso, d))
+        idx = cur.fetchone()["idx"]
+        cur.execute(f"INSERT INTO corsi_data (corso, mese_data, {FIELDS}) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)",
+                    (corso, d, idx, nome, cognome, email, cell, tessera, datacert, pagato, importo))
+        saved_rows.append({"index": idx, "email": email})
+        if mese == "Ottobre-2025":
+            for m in flask_app.generate_months():
+                dm = flask_app.mese_date(m)
+                cur.execute("SELECT row_index FROM corsi_data WHERE corso=%s AND email=%s AND cell=%s AND mese_data=%s",
+                            (corso, email, cell, dm))
+                if cur.fetchone():
+                    cur.execute("""
+                        UPDATE corsi_data SET nome=%s, cognome=%s, tessera=%s, datacert=%s
+                        WHERE corso=%s AND email=%s AND cell=%s AND mese_data=%s
+                    """, (nome, cognome, tessera, datacert, corso, email, cell, dm))
+                else:
+                    cur.execute("SELECT COALESCE(MAX(row_index),-1)+1 AS idx FROM corsi_data WHERE corso=%s AND mese_data=%s",
+                                (corso, dm))
+                    new_idx = cur.fetchone()["idx"]
+                    cur.execute(f"INSERT INTO corsi_data (corso, mese_data, {FIELDS}) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,0,'')",
+                                (corso, dm, new_idx, nome, cognome, email, cell, tessera, datacert))
+    return saved_rows
+
+
+def row(nome, email, cell, tessera="", pagato=False, importo=""):
+    return {"nome": nome, "cognome": "Test", "email": email, "cell": cell, "tessera": tessera,
+            "dataCert": "2026-01-01", "pagato": pagato, "importo": importo}
+
+
+STEPS = [
+    ("Ottobre-2025", [row("Anna", "a@example.com", "1"), row("Bruno", "b@example.com", "2")]),
+    # un mese successivo con pagamenti e un membro solo suo
+    ("Gennaio-2026", [row("Anna", "a@example.com", "1", pagato=True, importo="30"),
+                      row("Xeno", "x@example.com", "9", importo="10")]),
+    # Bruno tolto, Anna modificata e ripetuta (vince l'ultima), due nuovi membri di cui uno senza contatti
+    ("Ottobre-2025", [row("Anna", "a@example.com", "1", tessera="T1"), row("Carla", "c@example.com", "3"),
+                      row("Anna Bis", "a@example.com", "1", tessera="T2"), row("Dario", "", "")]),
+]
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_set_based_save_matches_legacy_loop(flask_app, conn, cur, monkeypatch, lazy):
+    monkeypatch.setattr(flask_app, "LAZY_MONTHS", lazy)
+    legacy, set_based = f"SaveLegacy{lazy}", f"SaveSet{lazy}"
+    for mese, rows in STEPS:
+        assert flask_app.save_course_month(cur, set_based, mese, rows) == legacy_save(flask_app, cur, legacy, mese, rows)
+
+    dates = [flask_app.mese_date(m) for m in flask_app.generate_months()]
+    # i mesi non ancora materializzati si leggono come li scriverebbe la prima GET
+    materialize_months(cur, set_based, dates)
+    for d in dates:
+        result = {}
+        for corso in (legacy, set_based):
+            cur.execute(f"SELECT {FIELDS} FROM corsi_data WHERE corso=%s AND mese_data=%s ORDER BY row_index",
+                        (corso, d))
+            result[corso] = [tuple(r.values()) for r in cur.fetchall()]
+        assert result[set_based] == result[legacy], d
+
+    # controllo diretto dei casi che contano
+    cur.execute(f"SELECT {FIELDS} FROM corsi_data WHERE corso=%s AND mese_data='2026-01-01' ORDER BY row_index",
+                (set_based,))
+    gennaio = [(r["nome"], r["email"], r["tessera"], r["pagato"], r["importo"]) for r in cur.fetchall()]
+    assert gennaio == [("Anna Bis", "a@example.com", "T2", 1, "30"), ("Xeno", "x@example.com", "", 0, "10"),
+                       ("Carla", "c@example.com", "", 0, ""), ("Dario", "", "", 0, "")]
+    conn.rollback()
@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+
+def test_totals_roundtrip(admin_client, conn, cur):
+    corso = "TotaliRotte"
+    cur.execute("""
+        INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+        VALUES (%s, 0, '2026-05-01', 'A', 'A', 'a@example.com', '1', '', '', 1, '12,30')
+    """, (corso,))
+    conn.commit()
+    res = admin_client.post(f"/admin/course-totals/{corso}", json={"mese": "Maggio-2026", "total_istruttore": 4})
+    assert res.status_code == 200
+    res = admin_client.get(f"/admin/course-totals/{corso}?mese=Maggio-2026")
+    assert res.get_json()["totals"] == {"total_cassa": 12.3, "total_istruttore": 4}
+
+
+@pytest.mark.parametrize("mese", ["Maggio", "Foo-2026", "", "Maggio-0", "Maggio-20260"])
+def test_totals_reject_bad_month(admin_client, mese):
+    res = admin_client.get(f"/admin/course-totals/Karate?mese={mese}")
+    assert res.status_code == 400
+    res = admin_client.post("/admin/course-totals/Karate", json={"mese": mese, "total_istruttore": 1})
+    assert res.status_code == 400
@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+import psycopg2.extensions
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeout
+
+
+def make_pool(dsn, **kw):
+    kw.setdefault("minconn", 0)
+    kw.setdefault("maxconn", 2)
+    return ConnectionPool(dsn=dsn, **kw)
+
+
+def test_expired_connection_is_replaced(dsn):
+    pool = make_pool(dsn, max_lifetime=0.05)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    time.sleep(0.1)
+    # scaduta anche se inattiva: chiusa al prelievo e sostituita
+    fresh = pool.getconn()
+    assert fresh is not conn and conn.closed
+    assert pool.stats()["expired"] == 1
+    time.sleep(0.1)
+    # scaduta mentre era in uso: chiusa alla restituzione
+    pool.putconn(fresh)
+    assert fresh.closed and pool.stats()["size"] == 0
+    pool.closeall()
+
+
+def test_dead_connection_fails_health_check(dsn):
+    pool = make_pool(dsn)
+    conn = pool.getconn()
+    pid = conn.get_backend_pid()
+    pool.putconn(conn)
+    other = psycopg2.connect(dsn)
+    other.cursor().execute("SELECT pg_terminate_backend(%s)", (pid,))
+    other.close()
+
+    fresh = pool.getconn()
+    assert fresh is not conn and fresh.get_backend_pid() != pid
+    assert pool.stats()["health_check_failures"] == 1
+    pool.putconn(fresh)
+    pool.closeall()
+
+
+def test_returned_connection_is_reset(dsn):
+    pool = make_pool(dsn, maxconn=1)
+    conn = pool.getconn()
+    conn.cursor().execute("SELECT 1")
+    assert conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    conn = pool.getconn()
+    with pytest.raises(psycopg2.Error):
+        conn.cursor().execute("SELECT 1/0")
+    pool.putconn(conn)
+    # stessa connessione, di nuovo utilizzabile
+    assert pool.getconn() is conn
+    assert pool.stats()["resets"] == 2
+    pool.putconn(conn, close=True)
+    assert conn.closed and pool.stats()["size"] == 0
+
+
+def test_timeout_and_handoff(dsn):
+    pool = make_pool(dsn, maxconn=1, timeout=0.1)
+    conn = pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()["timeouts"] == 1
+
+    # chi aspetta riceve la connessione appena torna nel pool
+    pool.timeout = 5
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+    time.sleep(0.1)
+    pool.putconn(conn)
+    waiter.join(5)
+    assert got == [conn]
+    assert pool.stats()["waits"] >= 1
+    pool.putconn(conn)
+    pool.closeall()
+
+
+def test_failed_connect_releases_the_slot():
+    pool = ConnectionPool(minconn=0, maxconn=1, timeout=0.1, host="/nonexistent", port=1)
+    # se il posto restasse prenotato la seconda chiamata scadrebbe con PoolTimeout
+    for _ in range(2):
+        with pytest.raises(psycopg2.OperationalError):
+            pool.getconn()
+    assert pool.stats()["size"] == 0
+
+
+def test_connect_runs_outside_the_lock(dsn):
+    entered, release = threading.Event(), threading.Event()
+
+    class SlowConnection(psycopg2.extensions.connection):
+        def __init__(self, *args, **kw):
+            entered.set()
+            release.wait(5)
+            super().__init__(*args, **kw)
+
+    pool = make_pool(dsn, connection_factory=SlowConnection)
+    got = []
+    opener = threading.Thread(target=lambda: got.append(pool.getconn()))
+    opener.start()
+    assert entered.wait(5)
+    # il pool risponde mentre l'altro thread sta ancora aprendo la connessione
+    stats = pool.stats()
+    assert stats["size"] == 1 and stats["in_use"] == 1
+    release.set()
+    opener.join(5)
+    pool.putconn(got[0])
+    pool.closeall()
+
+
+def test_pool_is_recreated_after_fork(dsn, monkeypatch):
+    params = psycopg2.extensions.parse_dsn(dsn)
+    for key, env in (("host", "DB_HOST"), ("user", "DB_USER"), ("password", "DB_PASSWORD"),
+                     ("dbname", "DB_NAME"), ("port", "DB_PORT")):
+        monkeypatch.setenv(env, params.get(key, ""))
+    monkeypatch.setenv("DB_POOL_MIN", "0")
+    monkeypatch.setattr(db_pool, "_pool", None)
+    parent = db_pool.get_pool()
+    assert db_pool.get_pool() is parent
+
+    # nel figlio di gunicorn il pid cambia: pool nuovo, senza le connessioni del padre
+    monkeypatch.setattr(db_pool.os, "getpid", lambda: parent._pid + 1)
+    child = db_pool.get_pool()
+    assert child is not parent and child._pid == parent._pid + 1
+    conn = child.getconn()
+    assert child.stats()["in_use"] == 1 and parent.stats()["size"] == 0
+    child.putconn(conn)
+    child.closeall()
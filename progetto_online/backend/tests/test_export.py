@@ -0,0 +1,102 @@
+import io
+import csv
+import zipfile
+from decimal import Decimal
+from datetime import date
+from xml.etree import ElementTree
+
+import pytest
+
+from export import csv_chunks, xlsx_chunks, EXPORT_COLUMNS
+
+NS = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+def make_rows(n):
+    return [{"corso": "Yoga", "mese": "Gennaio-2026", "nome": f"Nome{i}", "cognome": "Rossi, \"detto\" Mario",
+             "email": f"u{i}@example.com", "cell": "333", "tessera": "", "datacert": None,
+             "pagato": i % 2, "importo_num": Decimal("10.50") if i % 2 else None} for i in range(n)]
+
+
+def read_xlsx(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        sheet = ElementTree.fromstring(zf.read("xl/worksheets/sheet1.xml"))
+    rows = []
+    for row in sheet.iterfind(".//s:row", NS):
+        rows.append([c.findtext("s:v", namespaces=NS) or c.findtext("s:is/s:t", namespaces=NS) or ""
+                     for c in row.iterfind("s:c", NS)])
+    return rows
+
+
+def test_csv_chunks():
+    chunks = list(csv_chunks(make_rows(5), chunk_rows=2))
+    # intestazione, 2 + 2 righe, 1 riga finale
+    assert len(chunks) == 4
+    assert chunks[0].startswith("\ufeffCorso,Mese,")
+    rows = list(csv.reader(io.StringIO("".join(chunks).lstrip("\ufeff"))))
+    assert rows[0] == [title for _, title in EXPORT_COLUMNS]
+    assert len(rows) == 6
+    assert rows[1][3] == 'Rossi, "detto" Mario'
+    assert (rows[1][7], rows[1][8], rows[1][9]) == ("", "No", "")
+    assert (rows[2][8], rows[2][9]) == ("Sì", "10.50")
+
+
+def test_csv_chunks_no_rows():
+    assert "".join(csv_chunks([])).count("\n") == 1
+
+
+def test_xlsx_chunks_streams_valid_workbook():
+    rows = make_rows(1200)
+    rows[0]["nome"] = "ctrl\x01<&>"
+    consumed = []
+
+    def source():
+        for r in rows:
+            consumed.append(r)
+            yield r
+
+    gen = xlsx_chunks(source(), chunk_rows=500)
+    chunks = [next(gen)]
+    # le parti fisse escono prima di leggere qualunque riga
+    assert chunks[0].startswith(b"PK") and not consumed
+    chunks.extend(gen)
+    sheet = read_xlsx(b"".join(chunks))
+    assert sheet[0] == [title for _, title in EXPORT_COLUMNS]
+    assert len(sheet) == 1201
+    assert sheet[1][2] == "ctrl<&>"
+    assert (sheet[2][8], sheet[2][9]) == ("Sì", "10.50")
+
+
+def test_export_reads_unmaterialized_months_without_writing(flask_app, admin_client, conn, cur):
+    corso = "ExportTest"
+    # Gennaio materializzato (con un pagamento), Febbraio solo nelle iscrizioni
+    cur.execute("""
+        INSERT INTO course_enrollments (corso, nome, cognome, email, cell, tessera, datacert, from_mese, to_mese)
+        VALUES (%(c)s, 'B', 'Due', 'b@example.com', '2', '', '', '2026-01-01', '2026-02-01'),
+               (%(c)s, 'A', 'Uno', 'a@example.com', '1', '', '', '2026-01-01', '2026-02-01'),
+               (%(c)s, 'A', 'Doppio', 'a@example.com', '1', '', '', '2026-02-01', '2026-03-01')
+    """, {"c": corso})
+    conn.commit()
+    from course_months import materialize_months
+    materialize_months(cur, corso, [date(2026, 1, 1)])
+    cur.execute("UPDATE corsi_data SET pagato = 1, importo = '20' WHERE corso = %s AND email = 'a@example.com'",
+                (corso,))
+    conn.commit()
+
+    res = admin_client.get(f"/admin/export?format=csv&corsi={corso}&da=Gennaio-2026&a=Febbraio-2026")
+    assert res.status_code == 200
+    rows = list(csv.reader(io.StringIO(res.get_data(as_text=True).lstrip("\ufeff"))))[1:]
+    assert [(r[1], r[3], r[8], r[9]) for r in rows] == [
+        ("Gennaio-2026", "Due", "No", ""), ("Gennaio-2026", "Uno", "Sì", "20.00"),
+        ("Febbraio-2026", "Due", "No", ""), ("Febbraio-2026", "Uno", "No", ""),
+    ]
+
+    cur.execute("SELECT mese_data FROM course_months WHERE corso = %s", (corso,))
+    assert [r["mese_data"] for r in cur.fetchall()] == [date(2026, 1, 1)]
+    cur.execute("SELECT COUNT(*) AS n FROM corsi_data WHERE corso = %s AND mese_data = '2026-02-01'", (corso,))
+    assert cur.fetchone()["n"] == 0
+
+
+def test_export_rejects_bad_format(admin_client):
+    assert admin_client.get("/admin/export?format=pdf&anno=2026").status_code == 400
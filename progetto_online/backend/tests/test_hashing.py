@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("bcrypt")
+from hashing import PasswordHasher, HashingBusy
+
+
+def blocking(event):
+    event.wait(5)
+    return "fatto"
+
+
+def test_thread_pool_rejects_when_queue_full():
+    hasher = PasswordHasher(rounds=4, mode="thread", workers=1, max_queue=1)
+    gate = threading.Event()
+    running = hasher._submit(blocking, gate)
+    queued = hasher._submit(blocking, gate)
+    with pytest.raises(HashingBusy):
+        hasher._submit(blocking, gate)
+    assert hasher.stats()["in_flight"] == 2
+    assert hasher.stats()["rejected"] == 1
+
+    gate.set()
+    assert running.result(5) == queued.result(5) == "fatto"
+    assert hasher.stats()["in_flight"] == 0
+    # slot liberati: si può di nuovo sottomettere
+    assert hasher._submit(blocking, gate).result(5) == "fatto"
+
+
+def test_timeout_keeps_slot_until_done():
+    hasher = PasswordHasher(rounds=4, mode="thread", workers=1, max_queue=0, timeout=0.05)
+    gate = threading.Event()
+    with pytest.raises(HashingBusy, match="Timeout"):
+        hasher._run(blocking, gate)
+    with pytest.raises(HashingBusy, match="Troppe"):
+        hasher._run(blocking, gate)
+    gate.set()
+    hasher._executor.shutdown(wait=True)
+    assert hasher.stats()["in_flight"] == 0
+
+
+def test_inline_async_uses_the_same_slots():
+    hasher = PasswordHasher(rounds=4, mode="inline", workers=1, max_queue=0, timeout=0.05)
+    gate = threading.Event()
+
+    async def scenario():
+        first = asyncio.ensure_future(hasher._run_async(blocking, gate))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HashingBusy, match="Troppe"):
+            await hasher._run_async(blocking, gate)
+        with pytest.raises(HashingBusy, match="Timeout"):
+            await first
+        # il thread sta ancora calcolando: lo slot resta occupato
+        assert hasher.stats()["in_flight"] == 1
+        gate.set()
+        for _ in range(100):
+            if not hasher.stats()["in_flight"]:
+                break
+            await asyncio.sleep(0.01)
+        assert await hasher.verify_async("pw", hasher.hash("pw")) is True
+
+    asyncio.run(scenario())
+    assert hasher.stats()["rejected"] == 1
+
+
+def test_needs_rehash():
+    hasher = PasswordHasher(rounds=5, mode="inline")
+    assert hasher.needs_rehash(hasher.hash("pw")) is False
+    assert PasswordHasher(rounds=4, mode="inline").needs_rehash(hasher.hash("pw")) is True
+    assert hasher.needs_rehash("!") is False
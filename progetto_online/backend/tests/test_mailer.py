@@ -0,0 +1,114 @@
+import contextlib
+import threading
+
+import pytest
+
+pytest.importorskip("flask_mail")
+from flask import Flask
+from flask_mail import Mail
+from conftest import TEST_SCHEMA
+from db_pool import ConnectionPool
+from mailer import MailWorker, enqueue
+
+
+def make_app():
+    # Message() legge il mittente predefinito dall'app corrente
+    app = Flask("test-mailer")
+    app.config["MAIL_DEFAULT_SENDER"] = "gym@example.com"
+    Mail(app)
+    return app
+
+
+class FakeMail:
+    def __init__(self, on_send=None, fail=False):
+        self.sent = []
+        self.on_send = on_send
+        self.fail = fail
+
+    @contextlib.contextmanager
+    def connect(self):
+        yield self
+
+    def send(self, message):
+        if self.on_send:
+            self.on_send()
+        if self.fail:
+            raise OSError("SMTP giù")
+        self.sent.append(message.recipients[0])
+
+
+def make_worker(dsn, mail, **kw):
+    pool = ConnectionPool(minconn=0, maxconn=3, dsn=dsn, options=f"-c search_path={TEST_SCHEMA}")
+    return MailWorker(make_app(), mail, lambda: pool, rate_per_minute=0, **kw)
+
+
+@pytest.fixture
+def queue(conn, cur):
+    cur.execute("TRUNCATE mail_queue")
+    enqueue(cur, [(f"m{i}@example.com", "Oggetto", "Testo") for i in range(3)])
+    conn.commit()
+    return cur
+
+
+def test_only_one_worker_drains_at_a_time(dsn, conn, queue):
+    other = make_worker(dsn, FakeMail())
+    seen = []
+    worker = make_worker(dsn, FakeMail(on_send=lambda: seen.append(other.drain_once())))
+
+    assert worker.drain_once() == 3
+    # mentre il primo inviava, il secondo non ha prelevato nulla
+    assert seen == [0, 0, 0]
+    assert worker.mail.sent == ["m0@example.com", "m1@example.com", "m2@example.com"]
+    assert other.mail.sent == []
+    # lock rilasciato: ora il secondo può inviare (coda vuota)
+    assert other.drain_once() == 0
+    queue.execute("SELECT COUNT(*) AS n FROM mail_queue WHERE status = 'sent'")
+    assert queue.fetchone()["n"] == 3
+
+
+def test_failures_are_retried_then_failed(dsn, conn, queue):
+    worker = make_worker(dsn, FakeMail(fail=True), max_attempts=2, backoff_seconds=60)
+    assert worker.drain_once() == 3
+    conn.commit()
+    queue.execute("SELECT status, attempts, next_attempt_at > NOW() AS later FROM mail_queue ORDER BY id")
+    assert [(r["status"], r["attempts"], r["later"]) for r in queue.fetchall()] == [("pending", 1, True)] * 3
+
+    queue.execute("UPDATE mail_queue SET next_attempt_at = NOW()")
+    conn.commit()
+    assert worker.drain_once() == 3
+    conn.commit()
+    queue.execute("SELECT DISTINCT status, last_error FROM mail_queue")
+    assert queue.fetchall() == [{"status": "failed", "last_error": "SMTP giù"}]
+
+
+def test_start_is_idempotent_across_threads():
+    worker = MailWorker(make_app(), FakeMail(), lambda: None)
+    stop = threading.Event()
+    worker.run_forever = lambda: stop.wait(5)
+    start = threading.Barrier(8)
+
+    def call():
+        start.wait()
+        worker.start()
+
+    callers = [threading.Thread(target=call) for _ in range(8)]
+    for t in callers:
+        t.start()
+    for t in callers:
+        t.join(5)
+    try:
+        assert [t.name for t in threading.enumerate()].count("mail-worker") == 1
+    finally:
+        stop.set()
+        worker._thread.join(5)
+
+
+@pytest.mark.parametrize("batch_size, rate, stale, expected", [
+    (50, 60, 600, 600),      # blocco da 50 s: basta la finestra configurata
+    (50, 1, 600, 6000),      # blocco da 50 minuti: la finestra si allarga
+    (50, 0, 600, 600),       # senza limite di velocità
+])
+def test_stale_window_covers_a_batch(batch_size, rate, stale, expected):
+    worker = MailWorker(make_app(), FakeMail(), lambda: None, batch_size=batch_size,
+                        rate_per_minute=rate, stale_seconds=stale)
+    assert worker.stale_seconds == expected
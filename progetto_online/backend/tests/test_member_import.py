@@ -0,0 +1,147 @@
+import io
+import re
+from datetime import date
+
+import pytest
+
+pytest.importorskip("bcrypt")
+from member_import import _normalize, import_members, ImportFormatError
+from hashing import UNUSABLE_PASSWORD, PasswordHasher
+
+MESE, MESE_DATA = "Gennaio-2026", date(2026, 1, 1)
+
+
+def normalized(text):
+    out, n = _normalize(io.BytesIO(text.encode("utf-8")))
+    with out:
+        return out.read().splitlines(), n
+
+
+def test_normalize_semicolon_bom_and_aliases():
+    lines, n = normalized("\ufeffNome;Cognome;E-mail;Cellulare;Importo pagato\r\n"
+                          "Mario;Rossi;mario@example.com;333;10,50\r\n"
+                          ";;;;\r\n"
+                          "Anna;Bianchi;anna@example.com;;\r\n")
+    assert n == 2
+    # riga, nome, cognome, email, cell, tessera, datacert, pagato, importo
+    assert lines == ["2,Mario,Rossi,mario@example.com,333,,,,\"10,50\"",
+                     "4,Anna,Bianchi,anna@example.com,,,,,"]
+
+
+def test_normalize_short_rows_and_comma():
+    lines, n = normalized("email,nome,pagato\nx@example.com\n")
+    assert n == 1
+    assert lines == ["2,,,x@example.com,,,,,"]
+
+
+@pytest.mark.parametrize("text, message", [
+    ("", "File vuoto"),
+    ("nome;cognome\nMario;Rossi\n", "Colonna email mancante"),
+])
+def test_normalize_rejects(text, message):
+    with pytest.raises(ImportFormatError, match=message):
+        _normalize(io.BytesIO(text.encode("utf-8")))
+
+
+def test_normalize_rejects_non_utf8():
+    with pytest.raises(ImportFormatError, match="UTF-8"):
+        _normalize(io.BytesIO("email\nà@example.com\n".encode("latin-1")))
+
+
+def test_unusable_password_never_verifies():
+    hasher = PasswordHasher(rounds=4, mode="inline")
+    assert hasher.verify("!", UNUSABLE_PASSWORD) is False
+    assert hasher.verify("", "") is False
+    assert hasher.verify("pw", hasher.hash("pw")) is True
+
+
+CSV = ("nome;cognome;email;cell;datacert;pagato;importo\n"
+       "Mario;Rossi;imp-new@example.com;333;01/02/2026;sì;10,50\n"
+       "Anna;Bianchi;imp-existing@example.com;334;;;\n"
+       "Luca;Verdi;non-valida;335;;;\n"
+       "Mario;Rossi;imp-new@example.com;333;;;\n"
+       "Sara;Neri;imp-bad@example.com;336;31/02/2026;forse;abc\n")
+
+
+def import_csv(cur, corso, dry_run=False):
+    return import_members(cur, corso, MESE, MESE_DATA, io.BytesIO(CSV.encode("utf-8")), dry_run)
+
+
+def test_import_validation_and_new_users(conn, cur):
+    corso = "ImportTest"
+    cur.execute("INSERT INTO utenti (nome_cognome, email, password_hash, phone) VALUES (%s, %s, %s, %s)",
+                ("Anna Bianchi", "imp-existing@example.com", "$2b$04$placeholder", "334"))
+
+    summary = import_csv(cur, corso)
+    conn.commit()
+
+    assert summary["rows"] == 5
+    assert summary["imported"] == 2
+    assert summary["users_created"] == 1
+    assert [(e["line"], e["message"]) for e in summary["errors"]] == [
+        (4, "Email non valida"),
+        (5, "Email ripetuta nel file (riga 2)"),
+        (6, "Valore di pagato non valido"),
+    ]
+
+    cur.execute("SELECT email, password_hash FROM utenti WHERE email LIKE 'imp-%%' ORDER BY email")
+    users = {r["email"]: r["password_hash"] for r in cur.fetchall()}
+    assert users == {"imp-existing@example.com": "$2b$04$placeholder", "imp-new@example.com": UNUSABLE_PASSWORD}
+
+    cur.execute("""
+        SELECT row_index, email, pagato, importo_num, datacert_date FROM corsi_data
+        WHERE corso = %s AND mese_data = %s ORDER BY row_index
+    """, (corso, MESE_DATA))
+    rows = cur.fetchall()
+    assert [(r["row_index"], r["email"], r["pagato"]) for r in rows] == [
+        (0, "imp-new@example.com", 1), (1, "imp-existing@example.com", 0)]
+    assert str(rows[0]["importo_num"]) == "10.50"
+    assert rows[0]["datacert_date"] == date(2026, 2, 1)
+
+    # stesso file una seconda volta: tutto già presente, niente di nuovo
+    again = import_csv(cur, corso)
+    conn.commit()
+    assert again["imported"] == 0
+    assert {e["message"] for e in again["errors"]} >= {"Già presente nel mese"}
+
+
+def test_import_dry_run_writes_nothing(conn, cur):
+    corso = "ImportDryRun"
+    summary = import_csv(cur, corso, dry_run=True)
+    conn.rollback()
+    assert summary["dry_run"] and summary["imported"] == 0 and len(summary["errors"]) == 3
+    cur.execute("SELECT COUNT(*) AS n FROM corsi_data WHERE corso = %s", (corso,))
+    assert cur.fetchone()["n"] == 0
+
+
+def test_imported_account_is_claimed_through_an_invite(flask_app, admin_client, conn, cur):
+    cur.execute("""
+        INSERT INTO utenti (nome_cognome, email, password_hash, phone) VALUES (%s, %s, %s, %s) RETURNING id
+    """, ("Claim Me", "imp-claim@example.com", UNUSABLE_PASSWORD, "337"))
+    user_id = cur.fetchone()["id"]
+    conn.commit()
+    client = flask_app.app.test_client()
+    login = {"email": "imp-claim@example.com", "password": "Segreta123"}
+    assert client.post("/login", json=login).status_code == 401
+
+    # chi conosce solo l'email non può prendersi l'account
+    res = client.post("/register", json={"nome_cognome": "Claim Me", "phone": "337", **login})
+    assert res.status_code == 400 and res.get_json()["message"] == "Email già esistente"
+    assert client.post("/login", json=login).status_code == 401
+
+    assert admin_client.post("/admin/users/999999/invite").status_code == 404
+    assert client.post(f"/admin/users/{user_id}/invite").status_code == 401
+    assert admin_client.post(f"/admin/users/{user_id}/invite").status_code == 200
+    cur.execute("SELECT body FROM mail_queue WHERE recipient = %s ORDER BY id DESC LIMIT 1", (login["email"],))
+    token = re.search(r"\?claim=(\S+)", cur.fetchone()["body"]).group(1)
+    conn.rollback()
+
+    res = client.post("/claim-account", json={"token": token[:-2] + "xx", "password": login["password"]})
+    assert res.status_code == 400
+    res = client.post("/claim-account", json={"token": token, "password": login["password"]})
+    assert res.status_code == 200
+    assert client.post("/login", json=login).status_code == 200
+    # l'invito vale una volta sola, e un account attivo non si invita
+    res = client.post("/claim-account", json={"token": token, "password": "Altra1234"})
+    assert res.status_code == 400
+    assert admin_client.post(f"/admin/users/{user_id}/invite").status_code == 400
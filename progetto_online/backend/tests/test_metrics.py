@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("psycopg2")
+from flask import Flask
+from metrics import Metrics
+
+
+def series(metrics, histogram, labels):
+    return getattr(metrics, histogram).series.get(labels)
+
+
+def test_flask_request_counts_queries():
+    metrics = Metrics(slow_query_seconds=0.5, n_plus_one_threshold=2)
+    app = Flask(__name__)
+    metrics.init_app(app)
+
+    @app.route("/corsi/<corso>")
+    def corsi(corso):
+        for _ in range(3):
+            metrics.observe_query("SELECT 1", 0.01)
+        return "ok"
+
+    assert app.test_client().get("/corsi/Yoga").status_code == 200
+    labels = ("/corsi/<corso>", "GET")
+    assert series(metrics, "request_latency", labels + ("200",))[2] == 1
+    assert series(metrics, "request_queries", labels)[1] == 3
+    assert series(metrics, "request_db_time", labels)[1] == pytest.approx(0.03)
+    assert metrics.n_plus_one.series[labels] == 1
+    assert 'route="/corsi/<corso>"' in metrics.render()
+
+
+def test_query_outside_requests():
+    metrics = Metrics(slow_query_seconds=0.1)
+    metrics.observe_query("SELECT pg_sleep(1)", 1.0)
+    assert metrics.slow_queries.series[("-",)] == 1
+
+
+def test_quart_routes_use_the_same_metrics():
+    quart = pytest.importorskip("quart")
+    metrics = Metrics(n_plus_one_threshold=0)
+    app = quart.Quart(__name__)
+    metrics.init_quart(app)
+
+    @app.route("/me")
+    async def me():
+        metrics.observe_query("SELECT 1", 0.02)
+        # query eseguite in un thread della richiesta (materializzazione)
+        await asyncio.to_thread(metrics.observe_query, "SELECT 2", 0.03)
+        return {"status": "ok"}, 201
+
+    async def call():
+        return await app.test_client().get("/me")
+
+    assert asyncio.run(call()).status_code == 201
+    labels = ("/me", "GET")
+    assert series(metrics, "request_latency", labels + ("201",))[2] == 1
+    assert series(metrics, "request_queries", labels)[1] == 2
+    assert series(metrics, "request_db_time", labels)[1] == pytest.approx(0.05)
+    assert metrics.query_latency.series[("/me",)][2] == 2
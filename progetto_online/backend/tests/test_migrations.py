@@ -0,0 +1,68 @@
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("psycopg2")
+from migrations import MIGRATIONS, migrate, applied_versions
+
+
+def test_versions_are_unique_and_increasing():
+    versions = [v for v, _, _ in MIGRATIONS]
+    assert versions == sorted(versions)
+    assert len(set(versions)) == len(versions)
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_all_applied_once_and_rerun_is_noop(schema):
+    cur = schema.cursor()
+    assert applied_versions(cur) == {v for v, _, _ in MIGRATIONS}
+    schema.commit()
+    assert migrate(schema, log=lambda msg: None) == []
+
+
+def test_course_totals_follow_payments_and_stale_totals_are_zeroed(conn, cur):
+    corso = "TotaliTest"
+    cur.execute("""
+        INSERT INTO course_totals (corso, mese, total_cassa, total_istruttore)
+        VALUES (%s, 'Marzo-2026', 99, 5), (%s, 'Aprile-2026', 77, 0)
+    """, (corso, corso))
+    cur.execute("""
+        INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+        VALUES (%(c)s, 0, '2026-03-01', 'A', 'A', 'a@example.com', '1', '', '', 1, '10,50'),
+               (%(c)s, 1, '2026-03-01', 'B', 'B', 'b@example.com', '2', '', '', 0, '20'),
+               (%(c)s, 2, '2026-03-01', 'C', 'C', 'c@example.com', '3', '', '', 1, 'gratis')
+    """, {"c": corso})
+    cur.execute("SELECT total_cassa FROM course_totals WHERE corso = %s AND mese = 'Marzo-2026'", (corso,))
+    # il trigger somma per differenza al valore (errato) già salvato
+    assert cur.fetchone()["total_cassa"] == pytest.approx(109.5)
+
+    step = next(steps for v, _, steps in MIGRATIONS if v == 12)[0]
+    cur.execute(step)
+    cur.execute("SELECT mese, total_cassa, total_istruttore FROM course_totals WHERE corso = %s ORDER BY mese",
+                (corso,))
+    assert [(r["mese"], r["total_cassa"], r["total_istruttore"]) for r in cur.fetchall()] == [
+        ("Aprile-2026", 0, 0), ("Marzo-2026", pytest.approx(10.5), 5)]
+
+    cur.execute("UPDATE corsi_data SET pagato = 1 WHERE corso = %s AND email = 'b@example.com'", (corso,))
+    cur.execute("DELETE FROM corsi_data WHERE corso = %s AND email = 'a@example.com'", (corso,))
+    cur.execute("SELECT total_cassa FROM course_totals WHERE corso = %s AND mese = 'Marzo-2026'", (corso,))
+    assert cur.fetchone()["total_cassa"] == pytest.approx(20)
+    conn.rollback()
+
+
+def test_total_cassa_is_exact_numeric(conn, cur):
+    corso = "TotaliNumeric"
+    cur.execute("""
+        SELECT data_type, numeric_precision, numeric_scale FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'course_totals' AND column_name = 'total_cassa'
+    """)
+    assert tuple(cur.fetchone().values()) == ("numeric", 12, 2)
+    cur.execute("""
+        INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+        VALUES (%(c)s, 0, '2026-03-01', 'A', 'A', 'a@example.com', '1', '', '', 1, '0,10'),
+               (%(c)s, 1, '2026-03-01', 'B', 'B', 'b@example.com', '2', '', '', 1, '0,20')
+    """, {"c": corso})
+    cur.execute("UPDATE corsi_data SET importo = '0,30' WHERE corso = %s AND row_index = 0", (corso,))
+    cur.execute("SELECT total_cassa FROM course_totals WHERE corso = %s AND mese = 'Marzo-2026'", (corso,))
+    assert cur.fetchone()["total_cassa"] == Decimal("0.50")
+    conn.rollback()
@@ -0,0 +1,58 @@
+from datetime import date
+
+import pytest
+
+from partitions import add_months, partition_name, ensure_partition, ensure_partitions, DEFAULT_PARTITION
+
+
+@pytest.mark.parametrize("d, n, expected", [
+    (date(2025, 10, 1), 0, date(2025, 10, 1)),
+    (date(2025, 10, 15), 3, date(2026, 1, 1)),
+    (date(2026, 1, 31), -1, date(2025, 12, 1)),
+    (date(2025, 12, 1), -24, date(2023, 12, 1)),
+    (date(2025, 1, 1), 60, date(2030, 1, 1)),
+])
+def test_add_months(d, n, expected):
+    assert add_months(d, n) == expected
+
+
+def test_partition_name():
+    assert partition_name(date(2026, 3, 1)) == "corsi_data_y2026m03"
+
+
+@pytest.mark.parametrize("mese, d", [
+    ("Gennaio-2026", date(2026, 1, 1)),
+    ("Dicembre-2025", date(2025, 12, 1)),
+])
+def test_mese_date_roundtrip(cur, mese, d):
+    cur.execute("SELECT mese_to_date(%s) AS d, date_to_mese(%s) AS m", (mese, d))
+    assert cur.fetchone() == {"d": d, "m": mese}
+
+
+@pytest.mark.parametrize("mese", ["Foo-2026", "Gennaio", "gennaio-2026", ""])
+def test_mese_to_date_invalid(cur, mese):
+    cur.execute("SELECT mese_to_date(%s) AS d", (mese,))
+    assert cur.fetchone()["d"] is None
+
+
+def test_rows_move_out_of_default_partition(conn, cur):
+    cur.execute("""
+        INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+        VALUES ('PartTest', 0, '2040-03-01', 'A', 'A', 'a@example.com', '1', '', '01/02/2040', 1, '5')
+    """)
+    cur.execute("SELECT tableoid::regclass::text AS t FROM corsi_data WHERE corso = 'PartTest'")
+    assert cur.fetchone()["t"] == DEFAULT_PARTITION
+
+    assert ensure_partition(cur, date(2040, 3, 20)) is True
+    assert ensure_partition(cur, date(2040, 3, 1)) is False
+    cur.execute("""
+        SELECT tableoid::regclass::text AS t, mese, importo_num, datacert_date
+        FROM corsi_data WHERE corso = 'PartTest'
+    """)
+    row = cur.fetchone()
+    # spostata con le colonne generate ricalcolate
+    assert row["t"] == "corsi_data_y2040m03"
+    assert row["mese"] == "Marzo-2040" and row["importo_num"] == 5 and row["datacert_date"] == date(2040, 2, 1)
+
+    assert ensure_partitions(cur, date(2040, 2, 1), date(2040, 4, 1)) == ["corsi_data_y2040m02", "corsi_data_y2040m04"]
+    conn.rollback()
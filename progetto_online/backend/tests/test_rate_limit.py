@@ -0,0 +1,131 @@
+import pytest
+
+import rate_limit
+from rate_limit import MemoryRateLimiter, PostgresRateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "time", lambda: now[0])
+    return now
+
+
+def test_memory_blocks_after_max_attempts(clock):
+    limiter = MemoryRateLimiter(max_attempts=3, block_seconds=60)
+    for _ in range(2):
+        limiter.record_failure("login_attempts", "1.2.3.4")
+    assert limiter.check("login_attempts", "1.2.3.4") == (False, 0)
+    limiter.record_failure("login_attempts", "1.2.3.4")
+    clock[0] += 10
+    assert limiter.check("login_attempts", "1.2.3.4") == (True, 50)
+    # scope e IP diversi non sono toccati
+    assert limiter.check("admin_attempts", "1.2.3.4") == (False, 0)
+    assert limiter.check("login_attempts", "5.6.7.8") == (False, 0)
+
+
+def test_memory_block_expires_and_restarts(clock):
+    limiter = MemoryRateLimiter(max_attempts=2, block_seconds=60)
+    for _ in range(2):
+        limiter.record_failure("login_attempts", "ip")
+    clock[0] += 60
+    limiter.record_failure("login_attempts", "ip")
+    # blocco scaduto: il nuovo fallimento riparte da 1
+    assert limiter.check("login_attempts", "ip") == (False, 0)
+
+
+def test_memory_sliding_window(clock):
+    limiter = MemoryRateLimiter(max_attempts=3, block_seconds=60)
+    for _ in range(3):
+        limiter.record_failure("login_attempts", "ip")
+        clock[0] += 50
+    # tre fallimenti, ma mai tre nella stessa finestra di 60 secondi
+    assert limiter.check("login_attempts", "ip") == (False, 0)
+    clock[0] -= 45
+    limiter.record_failure("login_attempts", "ip")
+    # ultimi tre a 1050, 1100, 1105: bloccato finché 1050 non esce dalla finestra
+    assert limiter.check("login_attempts", "ip") == (True, 5)
+    clock[0] += 5
+    assert limiter.check("login_attempts", "ip") == (False, 0)
+
+
+def test_memory_reset(clock):
+    limiter = MemoryRateLimiter(max_attempts=1, block_seconds=60)
+    limiter.record_failure("login_attempts", "ip")
+    assert limiter.check("login_attempts", "ip")[0]
+    limiter.reset("login_attempts", "ip")
+    assert limiter.check("login_attempts", "ip") == (False, 0)
+
+
+def test_memory_eviction_keeps_recent_entries(clock):
+    limiter = MemoryRateLimiter(max_attempts=1, block_seconds=60, max_entries=10)
+    for i in range(10):
+        clock[0] += 1
+        limiter.record_failure("login_attempts", f"ip{i}")
+    clock[0] += 1
+    limiter.record_failure("login_attempts", "new")
+    assert len(limiter._state) <= 10
+    assert limiter.check("login_attempts", "new")[0]
+    assert limiter.check("login_attempts", "ip9")[0]
+
+
+def test_postgres_backend(conn):
+    import psycopg2.extensions
+    idle = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    limiter = PostgresRateLimiter(max_attempts=3, block_seconds=60, get_conn=lambda: conn)
+    ip = "10.0.0.1"
+    with pytest.raises(ValueError):
+        limiter.check("utenti", ip)
+    for _ in range(3):
+        assert limiter.check("login_attempts", ip) == (False, 0)
+        # ogni operazione chiude la propria transazione
+        assert conn.get_transaction_status() == idle
+        limiter.record_failure("login_attempts", ip)
+        assert conn.get_transaction_status() == idle
+    blocked, remaining = limiter.check("login_attempts", ip)
+    assert blocked and 0 < remaining <= 60
+
+    # blocco scaduto: non più bloccato, il prossimo fallimento riparte da 1
+    cur = conn.cursor()
+    cur.execute("UPDATE login_attempts SET last_attempt = NOW() - INTERVAL '61 seconds' WHERE ip = %s", (ip,))
+    conn.commit()
+    assert limiter.check("login_attempts", ip) == (False, 0)
+    limiter.record_failure("login_attempts", ip)
+    cur.execute("SELECT tentativi_falliti FROM login_attempts WHERE ip = %s", (ip,))
+    assert cur.fetchone()[0] == 1
+
+    limiter.reset("login_attempts", ip)
+    cur.execute("SELECT tentativi_falliti, last_attempt FROM login_attempts WHERE ip = %s", (ip,))
+    assert cur.fetchone() == (0, None)
+    conn.commit()
+    limiter.reset("login_attempts", ip)
+    assert conn.get_transaction_status() == idle
+
+
+def test_postgres_failures_outside_the_window_restart(conn):
+    limiter = PostgresRateLimiter(max_attempts=3, block_seconds=60, get_conn=lambda: conn)
+    ip = "10.0.0.2"
+    cur = conn.cursor()
+    for _ in range(2):
+        limiter.record_failure("login_attempts", ip)
+    cur.execute("UPDATE login_attempts SET last_attempt = NOW() - INTERVAL '61 seconds' WHERE ip = %s", (ip,))
+    conn.commit()
+    limiter.record_failure("login_attempts", ip)
+    # i due fallimenti vecchi non contano più: il terzo non blocca
+    assert limiter.check("login_attempts", ip) == (False, 0)
+    cur.execute("SELECT tentativi_falliti FROM login_attempts WHERE ip = %s", (ip,))
+    assert cur.fetchone()[0] == 1
+    conn.rollback()
+
+
+def test_postgres_error_rolls_back(conn):
+    import psycopg2.extensions
+
+    class Broken(PostgresRateLimiter):
+        def _check_sql(self, scope):
+            return "SELECT 1/0"
+
+    limiter = Broken(max_attempts=3, block_seconds=60, get_conn=lambda: conn)
+    with pytest.raises(psycopg2.Error):
+        limiter.check("login_attempts", "10.0.0.3")
+    assert conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
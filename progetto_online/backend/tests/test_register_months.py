@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+from course_months import materialize_months
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_bodybuilding_months_one_row_per_month(flask_app, conn, cur, monkeypatch, lazy):
+    monkeypatch.setattr(flask_app, "LAZY_MONTHS", lazy)
+    year = 2027 if lazy else 2028
+    mesi = flask_app.months_between(f"Gennaio-{year}", f"Giugno-{year}")
+    dates = [flask_app.mese_date(m) for m in mesi]
+    uno = ("Reg", "Uno", f"reg-uno-{year}@example.com", "3001")
+    due = ("Reg", "Due", f"reg-due-{year}@example.com", "3002")
+
+    flask_app.insert_bodybuilding_months(cur, *uno, mesi=mesi)
+    # mesi già materializzati prima della seconda iscrizione: passano dal ramo SELECT/INSERT
+    materialize_months(cur, "BodyBuilding", dates[:3])
+    flask_app.insert_bodybuilding_months(cur, *due, mesi=mesi[2:])
+    # stessa persona di nuovo: nessuna riga in più
+    flask_app.insert_bodybuilding_months(cur, *uno, mesi=mesi)
+
+    materialize_months(cur, "BodyBuilding", dates)
+    for i, d in enumerate(dates):
+        cur.execute("""
+            SELECT row_index, email FROM corsi_data
+            WHERE corso = 'BodyBuilding' AND mese_data = %s ORDER BY row_index
+        """, (d,))
+        rows = cur.fetchall()
+        assert [r["row_index"] for r in rows] == list(range(len(rows))), mesi[i]
+        mine = [r["email"] for r in rows if r["email"].startswith("reg-")]
+        assert mine == [uno[2]] + ([due[2]] if i >= 2 else []), mesi[i]
+    conn.rollback()
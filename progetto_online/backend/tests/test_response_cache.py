@@ -0,0 +1,85 @@
+import pytest
+
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(max_entries=3, generation_dir=str(tmp_path))
+
+
+def fill(cache, key, payload=b"{}"):
+    return cache.put(key, payload, cache.generations(key))
+
+
+def test_hit_and_etag(cache):
+    key = ("course-data", "Yoga", "Gennaio-2026")
+    assert cache.get(key) is None
+    etag = fill(cache, key, b'{"rows":[]}')
+    assert etag == ResponseCache.make_etag(b'{"rows":[]}')
+    assert cache.get(key) == (etag, b'{"rows":[]}')
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+@pytest.mark.parametrize("scope, stale", [
+    (("Yoga", "Gennaio-2026"), {"yoga-gen"}),
+    (("Yoga", None), {"yoga-gen", "yoga-feb"}),
+    ((None, None), {"yoga-gen", "yoga-feb", "pilates-gen"}),
+])
+def test_invalidate_scopes(cache, scope, stale):
+    keys = {"yoga-gen": ("course-data", "Yoga", "Gennaio-2026"),
+            "yoga-feb": ("course-totals", "Yoga", "Febbraio-2026"),
+            "pilates-gen": ("course-data", "Pilates", "Gennaio-2026")}
+    for key in keys.values():
+        fill(cache, key)
+    cache.invalidate(*scope)
+    assert {name for name, key in keys.items() if cache.get(key) is None} == stale
+
+
+def test_other_process_invalidation_is_seen(cache, tmp_path):
+    # stessa directory delle generazioni = un altro worker
+    other = ResponseCache(generation_dir=str(tmp_path))
+    key = ("course-data", "Yoga", "Gennaio-2026")
+    fill(cache, key)
+    other.invalidate("Yoga", "Gennaio-2026")
+    assert cache.get(key) is None
+
+
+def test_write_during_computation_makes_entry_stale(cache):
+    key = ("course-data", "Yoga", "Gennaio-2026")
+    generations = cache.generations(key)   # letto prima della query
+    cache.invalidate("Yoga", "Gennaio-2026")   # scrittura concorrente
+    cache.put(key, b"{}", generations)
+    assert cache.get(key) is None
+
+
+def test_repeated_invalidations_always_bump(cache):
+    key = ("course-data", "Yoga", "Gennaio-2026")
+    seen = set()
+    for _ in range(5):
+        cache.invalidate("Yoga", "Gennaio-2026")
+        seen.add(cache.generations(key))
+    assert len(seen) == 5
+
+
+def test_lru_eviction(cache):
+    keys = [("course-data", "Yoga", f"m{i}") for i in range(4)]
+    for key in keys[:3]:
+        fill(cache, key)
+    cache.get(keys[0])
+    fill(cache, keys[3])
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[3]) is not None
+    assert cache.stats()["entries"] == 3
+
+
+def test_generation_etag_follows_invalidation(cache):
+    etag = cache.generation_etag("course-batch", ["Yoga", "Pilates"], ["Gennaio-2026"])
+    assert cache.generation_etag("course-batch", ["Yoga", "Pilates"], ["Gennaio-2026"]) == etag
+    cache.invalidate("Pilates", "Febbraio-2026")
+    assert cache.generation_etag("course-batch", ["Yoga", "Pilates"], ["Gennaio-2026"]) == etag
+    for scope in (("Pilates", "Gennaio-2026"), ("Yoga", None), (None, None)):
+        cache.invalidate(*scope)
+        changed = cache.generation_etag("course-batch", ["Yoga", "Pilates"], ["Gennaio-2026"])
+        assert changed != etag
+        etag = changed
@@ -0,0 +1,60 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("psycopg2")
+from conftest import connect
+from row_index import allocate_row_indexes, allocate_row_index_blocks, reset_row_counter
+
+
+def test_counter_starts_after_existing_rows(conn, cur):
+    corso = "RowIndexExisting"
+    cur.execute("""
+        INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+        VALUES (%s, 7, '2026-05-01', 'A', 'A', 'a@example.com', '1', '', '', 0, '')
+    """, (corso,))
+    assert allocate_row_indexes(cur, corso, "Maggio-2026") == 8
+    assert allocate_row_indexes(cur, corso, "Maggio-2026", 3) == 9
+    assert allocate_row_indexes(cur, corso, "Maggio-2026") == 12
+    # mese vuoto: si parte da 0
+    assert allocate_row_indexes(cur, corso, "Giugno-2026") == 0
+    reset_row_counter(cur, corso, "Maggio-2026", 2)
+    assert allocate_row_indexes(cur, corso, "Maggio-2026") == 2
+    conn.rollback()
+
+
+def test_blocks_per_month(conn, cur):
+    corso = "RowIndexBlocks"
+    assert allocate_row_index_blocks(cur, corso, {"Luglio-2026": 3, "Agosto-2026": 0, "Settembre-2026": 2}) == {
+        "Luglio-2026": 0, "Settembre-2026": 0}
+    assert allocate_row_index_blocks(cur, corso, {"Luglio-2026": 1}) == {"Luglio-2026": 3}
+    assert allocate_row_index_blocks(cur, corso, {}) == {}
+    conn.rollback()
+
+
+def test_concurrent_allocations_never_overlap(dsn, schema):
+    corso, mese = "RowIndexConcurrent", "Ottobre-2026"
+    workers, rounds = 8, 25
+    start = threading.Barrier(workers)
+
+    def worker(n):
+        conn = connect(dsn)
+        try:
+            cur = conn.cursor()
+            start.wait()
+            blocks = []
+            for i in range(rounds):
+                size = 1 + (n + i) % 3
+                blocks.append((allocate_row_indexes(cur, corso, mese, size), size))
+                conn.commit()
+            return blocks
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        blocks = [b for result in ex.map(worker, range(workers)) for b in result]
+
+    indexes = sorted(i for first, size in blocks for i in range(first, first + size))
+    # nessun indice assegnato due volte e nessun buco
+    assert indexes == list(range(len(indexes)))
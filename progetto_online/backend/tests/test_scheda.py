@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+CONTENT = b"%PDF-1.4 scheda " * 32
+
+
+@pytest.fixture
+def user_client(flask_app, conn, cur):
+    def make(pdf_name="Scheda Mario.pdf", stored="scheda-test.pdf", content=CONTENT):
+        if content is not None:
+            with open(os.path.join(flask_app.UPLOAD_FOLDER, stored), "wb") as f:
+                f.write(content)
+        cur.execute("""
+            INSERT INTO utenti (nome_cognome, email, password_hash, pdf_path, pdf_name)
+            VALUES ('Scheda', %s, '!', %s, %s) RETURNING id
+        """, (f"scheda-{os.urandom(4).hex()}@example.com", stored, pdf_name))
+        user_id = cur.fetchone()["id"]
+        conn.commit()
+        client = flask_app.app.test_client()
+        with client.session_transaction() as sess:
+            sess["user_id"] = user_id
+        return client
+    return make
+
+
+def test_scheda_download_and_conditional(user_client):
+    client = user_client()
+    res = client.get("/scheda")
+    assert res.status_code == 200 and res.data == CONTENT
+    assert res.headers["Content-Type"] == "application/pdf"
+    assert res.headers["Content-Disposition"] == 'attachment; filename="Scheda Mario.pdf"'
+    assert res.headers["Cache-Control"] == "private, no-cache"
+    etag, last_modified = res.headers["ETag"], res.headers["Last-Modified"]
+
+    res = client.get("/scheda", headers={"If-None-Match": etag})
+    assert res.status_code == 304 and res.data == b""
+    res = client.get("/scheda", headers={"If-Modified-Since": last_modified})
+    assert res.status_code == 304
+    res = client.get("/scheda", headers={"If-None-Match": '"altro"'})
+    assert res.status_code == 200
+
+
+def test_scheda_range(user_client):
+    client = user_client()
+    res = client.get("/scheda", headers={"Range": "bytes=0-7"})
+    assert res.status_code == 206 and res.data == CONTENT[:8]
+    assert res.headers["Content-Range"] == f"bytes 0-7/{len(CONTENT)}" and res.headers["Accept-Ranges"] == "bytes"
+    res = client.get("/scheda", headers={"Range": "bytes=-5"})
+    assert res.status_code == 206 and res.data == CONTENT[-5:]
+    res = client.get("/scheda", headers={"Range": f"bytes={len(CONTENT)}-"})
+    assert res.status_code == 416
+    # If-Range con un ETag vecchio: il file intero
+    res = client.get("/scheda", headers={"Range": "bytes=0-7", "If-Range": '"vecchio"'})
+    assert res.status_code == 200 and res.data == CONTENT
+
+
+@pytest.mark.parametrize("offload, header, expected", [
+    ("x-accel", "X-Accel-Redirect", "/protected-schede/scheda%20test.pdf"),
+    ("x-sendfile", "X-Sendfile", None),
+])
+def test_scheda_offload(flask_app, user_client, monkeypatch, offload, header, expected):
+    monkeypatch.setattr(flask_app, "SCHEDA_OFFLOAD", offload)
+    monkeypatch.setattr(flask_app, "SCHEDA_ACCEL_PREFIX", "/protected-schede")
+    client = user_client(pdf_name="Scheda è.pdf", stored="scheda test.pdf")
+    res = client.get("/scheda")
+    assert res.status_code == 200 and res.data == b""
+    expected = expected or os.path.abspath(os.path.join(flask_app.UPLOAD_FOLDER, "scheda test.pdf"))
+    assert res.headers[header] == expected
+    assert res.headers["Content-Type"] == "application/pdf"
+    assert res.headers["Content-Disposition"] == \
+        "attachment; filename=\"Scheda e.pdf\"; filename*=UTF-8''Scheda%20%C3%A8.pdf"
+    assert res.headers["Cache-Control"] == "private, no-cache"
+
+
+def test_scheda_without_file(flask_app, user_client):
+    assert flask_app.app.test_client().get("/scheda").status_code == 401
+    res = user_client(stored="mancante.pdf", content=None).get("/scheda")
+    assert res.get_json() == {"status": "error", "message": "File non trovato sul server"}
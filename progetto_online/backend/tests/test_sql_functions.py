@@ -0,0 +1,55 @@
+from decimal import Decimal
+
+import pytest
+
+
+def sql(cur, fn, value):
+    cur.execute(f"SELECT {fn}(%s) AS v", (value,))
+    return cur.fetchone()["v"]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("10", Decimal("10")),
+    ("10,50", Decimal("10.50")),
+    ("10.50", Decimal("10.50")),
+    ("1.234,56", Decimal("1234.56")),
+    ("€ 35", Decimal("35")),
+    ("35 €", Decimal("35")),
+    ("-5", Decimal("-5")),
+    ("", None),
+    (None, None),
+    ("gratis", None),
+    ("1.2.3", None),
+])
+def test_parse_importo(cur, text, expected):
+    assert sql(cur, "parse_importo", text) == expected
+
+
+def test_importo_num_follows_importo(conn, cur):
+    cur.execute("""
+        INSERT INTO corsi_data (corso,row_index,mese_data,nome,cognome,email,cell,tessera,datacert,pagato,importo)
+        VALUES ('ImportoTest', 0, '2026-01-01', 'A', 'A', 'a@example.com', '1', '', '', 1, '12,5')
+        RETURNING id, importo_num
+    """)
+    row = cur.fetchone()
+    assert row["importo_num"] == Decimal("12.50")
+    cur.execute("UPDATE corsi_data SET importo = 'boh' WHERE id = %s RETURNING importo_num", (row["id"],))
+    assert cur.fetchone()["importo_num"] is None
+    conn.rollback()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("01/09/2025", "2025-09-01"),
+    ("1-9-25", "2025-09-01"),
+    ("01.09.2025", "2025-09-01"),
+    (" 1 / 9 / 2025 ", "2025-09-01"),
+    ("2025-09-01", "2025-09-01"),
+    ("31/02/2025", None),
+    ("01/13/2025", None),
+    ("settembre", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_datacert(cur, text, expected):
+    value = sql(cur, "parse_datacert", text)
+    assert (value.isoformat() if value else None) == expected
@@ -0,0 +1,97 @@
+import io
+import os
+import time
+
+import pytest
+
+from storage import (store_upload, spool_upload, release_if_unreferenced, collect_garbage,
+                     UploadTooLarge, TMP_PREFIX)
+
+
+def age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_same_content_is_stored_once(tmp_path):
+    name, size = store_upload(io.BytesIO(b"%PDF uno"), str(tmp_path), 100, ".pdf")
+    assert name.endswith(".pdf") and size == 8
+    age(tmp_path / name, 7200)
+    again, _ = store_upload(io.BytesIO(b"%PDF uno"), str(tmp_path), 100, ".pdf")
+    assert again == name
+    # una sola copia, con l'mtime rinfrescato per il gc
+    assert os.listdir(tmp_path) == [name]
+    assert time.time() - os.path.getmtime(tmp_path / name) < 60
+    other, _ = store_upload(io.BytesIO(b"%PDF due"), str(tmp_path), 100, ".pdf")
+    assert other != name and sorted(os.listdir(tmp_path)) == sorted([name, other])
+
+
+def test_size_cap_leaves_nothing_behind(tmp_path):
+    with pytest.raises(UploadTooLarge):
+        store_upload(io.BytesIO(b"x" * 101), str(tmp_path), 100, ".pdf")
+    with pytest.raises(UploadTooLarge):
+        spool_upload(io.BytesIO(b"x" * 101), str(tmp_path), 100)
+    assert os.listdir(tmp_path) == []
+    path = spool_upload(io.BytesIO(b"x" * 100), str(tmp_path), 100)
+    assert os.path.basename(path).startswith(TMP_PREFIX) and os.path.getsize(path) == 100
+
+
+def test_release_counts_references(conn, cur, tmp_path):
+    name, _ = store_upload(io.BytesIO(b"%PDF condiviso"), str(tmp_path), 100, ".pdf")
+    cur.execute("""
+        INSERT INTO utenti (nome_cognome, email, password_hash, pdf_path)
+        VALUES ('Uno', 'gc-uno@example.com', '!', %s), ('Due', 'gc-due@example.com', '!', %s)
+    """, (name, name))
+    age(tmp_path / name, 120)
+    assert release_if_unreferenced(cur, str(tmp_path), name) is False
+    cur.execute("UPDATE utenti SET pdf_path = NULL WHERE email = 'gc-uno@example.com'")
+    assert release_if_unreferenced(cur, str(tmp_path), name) is False
+    cur.execute("UPDATE utenti SET pdf_path = NULL WHERE email = 'gc-due@example.com'")
+    # appena caricato (forse da un upload non ancora committato): resta
+    assert release_if_unreferenced(cur, str(tmp_path), name, min_age=3600) is False
+    assert release_if_unreferenced(cur, str(tmp_path), "../" + name) is False
+    assert release_if_unreferenced(cur, str(tmp_path), name) is True
+    assert os.listdir(tmp_path) == []
+    conn.rollback()
+
+
+def test_collect_garbage_age_guard_and_zip_jobs(conn, cur, tmp_path):
+    files = {}
+    for key, data in (("referenced", b"a"), ("old", b"b"), ("young", b"c")):
+        files[key], _ = store_upload(io.BytesIO(data), str(tmp_path), 100, ".pdf")
+    for key in ("spool", "queued_zip", "done_zip"):
+        files[key] = os.path.basename(spool_upload(io.BytesIO(key.encode()), str(tmp_path), 100))
+    for key in ("referenced", "old", "spool", "queued_zip", "done_zip"):
+        age(tmp_path / files[key], 7200)
+    cur.execute("INSERT INTO utenti (nome_cognome, email, password_hash, pdf_path) VALUES ('Gc', 'gc@example.com', '!', %s)",
+                (files["referenced"],))
+    cur.execute("""
+        INSERT INTO upload_jobs (id, state, spool_name)
+        VALUES ('gc-queued', 'queued', %s), ('gc-done', 'done', %s)
+    """, (files["queued_zip"], files["done_zip"]))
+
+    expected = sorted(files[k] for k in ("old", "spool", "done_zip"))
+    assert sorted(collect_garbage(cur, str(tmp_path), min_age=3600, dry_run=True)) == expected
+    assert len(os.listdir(tmp_path)) == 6
+    assert sorted(collect_garbage(cur, str(tmp_path), min_age=3600)) == expected
+    assert sorted(os.listdir(tmp_path)) == sorted(files[k] for k in ("referenced", "young", "queued_zip"))
+    conn.rollback()
+
+
+def test_upload_to_missing_user_stores_nothing(flask_app, admin_client, conn, cur):
+    folder = flask_app.UPLOAD_FOLDER
+    before = set(os.listdir(folder))
+    res = admin_client.post("/admin/upload/999999", data={"file": (io.BytesIO(b"%PDF orfano"), "x.pdf")},
+                            content_type="multipart/form-data")
+    assert res.status_code == 404
+    assert set(os.listdir(folder)) == before
+
+    cur.execute("INSERT INTO utenti (nome_cognome, email, password_hash) VALUES ('Up', 'up@example.com', '!') RETURNING id")
+    user_id = cur.fetchone()["id"]
+    conn.commit()
+    res = admin_client.post(f"/admin/upload/{user_id}", data={"file": (io.BytesIO(b"%PDF mio"), "mia scheda.pdf")},
+                            content_type="multipart/form-data")
+    assert res.status_code == 200 and res.get_json()["email"] == "up@example.com"
+    cur.execute("SELECT pdf_path, pdf_name FROM utenti WHERE id = %s", (user_id,))
+    row = cur.fetchone()
+    assert row["pdf_name"] == "mia_scheda.pdf" and row["pdf_path"] in set(os.listdir(folder)) - before
@@ -73,6 +73,11 @@ adminLogoutBtn.addEventListener("click", async () => {
 // ========================
 // TABLE HTML & DATA
 // ========================
+// id e versione della riga sul server, per le modifiche puntuali (PATCH)
+function rowSyncAttrs(r) {
+    return r.row_id ? `data-rowid="${r.row_id}" data-version="${r.version}"` : "";
+}
+
 function buildTableHtml(rows) {
     if (!rows || !rows.length) rows = [emptyRow()];
     let html = `<table border="1" style="width:100%; border-collapse: collapse;">
@@ -85,7 +90,7 @@ function buildTableHtml(rows) {
         </thead>
         <tbody>`;
     rows.forEach((r, idx) => {
-        html += `<tr data-index="${idx}">
+        html += `<tr data-index="${idx}" ${rowSyncAttrs(r)}>
             <td contenteditable="true" data-field="nome">${escapeHtml(r.nome)}</td>
             <td contenteditable="true" data-field="cognome">${escapeHtml(r.cognome)}</td>
             <td contenteditable="true" data-field="email">${escapeHtml(r.email || "")}</td>
@@ -118,7 +123,7 @@ function buildBodyBuildingTableHtml(rows) {
         <tbody>`;
     rows.forEach((r, idx) => {
         const userId = r.id || "";  
-        html += `<tr data-index="${idx}" data-userid="${userId}">
+        html += `<tr data-index="${idx}" data-userid="${userId}" ${rowSyncAttrs(r)}>
             <td contenteditable="true" data-field="nome">${escapeHtml(r.nome)}</td>
             <td contenteditable="true" data-field="cognome">${escapeHtml(r.cognome)}</td>
             <td contenteditable="true" data-field="email">${escapeHtml(r.email || "")}</td>
@@ -155,7 +160,9 @@ function collectTableData(container, isBodyBuilding=false) {
             tessera: cells[4].textContent.trim(),
             datacert: cells[5].textContent.trim(),
             pagato: !!(pagatoInput && pagatoInput.checked),
-            importo: cells[7].textContent.trim()
+            importo: cells[7].textContent.trim(),
+            row_id: tr.dataset.rowid ? Number(tr.dataset.rowid) : null,
+            version: tr.dataset.version ? Number(tr.dataset.version) : null
         });
     });
     return result;
@@ -267,26 +274,9 @@ async function attachDelegatedListeners(corso, container, isBodyBuilding=false)
     const newContainer = container.cloneNode(true);
     container.parentNode.replaceChild(newContainer, container);
     addPaymentReminderButton(newContainer);
-    addTotalMonthButton(newContainer);
+    addTotalMonthButton(newContainer, corso);
     addInstructorTotalControls(newContainer, corso);
 
-    const totalMonthSpan = newContainer.querySelector(".totalMonthValue");
-
-    function updateTotalMonth() {
-        const tbody = newContainer.querySelector("tbody");
-        if (!tbody) return;
-        let total = 0;
-        tbody.querySelectorAll("tr").forEach(tr => {
-            const pagato = tr.querySelector("input[type='checkbox']");
-            const impCell = tr.querySelector("td[data-field='importo']");
-            if(pagato && pagato.checked && impCell){
-                const v = parseFloat(impCell.textContent.trim().replace(",", "."));
-                if(!isNaN(v)) total += v;
-            }
-        });
-        if(totalMonthSpan) totalMonthSpan.textContent = total.toFixed(2) + " €";
-    }
-
     newContainer.addEventListener("click", async (ev) => {
         const target = ev.target;
         const tbody = newContainer.querySelector("tbody");
@@ -324,7 +314,6 @@ async function attachDelegatedListeners(corso, container, isBodyBuilding=false)
             }
             tbody.appendChild(newRow);
             saveTempForCorso(corso, newContainer, isBodyBuilding);
-            updateTotalMonth();
             return;
         }
 
@@ -340,7 +329,6 @@ async function attachDelegatedListeners(corso, container, isBodyBuilding=false)
             // ricalcola row_index di tutte le righe
             tbody.querySelectorAll("tr").forEach((tr, i) => tr.dataset.rowindex = i);
             saveTempForCorso(corso, newContainer, isBodyBuilding);
-            updateTotalMonth();
             return;
         }
 
@@ -445,7 +433,8 @@ async function attachDelegatedListeners(corso, container, isBodyBuilding=false)
                 if(res.ok && data.status==="ok"){
                     alert("Dati salvati con successo!");
                     sessionStorage.removeItem(`temp_course_${corso}_${currentMonth}`);
-                    updateTotalMonth();
+                    // il salvataggio completo riscrive le righe: ricarica id e versioni
+                    openCourse(corso);
                 } else {
                     alert("Errore salvataggio dati: " + (data.message || "unknown"));
                 }
@@ -458,14 +447,55 @@ async function attachDelegatedListeners(corso, container, isBodyBuilding=false)
 
     newContainer.addEventListener("input", () => {
         saveTempForCorso(corso, newContainer, isBodyBuilding);
-        updateTotalMonth();
     });
-    newContainer.addEventListener("change", () => {
+    newContainer.addEventListener("change", async (ev) => {
         saveTempForCorso(corso, newContainer, isBodyBuilding);
-        updateTotalMonth();
+        if(ev.target.matches("input[data-field='pagato']")) {
+            await patchPagato(corso, ev.target.closest("tr"), ev.target.checked);
+            // il totale cassa lo ricalcola il database sul pagamento appena salvato
+            loadTotalMonth(newContainer, corso);
+        }
     });
 }
 
+// --- Salvataggio puntuale del pagamento (solo la riga modificata) ---
+async function patchPagato(corso, tr, pagato) {
+    if(!tr || !tr.dataset.rowid) return;   // riga nuova: si salva con "Salva"
+    const importoCell = tr.querySelector("td[data-field='importo']");
+    try {
+        const res = await fetch(`${baseURL}/admin/course-data/${encodeURIComponent(corso)}`, {
+            method: "PATCH",
+            headers: { "Content-Type": "application/json" },
+            credentials: "include",
+            body: JSON.stringify({
+                mese: currentMonth,
+                update: [{
+                    row_id: Number(tr.dataset.rowid),
+                    version: Number(tr.dataset.version),
+                    pagato,
+                    importo: importoCell ? importoCell.textContent.trim() : ""
+                }]
+            })
+        });
+        const data = await res.json();
+        if(res.status === 409){
+            alert("La riga è stata modificata da un altro utente: i dati vengono ricaricati.");
+            sessionStorage.removeItem(`temp_course_${corso}_${currentMonth}`);
+            openCourse(corso);
+            return;
+        }
+        if(!res.ok || data.status !== "ok"){
+            alert("Errore salvataggio pagamento: " + (data.message || "unknown"));
+            return;
+        }
+        const row = (data.rows || []).find(r => String(r.row_id) === tr.dataset.rowid);
+        if(row) tr.dataset.version = row.version;
+    } catch(err){
+        console.error(err);
+        alert("Errore salvataggio pagamento");
+    }
+}
+
 // --- Bottone promemoria pagamenti ---
 function addPaymentReminderButton(container) {
     if (container.querySelector(".paymentReminderBtn")) return;
@@ -506,15 +536,8 @@ function addPaymentReminderButton(container) {
             const data = await res.json();
 
             if (res.ok && data.status === "ok") {
-                alert(`Mail pronte per l'invio: ${data.sent.length}`);
-                
-                // 🔹 Apre la mail sul dispositivo per ciascun destinatario
-                data.sent.forEach((email, index) => {
-                    setTimeout(() => {
-                        openMailClient(email, data.subject, data.body);
-                    }, index * 1500); // pausa di 1.5s per evitare blocchi multipli
-                });
-
+                // 🔹 le mail le invia il server in background
+                alert(`Promemoria in coda di invio: ${data.queued}`);
             } else {
                 alert(`Errore durante la preparazione delle mail: ${data.message || "unknown"}`);
             }
@@ -553,6 +576,21 @@ async function addTotalMonthButton(container, corso) {
     container.appendChild(wrapper);
 
     // Carica il totale dal backend (ma non lo mostra subito)
+    await loadTotalMonth(container, corso);
+
+    // Al click mostra il totale aggiornato dal backend
+    btn.addEventListener("click", async () => {
+        // 🔹 Mostra lo span quando clicchi
+        totalSpan.style.display = "inline";
+        await loadTotalMonth(container, corso);
+    });
+}
+
+// total_cassa è mantenuto dal database sui pagamenti salvati (migrazione 7):
+// la pagina mostra quello, non una somma calcolata sulle celle della tabella
+async function loadTotalMonth(container, corso) {
+    const totalSpan = container.querySelector(".totalMonthValue");
+    if (!totalSpan) return;
     try {
         const res = await fetch(`${baseURL}/admin/course-totals/${encodeURIComponent(corso)}?mese=${encodeURIComponent(currentMonth)}`, {
             credentials: "include"
@@ -565,42 +603,6 @@ async function addTotalMonthButton(container, corso) {
     } catch (err) {
         console.warn("Errore caricamento totale mese:", err);
     }
-
-    // Calcola e salva al click
-    btn.addEventListener("click", async () => {
-        // 🔹 Mostra lo span quando clicchi
-        totalSpan.style.display = "inline";
-
-        const tbody = container.querySelector("tbody");
-        if (!tbody) return;
-
-        let total = 0;
-        tbody.querySelectorAll("tr").forEach(tr => {
-            const pagato = tr.querySelector("input[type='checkbox']");
-            const importoCell = tr.querySelector("td[data-field='importo']");
-            if (pagato && pagato.checked && importoCell) {
-                const value = parseFloat(importoCell.textContent.trim().replace(",", "."));
-                if (!isNaN(value)) total += value;
-            }
-        });
-
-        totalSpan.textContent = total.toFixed(2) + " €";
-
-        // salva subito totale mese sul backend
-        try {
-            await fetch(`${baseURL}/admin/course-totals/${encodeURIComponent(corso)}`, {
-                method: "POST",
-                headers: { "Content-Type": "application/json" },
-                credentials: "include",
-                body: JSON.stringify({
-                    mese: currentMonth,
-                    total_cassa: total
-                })
-            });
-        } catch (err) {
-            console.warn("Errore salvataggio totale mese:", err);
-        }
-    });
 }
 
 // ========================
@@ -697,6 +699,66 @@ async function addInstructorTotalControls(container, corso) {
     });
 }
 
+// ========================
+// UPLOAD ZIP SCHEDE
+// ========================
+const bulkUploadBtn = document.getElementById("bulkUploadBtn");
+const bulkUploadMessage = document.getElementById("bulkUploadMessage");
+
+function pollUploadJob(jobId) {
+    const timer = setInterval(async () => {
+        try {
+            const res = await fetch(`${baseURL}/admin/upload-jobs/${encodeURIComponent(jobId)}`, { credentials: "include" });
+            const data = await res.json();
+            if (!res.ok || data.status !== "ok") {
+                clearInterval(timer);
+                bulkUploadMessage.textContent = data.message || "Errore stato caricamento";
+                return;
+            }
+            const job = data.job;
+            bulkUploadMessage.textContent = `Elaborati ${job.processed || 0} / ${job.total || 0}`;
+            if (job.state === "done" || job.state === "failed") {
+                clearInterval(timer);
+                const errors = job.errors || [];
+                bulkUploadMessage.textContent = job.state === "done"
+                    ? `Caricamento completato: ${job.updated} schede aggiornate, ${errors.length} errori`
+                    : "Caricamento fallito";
+                if (errors.length) console.warn("Errori caricamento ZIP:", errors);
+            }
+        } catch (err) {
+            console.warn("Errore polling caricamento:", err);
+        }
+    }, 1000);
+}
+
+bulkUploadBtn.addEventListener("click", async () => {
+    const zipInput = document.getElementById("bulkZipInput");
+    const manifestInput = document.getElementById("bulkManifestInput");
+    if (!zipInput.files.length) {
+        alert("Seleziona un file ZIP");
+        return;
+    }
+    const formData = new FormData();
+    formData.append("file", zipInput.files[0]);
+    if (manifestInput.files.length) formData.append("manifest", manifestInput.files[0]);
+
+    try {
+        const res = await fetch(`${baseURL}/admin/upload-zip`, { method: "POST", body: formData, credentials: "include" });
+        const data = await res.json();
+        if (res.ok && data.status === "ok") {
+            bulkUploadMessage.textContent = "Caricamento avviato...";
+            zipInput.value = "";
+            manifestInput.value = "";
+            pollUploadJob(data.job_id);
+        } else {
+            alert("Errore caricamento ZIP: " + (data.message || "unknown"));
+        }
+    } catch (err) {
+        console.error(err);
+        alert("Errore caricamento ZIP");
+    }
+});
+
 // ========================
 // TORNA ALLA LISTA CORSI
 // ========================
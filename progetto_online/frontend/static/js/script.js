@@ -199,6 +199,50 @@ document.getElementById("registerForm").addEventListener("submit", async (e) =>
     }
 });
 
+// ========================
+// ATTIVAZIONE ACCOUNT (link dell'invito inviato dall'admin)
+// ========================
+const claimToken = new URLSearchParams(window.location.search).get("claim");
+
+document.getElementById("claimForm").addEventListener("submit", async (e) => {
+    e.preventDefault();
+
+    const password = document.getElementById("claimPassword").value;
+    const claimMessage = document.getElementById("claimMessage");
+
+    const pwdRegex = /^(?=.*[a-z])(?=.*[A-Z])(?=.*\d).{8,}$/;
+    if (!pwdRegex.test(password)) {
+        claimMessage.style.color = "red";
+        claimMessage.textContent = "La password deve avere almeno 8 caratteri, una maiuscola, una minuscola e un numero.";
+        return;
+    }
+
+    try {
+        const res = await fetch(`${baseURL}/claim-account`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ token: claimToken, password })
+        });
+        const data = await res.json();
+
+        if (!res.ok) {
+            claimMessage.style.color = "red";
+            claimMessage.textContent = data.message;
+        } else {
+            // il link non serve più: si passa al login
+            window.history.replaceState(null, "", window.location.pathname);
+            document.getElementById("claimSection").style.display = "none";
+            loginSection.style.display = "block";
+            loginMessage.style.color = "green";
+            loginMessage.textContent = data.message;
+        }
+    } catch (err) {
+        claimMessage.style.color = "red";
+        claimMessage.textContent = "Errore di connessione!";
+        console.error(err);
+    }
+});
+
 // ========================
 // LOGIN
 // ========================
@@ -343,6 +387,11 @@ logoutBtn.addEventListener("click", async () => {
 // CONTROLLO SESSIONE AL CARICAMENTO PAGINA
 // ========================
 window.addEventListener("load", async () => {
+    if (claimToken) {
+        homeContainer.style.display = "none";
+        document.getElementById("claimSection").style.display = "block";
+        return;
+    }
     try {
         const res = await fetch(`${baseURL}/me`, {method: "GET", credentials: "include"});
         const data = await res.json();